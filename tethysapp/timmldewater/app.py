@@ -29,6 +29,21 @@ class ConstructionDewateringTool(TethysAppBase):
                     UrlMap(name='get_generate_water_table_ajax',
                            url='timmldewater/generate-water-table',
                            controller='timmldewater.controllers.generate_water_table'),
+                    UrlMap(name='submit_water_table_job',
+                           url='timmldewater/submit-water-table-job',
+                           controller='timmldewater.controllers.submit_water_table_job'),
+                    UrlMap(name='water_table_job_status',
+                           url='timmldewater/water-table-job-status',
+                           controller='timmldewater.controllers.water_table_job_status'),
+                    UrlMap(name='optimize_pumping',
+                           url='timmldewater/optimize-pumping',
+                           controller='timmldewater.controllers.optimize_pumping'),
+                    UrlMap(name='check_excavation',
+                           url='timmldewater/check-excavation',
+                           controller='timmldewater.controllers.check_excavation'),
+                    UrlMap(name='design_wells',
+                           url='timmldewater/design-wells',
+                           controller='timmldewater.controllers.design_wells'),
         )
 
         return url_maps
\ No newline at end of file
@@ -1,14 +1,149 @@
 import sys
 import os
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+import base64
 import json
 import numpy as np
 import math
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 
 from tethys_sdk.gizmos import *
 
+from . import engine
+from . import excavation
+from .jobs import JobManager, JobQueueFull
+
+
+class SolvedModelCache(object):
+    """
+    Bounded LRU cache of solved TimML models, keyed by a hash of the scenario inputs.
+    Entries older than ttl seconds are evicted on lookup.
+    """
+
+    def __init__(self, maxsize=32, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._models.pop(key, None)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            # Re-insert so the entry becomes the most recently used one
+            self._models[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, ml):
+        with self._lock:
+            self._models.pop(key, None)
+            self._models[key] = (time.time(), ml)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self._models),
+                    'maxsize': self.maxsize,
+                    'ttl': self.ttl}
+
+
+# Solved models are shared by all requests handled by this worker
+model_cache = SolvedModelCache(maxsize=getattr(settings, 'TIMMLDEWATER_MODEL_CACHE_SIZE', 32),
+                               ttl=getattr(settings, 'TIMMLDEWATER_MODEL_CACHE_TTL', 600))
+
+
+# Grids of the wells of the maps that were computed last, keyed by a hash of the map and the aquifer, so that
+# moving a well only computes the wells that moved on the grid again, and changing the flow of wells that didn't
+# move is a matrix-vector product (see cached_head_grid). Every entry is a dictionary with the model, its
+# GridCache and UnitResponse (None until the wells of the map change), the well coordinates and discharges of the
+# last request and a lock; an entry is only changed while holding its lock
+grid_cache = SolvedModelCache(maxsize=getattr(settings, 'TIMMLDEWATER_GRID_CACHE_SIZE', 4),
+                              ttl=getattr(settings, 'TIMMLDEWATER_GRID_CACHE_TTL', 600))
+
+
+# Background water table jobs run in a small pool of threads so the web workers stay responsive
+job_manager = JobManager(workers=getattr(settings, 'TIMMLDEWATER_JOB_WORKERS', 2),
+                         maxqueued=getattr(settings, 'TIMMLDEWATER_JOB_QUEUE_SIZE', 16))
+
+# Number of progress updates while a job evaluates the grid
+GRID_PROGRESS_STEPS = 20
+
+# Candidate rings of wells of design_wells, as fractions of the longest side of the bounding box of the excavation
+DESIGN_OFFSETS = (0.05, 0.1, 0.2, 0.35, 0.5)
+DESIGN_SPACINGS = (0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0)
+
+# Positions of the first well of a ring along the ring, as fractions of the spacing
+DESIGN_PHASES = (0.0, 0.5)
+
+# Number of processes that evaluate the grid of heads; the model is sent to every process once per grid
+GRID_WORKERS = getattr(settings, 'TIMMLDEWATER_GRID_WORKERS', 1)
+
+# Adaptive grids (adaptive=true) start from cells of ADAPTIVE_COARSENING times the cell size of the map, which are
+# divided in four up to ADAPTIVE_LEVELS times while the water table at their corners differs more than
+# ADAPTIVE_TOLERANCE [ft], or while they contain a well
+ADAPTIVE_COARSENING = 8
+ADAPTIVE_LEVELS = 4
+ADAPTIVE_TOLERANCE = getattr(settings, 'TIMMLDEWATER_ADAPTIVE_TOLERANCE', 2.0)
+
+# Heads up to DEWATERED_TOLERANCE above dwte count as dewatered in check_excavation, as the discharges of
+# optimize_pumping and design_wells put the water table at the worst control point on dwte [ft]
+DEWATERED_TOLERANCE = 1e-6
+
+# Number of equally spaced contour levels of format=contours without dwte or levels
+CONTOUR_LEVELS = 10
+
+# Drawdown below which cells outside the region of influence of the wells get the initial water table [ft]
+DRAWDOWN_TOLERANCE = getattr(settings, 'TIMMLDEWATER_DRAWDOWN_TOLERANCE', engine.DRAWDOWN_TOLERANCE)
+
+# The evaluated cells are rounded outward to blocks of CLIP_BLOCK by CLIP_BLOCK cells, so that they (and their grid
+# cache) stay the same while the region of influence changes a little with the flow
+CLIP_BLOCK = 16
+
+
+def scenario_key(k, bedrock, initial, q, wXCoords, wYCoords, rates=None):
+    """
+    Canonical hash of the inputs that define a solved model. The map extent and cell size are not part of it.
+    """
+    scenario = [float(k), float(bedrock), float(initial), float(q),
+                [[float(x), float(y)] for x, y in zip(wXCoords, wYCoords)]]
+    if rates is not None:
+        scenario.append([float(r) for r in rates])
+    return hashlib.sha1(json.dumps(scenario, separators=(',', ':'))).hexdigest()
+
+
+def grid_key(scenario, nwells, clip=None):
+    """
+    Canonical hash of the inputs that define the grid of a map and the aquifer, but not the wells or their flow.
+    clip are the slices of the evaluated cells along x and y (see clip_cells), None for the whole grid.
+    """
+    grid = [float(scenario['k']), float(scenario['bedrock']), float(scenario['initial']), int(nwells),
+            [float(v) for v in scenario['xIndex']], [float(v) for v in scenario['yIndex']], float(scenario['cellSide'])]
+    if clip is not None:
+        grid.append([[s.start, s.stop] for s in clip])
+    return hashlib.sha1(json.dumps(grid, separators=(',', ':'))).hexdigest()
+
 
 @login_required()
 
@@ -82,12 +217,42 @@ def home(request):
                   prepend='Elev. =',
                   append='[ft]',
                   )
+    maxRate = TextInput(display_text='Maximum Flow per Well',
+                  name='maxRate',
+                  initial='0.5',
+                  placeholder='e.g. 0.5',
+                  prepend='Q =',
+                  append='[cfs]',
+                  )
+
+    # The uniform grid of cells is the default, the adaptive grid (see adaptive_water_table) is an option
+    adaptive = ToggleSwitch(display_text='Adaptive Grid',
+                            name='adaptive',
+                            on_label='Yes',
+                            off_label='No',
+                            initial=False,
+                            size='small')
 
     execute = Button(display_text='Calculate Water Table Elevations',
                      attributes='onclick=app.dewater();',
                      submit=True,
                      classes='btn-success')
 
+    optimize = Button(display_text='Optimize Pumping Rates',
+                      attributes='onclick=app.optimizePumping();',
+                      submit=True,
+                      classes='btn-default')
+
+    check = Button(display_text='Check Excavation',
+                   attributes='onclick=app.checkExcavation();',
+                   submit=True,
+                   classes='btn-default')
+
+    design = Button(display_text='Design Wells',
+                    attributes='onclick=app.designWells();',
+                    submit=True,
+                    classes='btn-default')
+
     instructions = Button(display_text='Instructions',
                      attributes='onclick=generate_water_table',
                      submit=True)
@@ -98,117 +263,458 @@ def home(request):
                 'iwte':iwte,
                 'q':q,
                 'dwte':dwte,
+                'maxRate':maxRate,
+                'adaptive':adaptive,
                 'execute':execute,
+                'optimize':optimize,
+                'check':check,
+                'design':design,
                 'instructions':instructions}
 
     return render(request, 'timmldewater/home.html', context)
 
 
 def generate_water_table(request):
+    """
+    Solves the model of the wells and returns the water table elevations of the cells in the map extent
+    """
+    get_data = request.GET
 
-    #set module paths for timml repository
-    sys.path.append("/home/jacobbf1/tethysdev/tethysapp-timmldewater/tethysapp/timmldewater/timml")
-    sys.path.append("/usr/local/lib/python2.7/dist-packages")
-    sys.path.append("/usr/lib/python2.7/dist-packages")
+    scenario = parse_scenario(get_data)
+    ml = solve_scenario(scenario)
 
-    # print os.getcwd()
-    # print sys.path
+    if scenario['adaptive']:
+        result = adaptive_water_table(ml, scenario, get_data)
+    else:
+        xCells, yCells, heads = water_table_grid(ml, scenario)
+        result = water_table_result(xCells, yCells, heads, scenario, get_data)
 
-    from timml import *
-    # import matplotlib.pyplot
-    # matplotlib.use('PS')
-    # import matplotlib.pyplot
-    # matplotlib.pyplot.ioff()
-    # matplotlib.pyplot.close("all")
+    return json_response(request, result, compress=get_data.get('gzip', 'false') in ('true', '1'))
 
-    import Tkinter as tk
-    root = tk.Tk()
 
+def optimize_pumping(request):
+    """
+    Computes the discharges of the wells that keep the water table at the control points of the excavation polygon
+    at or below the desired elevation dwte, with the smallest total discharge (objective 'total', the default) or the
+    smallest largest discharge of a well (objective 'max'), and returns them with the water table for those discharges
+    """
+    get_data = request.GET
 
+    scenario = parse_scenario(get_data)
+    pXCoords = json.loads(get_data['pXCoords'])
+    pYCoords = json.loads(get_data['pYCoords'])
+    dwte = float(json.loads(get_data['dwte']))
+    objective = get_data.get('objective', 'total')
+
+    if objective not in engine.OBJECTIVES:
+        return JsonResponse({"error": "Unknown objective: " + objective}, status=400)
+
+    # A model of its own, as the optimization solves it once for every well
+    ml = engine.solve(scenario['k'], scenario['bedrock'], scenario['initial'], scenario['q'],
+                      scenario['wXCoords'], scenario['wYCoords'])
+    xControl, yControl = excavation.control_points(pXCoords, pYCoords)
+    rates, message = engine.optimize_rates(ml, xControl, yControl, dwte, objective)
+
+    if rates is None:
+        return JsonResponse({"error": "No pumping rates keep the water table below the desired elevation: " + message},
+                            status=422)
+
+    # The optimization restores the discharges of ml, so the region of influence of the grid needs the model of
+    # the optimized discharges
+    scenario['rates'] = rates
+    scenario['q'] = sum(rates)
+    ml = solve_scenario(scenario)
+    xCells, yCells, heads = water_table_grid(ml, scenario)
+    result = water_table_result(xCells, yCells, heads, scenario, get_data)
+    result.update({'rates': rates,
+                   'q': scenario['q'],
+                   'objective': objective,
+                   'controlPoints': len(xControl)})
+
+    return json_response(request, result, compress=get_data.get('gzip', 'false') in ('true', '1'))
+
+
+def check_excavation(request):
+    """
+    Evaluates the water table only at the control points of the excavation polygon (its vertices, points along its
+    sides and an interior lattice, see excavation.control_points), without a grid over the map extent, and returns
+    the lowest and highest head, the point with the highest head and whether the excavation is dewatered: all heads
+    at or below dwte, within DEWATERED_TOLERANCE. The optional points is the number of control points along the longest side.
+    """
     get_data = request.GET
 
-    xIndex = json.loads(get_data['xIndex'])
-    yIndex = json.loads(get_data['yIndex'])
-    wXCoords = json.loads(get_data['wXCoords'])
-    wYCoords = json.loads(get_data['wYCoords'])
-    cellSide = json.loads(get_data['cellSide'])
-    initial = float(json.loads(get_data['initial']))
-    bedrock = float(json.loads(get_data['bedrock']))
-    q = float(json.loads(get_data['q']))
-    k = float(json.loads(get_data['k']))
+    scenario = parse_model(get_data)
+    pXCoords = json.loads(get_data['pXCoords'])
+    pYCoords = json.loads(get_data['pYCoords'])
+    dwte = float(json.loads(get_data['dwte']))
+    points = int(json.loads(get_data['points'])) if get_data.get('points') else excavation.CONTROL_POINTS_PER_SIDE
 
-    waterTable = []
+    if points < 1:
+        return JsonResponse({"error": "points must be at least 1"}, status=400)
 
-    #This is the analytic element model test, retrieving heads for now
-    ml = Model(k = [k], zb = [bedrock], zt = [initial])
-    Constant(ml,wXCoords[0]+500,wYCoords[0]+500,initial,[0])
+    if len(scenario['wXCoords']) == 0:
+        return JsonResponse({"error": "The excavation can only be checked with at least one well"}, status=400)
 
-    # print (xIndex[0]+500)
-    # print (yIndex[0]+500)
+    ml = solve_scenario(scenario)
+    xControl, yControl = excavation.control_points(pXCoords, pYCoords, points)
+    heads = engine.point_heads(ml, xControl, yControl)
+    worst = int(np.argmax(heads))
 
-    # Add the wells to the analytic element model
+    return JsonResponse({'minHead': float(heads.min()),
+                         'maxHead': float(heads[worst]),
+                         'worstPoint': [float(xControl[worst]), float(yControl[worst])],
+                         'dwte': dwte,
+                         'margin': dwte - float(heads[worst]),
+                         'dewatered': bool(heads[worst] <= dwte + DEWATERED_TOLERANCE),
+                         'controlPoints': len(xControl)})
 
-    pumpRate = (q / len(wYCoords))
-    print pumpRate
 
-    i = 0
-    while (i < len(wYCoords)):
-        Well(ml,wXCoords[i],wYCoords[i],pumpRate,10,0)
-        # print wXCoords[i]
-        # print wYCoords[i]
-        i = i + 1
-        # print len(wYCoords)
-
-    #
-    ml.solve(doIterations=True)
-
-    # contourList = timcontour(ml, 0, 20000, 50, 0, 20000, 50, 3, 20, newfig = True, returncontours = True)
-    # matplotlib.pyplot.clf()
-    # matplotlib.pyplot.cla()
-    # matplotlib.pyplot.close("all")
-
-    root.destroy()
-
-    print "TimML generated heads"
-
-    print ml.head(0,wXCoords[0]-cellSide,wYCoords[0]+cellSide)
-    print ml.head(0,wXCoords[0],wYCoords[0]+cellSide)
-    print ml.head(0,wXCoords[0]+cellSide,wYCoords[0]+cellSide)
-    print ml.head(0,wXCoords[0]-cellSide,wYCoords[0])
-    print ml.head(0,wXCoords[0],wYCoords[0])
-    print ml.head(0,wXCoords[0]+cellSide,wYCoords[0])
-    print ml.head(0,wXCoords[0]-cellSide,wYCoords[0]-cellSide)
-    print ml.head(0,wXCoords[0],wYCoords[0]-cellSide)
-    print ml.head(0,wXCoords[0]+cellSide,wYCoords[0]-cellSide)
-
-    print " "
-
-    print "EQN generated heads"
-
-    print elevationCalc(wXCoords[0]-cellSide,wYCoords[0]+cellSide,wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0],wYCoords[0]+cellSide,wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0]+cellSide,wYCoords[0]+cellSide,wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0]-cellSide,wYCoords[0],wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0],wYCoords[0],wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0]+cellSide,wYCoords[0],wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0]-cellSide,wYCoords[0]-cellSide,wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0],wYCoords[0]-cellSide,wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-    print elevationCalc(wXCoords[0]+cellSide,wYCoords[0]-cellSide,wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
-
-    # try:
-    #     count = 0
-    #     while (count<100):
-    #         print contourList.collections[count].get_paths()
-    #         print count
-    #         count = count + 1
-    # except:
-    #     pass
+def design_wells(request):
+    """
+    Places the wells on one of the candidate rings around the excavation polygon, at the offsets and spacings of the
+    request (JSON lists in map units, by default fractions of the size of the excavation, see DESIGN_OFFSETS), that
+    keeps the water table at the control points at or below dwte with at most maxRate per well: the ring with the
+    fewest wells (objective 'wells', the default) or the smallest total discharge (objective 'total'). Returns the
+    wells, their discharge and the water table. The wells of the request, if any, are ignored.
+    """
+    get_data = request.GET
+
+    scenario = parse_scenario(get_data)
+    pXCoords = json.loads(get_data['pXCoords'])
+    pYCoords = json.loads(get_data['pYCoords'])
+    dwte = float(json.loads(get_data['dwte']))
+    maxRate = float(json.loads(get_data['maxRate'])) if get_data.get('maxRate') else None
+    objective = get_data.get('objective', 'wells')
+
+    if objective not in engine.DESIGN_OBJECTIVES:
+        return JsonResponse({"error": "Unknown objective: " + objective}, status=400)
+
+    px, py = excavation.polygon(pXCoords, pYCoords)
+    size = max(px.max() - px.min(), py.max() - py.min())
+    offsets = json.loads(get_data['offsets']) if get_data.get('offsets') else [size * f for f in DESIGN_OFFSETS]
+    spacings = json.loads(get_data['spacings']) if get_data.get('spacings') else [size * f for f in DESIGN_SPACINGS]
+    phases = json.loads(get_data['phases']) if get_data.get('phases') else DESIGN_PHASES
+
+    if min(spacings) <= 0 or min(offsets) < 0:
+        return JsonResponse({"error": "The spacings must be positive and the offsets may not be negative"}, status=400)
+
+    layouts = excavation.rings(pXCoords, pYCoords, offsets, spacings, phases)
+    xControl, yControl = excavation.control_points(pXCoords, pYCoords)
+    rates, order = engine.rank_layouts(scenario['k'], scenario['bedrock'], scenario['initial'], layouts,
+                                       xControl, yControl, dwte, maxRate, objective)
+
+    if len(order) == 0:
+        return JsonResponse({"error": "None of the %d rings of wells keeps the water table below the desired "
+                                      "elevation, allow more flow per well or closer spacings" % len(layouts)},
+                            status=422)
+
+    best = layouts[order[0]]
+    scenario['wXCoords'] = [float(x) for x in best['x']]
+    scenario['wYCoords'] = [float(y) for y in best['y']]
+    scenario['rates'] = None
+    scenario['q'] = float(rates[order[0]] * len(best['x']))
+    ml = solve_scenario(scenario)
+    xCells, yCells, heads = water_table_grid(ml, scenario)
+    result = water_table_result(xCells, yCells, heads, scenario, get_data)
+    result.update({'wXCoords': scenario['wXCoords'],
+                   'wYCoords': scenario['wYCoords'],
+                   'rate': float(rates[order[0]]),
+                   'q': scenario['q'],
+                   'offset': best['offset'],
+                   'spacing': best['spacing'],
+                   'objective': objective,
+                   'layouts': len(layouts),
+                   'feasible': len(order),
+                   'controlPoints': len(xControl)})
+
+    return json_response(request, result, compress=get_data.get('gzip', 'false') in ('true', '1'))
+
+
+def submit_water_table_job(request):
+    """
+    Queues the water table computation of generate_water_table and returns the id of the job
+    """
+    get_data = request.GET.dict()
+
+    try:
+        job_id = job_manager.submit(run_water_table_job, get_data)
+    except JobQueueFull:
+        return JsonResponse({"error": "Too many water table jobs are waiting, try again later"}, status=503)
+
+    return JsonResponse({"job_id": job_id})
+
+
+def water_table_job_status(request):
+    """
+    Returns the status and progress of a water table job, and the result once it is complete
+    """
+    job = job_manager.status(request.GET.get('job_id', ''))
+
+    if job is None:
+        return JsonResponse({"error": "Unknown job"}, status=404)
+
+    return json_response(request, job, compress=request.GET.get('gzip', 'false') in ('true', '1'))
+
+
+def run_water_table_job(get_data, progress):
+    scenario = parse_scenario(get_data)
+    ml = solve_scenario(scenario, progress)
+    if scenario['adaptive']:
+        return adaptive_water_table(ml, scenario, get_data, progress)
+    xCells, yCells, heads = water_table_grid(ml, scenario, progress)
+    return water_table_result(xCells, yCells, heads, scenario, get_data)
+
+
+def parse_model(get_data):
+    """
+    Reads the model inputs of a request. The optional rates are the discharges of the individual wells; without
+    rates the total flow q is divided equally over the wells.
+    """
+    return {
+        'rates': json.loads(get_data['rates']) if get_data.get('rates') else None,
+        'wXCoords': json.loads(get_data.get('wXCoords', '[]')),
+        'wYCoords': json.loads(get_data.get('wYCoords', '[]')),
+        'initial': float(json.loads(get_data['initial'])),
+        'bedrock': float(json.loads(get_data['bedrock'])),
+        'q': float(json.loads(get_data['q'])),
+        'k': float(json.loads(get_data['k'])),
+    }
+
+
+def parse_scenario(get_data):
+    """
+    Reads the model inputs (see parse_model) and the grid definition of a water table request. Unless clip is false,
+    only the cells in the region of influence of the wells are evaluated (see water_table_grid). With adaptive, the
+    cells get smaller near the wells and where the water table is steep (see adaptive_water_table).
+    """
+    scenario = parse_model(get_data)
+    scenario.update({
+        'xIndex': json.loads(get_data['xIndex']),
+        'yIndex': json.loads(get_data['yIndex']),
+        'cellSide': json.loads(get_data['cellSide']),
+        'clip': get_data.get('clip', 'true') not in ('false', '0'),
+        'adaptive': get_data.get('adaptive', 'false') in ('true', '1'),
+    })
+    return scenario
+
+
+def solve_scenario(scenario, progress=None):
+    """
+    Returns the solved TimML model of a scenario, from the cache if the same scenario was solved before
+    """
+    k = scenario['k']
+    bedrock = scenario['bedrock']
+    initial = scenario['initial']
+    q = scenario['q']
+    wXCoords = scenario['wXCoords']
+    wYCoords = scenario['wYCoords']
+    rates = scenario['rates']
+
+    # Panning and zooming don't change the model, so a solved model can be reused from the cache
+    key = scenario_key(k, bedrock, initial, q, wXCoords, wYCoords, rates)
+    ml = model_cache.get(key)
+
+    if ml is None:
+        ml = engine.solve(k, bedrock, initial, q, wXCoords, wYCoords, progress, rates)
+        model_cache.put(key, ml)
+
+    return ml
+
+
+def water_table_grid(ml, scenario, progress=None):
+    """
+    Returns the corners of the cells along x and y and the heads at the cell centers, indexed as heads[i, j].
+    The heads come from the grid cache of the map (see cached_head_grid); progress is passed on to jobs.
+    Only the cells in the region of influence of the wells are evaluated (see clip_cells), the other cells get the
+    initial water table; the numbers of cells are stored in scenario['clipped'] (None when all cells are evaluated).
+    """
+    xIndex = scenario['xIndex']
+    yIndex = scenario['yIndex']
+    cellSide = scenario['cellSide']
 
-    # This section constructs the featurecollection polygons defining the water table elevations
     # Cells are defined at the corners, water table elevation is defined at the center of the cell
+    xCells = np.arange(xIndex[0]-cellSide, xIndex[1]+cellSide, cellSide)
+    yCells = np.arange(yIndex[0]-cellSide, yIndex[1]+cellSide, cellSide)
+
+    # Evaluate the heads at all of the cell centers in one pass instead of one ml.head call per cell
+    xCenters, yCenters = np.meshgrid(xCells + cellSide/2, yCells + cellSide/2, indexing='ij')
+
+    clip = clip_cells(ml, xCells + cellSide/2, yCells + cellSide/2, cellSide) if scenario.get('clip') else None
+    scenario['clipped'] = None
+    if clip is None:
+        heads = cached_head_grid(ml, scenario, xCenters, yCenters, progress)
+    else:
+        xSlice, ySlice, radius = clip
+        heads = np.empty(xCenters.shape)
+        heads.fill(scenario['initial'])
+        evaluated = heads[xSlice, ySlice].size
+        if evaluated > 0:
+            heads[xSlice, ySlice] = cached_head_grid(ml, scenario, xCenters[xSlice, ySlice],
+                                                     yCenters[xSlice, ySlice], progress, (xSlice, ySlice))
+        scenario['clipped'] = {'cellsEvaluated': evaluated,
+                               'cellsSaved': heads.size - evaluated,
+                               'background': scenario['initial'],
+                               'influenceRadius': radius}
+
+    return xCells, yCells, heads
+
+
+def clip_cells(ml, xCenters, yCenters, cellSide):
+    """
+    Returns the slices along x and y of the cells with centers xCenters, yCenters (along x and y) that overlap the
+    square around the region of influence of the wells (see engine.influence_radius), rounded outward to blocks of
+    CLIP_BLOCK cells, and the radius of influence. Returns None when the region of influence is not known (a well
+    injects water) or covers all cells.
+    """
+    influence = engine.influence_radius(ml, DRAWDOWN_TOLERANCE)
+    if influence is None:
+        return None
+
+    xc, yc, radius = influence
+    slices = []
+    for centers, center in ((xCenters, xc), (yCenters, yc)):
+        inside = np.flatnonzero(np.abs(centers - center) <= radius + cellSide/2)
+        if len(inside) == 0:
+            slices.append(slice(0, 0))
+        else:
+            slices.append(slice(inside[0] // CLIP_BLOCK * CLIP_BLOCK,
+                                min(-(-(inside[-1] + 1) // CLIP_BLOCK) * CLIP_BLOCK, len(centers))))
+    if slices[0] == slice(0, len(xCenters)) and slices[1] == slice(0, len(yCenters)):
+        return None
+    return slices[0], slices[1], radius
+
+
+def evaluate_cells(ml, xCenters, yCenters, progress=None):
+    """
+    Returns the heads of the model ml at the cell centers xCenters, yCenters (arrays of the same shape), evaluated
+    by GRID_WORKERS processes; with progress (a job), in tiles of grid rows so the progress can be reported
+    """
+    tiles = max(GRID_PROGRESS_STEPS, 4 * GRID_WORKERS) if progress is not None else None
+    return engine.head_grid(ml, xCenters, yCenters, GRID_WORKERS, progress, tiles)
+
+
+def cached_head_grid(ml, scenario, xCenters, yCenters, progress=None, clip=None):
+    """
+    Returns the heads at the cell centers from the grid cache of the map, for requests and jobs alike. The first
+    request for a map evaluates the solved model ml of the scenario directly (see evaluate_cells), and so does a
+    request that changes nothing. When a later request for the same map and aquifer moves wells, the GridCache of a
+    copy of the model is built once, after which only the wells that moved are computed again on the grid. When only
+    the flow changed twice, the unit responses of the wells are computed once, after which every change of the flow
+    is a single matrix-vector product, until a well moves. clip are the slices of the cells in the grid of the map, which
+    are part of the key of the cache (see grid_key).
+    """
+    q = scenario['q']
+    rates = scenario['rates']
+    wXCoords = scenario['wXCoords']
+    wYCoords = scenario['wYCoords']
+    coords = [[float(x), float(y)] for x, y in zip(wXCoords, wYCoords)]
+    wellRates = engine.well_rates(q, len(wXCoords), rates)
+    key = grid_key(scenario, len(wXCoords), clip)
+    entry = grid_cache.get(key)
+
+    if entry is None:
+        # The model is shared with the model cache, so it is only evaluated here and copied before it changes
+        grid_cache.put(key, {'ml': ml, 'cache': None, 'response': None, 'coords': coords, 'rates': wellRates,
+                             'flowChanged': False, 'lock': threading.Lock()})
+        return evaluate_cells(ml, xCenters, yCenters, progress)
+
+    with entry['lock']:
+        unchanged = coords == entry['coords'] and wellRates == entry['rates']
+        if entry['cache'] is None:
+            if unchanged:
+                return evaluate_cells(entry['ml'], xCenters, yCenters, progress)
+            entry['ml'] = engine.copy_model(entry['ml'])
+            entry['cache'] = engine.grid_cache(entry['ml'], xCenters, yCenters)
+
+        if unchanged and entry['response'] is None:
+            # The model of the entry is solved for these wells and discharges
+            heads = entry['cache'].heads([0])[0]
+        elif coords == entry['coords'] and (entry['response'] is not None or entry['flowChanged']):
+            if entry['response'] is None:
+                entry['response'] = engine.unit_response(entry['ml'], entry['cache'])
+            heads = engine.pumping_heads(entry['response'], q, rates)
+        else:
+            # A move, or the first change of the flow since the last move, which may not be followed by others
+            heads = engine.move_wells(entry['ml'], entry['cache'], q, wXCoords, wYCoords, rates)
+            entry['flowChanged'] = coords == entry['coords']
+            entry['coords'] = coords
+            entry['response'] = None
+        entry['rates'] = wellRates
+
+    if progress is not None:
+        progress('grid', 1.0)
+    return heads
+
+
+def adaptive_water_table(ml, scenario, get_data, progress=None):
+    """
+    Returns the response dictionary of the water table on an adaptive grid over the map extent: cells of
+    ADAPTIVE_COARSENING times cellSide that are divided in four where the water table is steep or a well is
+    (see engine.adaptive_grid), in the requested format: GeoJSON cells (default) or a compact quadtree
+    """
+    xIndex = scenario['xIndex']
+    yIndex = scenario['yIndex']
+    cellSide = scenario['cellSide']
+
+    # The same extent as the uniform grid of water_table_grid, in whole coarse cells
+    coarse = cellSide * ADAPTIVE_COARSENING
+    xmin = xIndex[0] - cellSide
+    ymin = yIndex[0] - cellSide
+    nx = max(int(math.ceil((xIndex[1] + cellSide - xmin) / coarse)), 1)
+    ny = max(int(math.ceil((yIndex[1] + cellSide - ymin) / coarse)), 1)
+    tree = engine.adaptive_grid(ml, xmin, ymin, coarse, nx, ny, ADAPTIVE_TOLERANCE, ADAPTIVE_LEVELS, progress)
+
+    if get_data.get('format', 'geojson') == 'grid':
+        result = {"sucess": "Data analysis complete!"}
+        result.update(encode_quadtree(tree, get_data.get('encoding', 'float32')))
+        return result
+
+    waterTable = []
 
-    for long in np.arange(xIndex[0]-cellSide, xIndex[1]+cellSide, cellSide):
-        for lat in np.arange(yIndex[0]-cellSide, yIndex[1]+cellSide, cellSide):
+    for x, y, side, elevation in zip(tree.x, tree.y, tree.size, tree.heads):
+        waterTable.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[x, y], [x + side, y], [x + side, y + side], [x, y + side], [x, y]]]
+                },
+                'properties': {
+                    'elevation': float(elevation),
+                }
+        })
+
+    return {
+        "sucess": "Data analysis complete!",
+        "local_Water_Table": json.dumps(waterTable)
+    }
+
+
+def water_table_result(xCells, yCells, heads, scenario, get_data):
+    """
+    Builds the response dictionary in the requested format: GeoJSON cells (default), a compact grid or contours
+    """
+    cellSide = scenario['cellSide']
+
+    if get_data.get('format', 'geojson') == 'contours':
+        result = {"sucess": "Data analysis complete!"}
+        result.update(contour_result(xCells + cellSide/2, yCells + cellSide/2, heads, get_data))
+        if scenario.get('clipped'):
+            result.update(scenario['clipped'])
+        return result
+
+    if get_data.get('format', 'geojson') == 'grid':
+        # Compact raster: the client builds the cell polygons from the origin, cell size and heads
+        result = {"sucess": "Data analysis complete!"}
+        result.update(encode_head_grid(heads, xCells[0], yCells[0], cellSide, get_data.get('encoding', 'float32')))
+        if scenario.get('clipped'):
+            result.update(scenario['clipped'])
+        return result
+
+    # This section constructs the featurecollection polygons defining the water table elevations
+    waterTable = []
+
+    for i, long in enumerate(xCells):
+        for j, lat in enumerate(yCells):
             waterTable.append({
                 'type': 'Feature',
                 'geometry': {
@@ -223,18 +729,135 @@ def generate_water_table(request):
                                    ]
                     },
                     'properties': {
-                        # 'elevation' : elevationCalc(long,lat,wXCoords,wYCoords,cellSide,initial,bedrock,q,k),
-                        'elevation' : ml.head(0,(long+cellSide/2),(lat+cellSide/2)),
+                        'elevation' : float(heads[i, j]),
                     }
             })
-            # if (wXCoords[0]-cellSide < long < wXCoords[0]+cellSide):
-            #     if (wYCoords[0]-cellSide < lat < wYCoords[0]+cellSide):
-            #         print elevationCalc(long,lat,wXCoords,wYCoords,cellSide,initial,bedrock,q,k)
 
-    return JsonResponse({
+    result = {
         "sucess": "Data analysis complete!",
         "local_Water_Table": json.dumps(waterTable)
-    })
+    }
+    if scenario.get('clipped'):
+        result.update(scenario['clipped'])
+    return result
+
+
+def contour_result(xCenters, yCenters, heads, get_data):
+    """
+    Contours the heads at the cell centers (along x and y) instead of returning the cells: the isobands (default) or,
+    with contours=lines, the isolines of the levels of the request (a JSON list), else of the boundaries of the color
+    classes of the map around dwte, else of CONTOUR_LEVELS equally spaced levels. The isobands also span the lowest
+    and highest head so that they cover the map. Every feature gets the property elevation (the middle of a band, or
+    the level of an isoline) for the styles of the map.
+    """
+    filled = get_data.get('contours', 'bands') != 'lines'
+    hmin = float(heads.min())
+    hmax = float(heads.max())
+
+    if get_data.get('levels'):
+        levels = [float(v) for v in json.loads(get_data['levels'])]
+    elif get_data.get('dwte') and get_data.get('bedrock'):
+        # The class boundaries of the styles of the water table layer
+        dwte = float(json.loads(get_data['dwte']))
+        bedrock = float(json.loads(get_data['bedrock']))
+        levels = [bedrock] + [dwte + f * (dwte - bedrock) for f in (-0.375, -0.25, -0.125, 0.0, 0.125, 0.25, 0.375)]
+    else:
+        levels = list(np.linspace(hmin, hmax, CONTOUR_LEVELS + 2)[1:-1])
+
+    levels = sorted(set(v for v in levels if hmin < v < hmax))
+    if filled:
+        levels = [hmin] + levels + [hmax + 1e-9 * max(abs(hmax), 1.0)]
+
+    xCenters, yCenters = np.meshgrid(xCenters, yCenters, indexing='ij')
+    collection = engine.contours(xCenters, yCenters, heads, levels, filled)
+    for feature in collection['features']:
+        properties = feature['properties']
+        if filled:
+            properties['elevation'] = 0.5 * (properties['lower'] + properties['upper'])
+        else:
+            properties['elevation'] = properties['level']
+
+    return {'format': 'contours',
+            'contours': 'bands' if filled else 'lines',
+            'levels': levels,
+            'waterTable': collection}
+
+
+def encode_head_grid(heads, xOrigin, yOrigin, cellSide, encoding='float32'):
+    """
+    Packs a grid of heads, indexed as heads[i, j] with i along x and j along y, into a compact dictionary.
+    The heads are stored row by row starting at the lower left cell (index j * nx + i) as base64 encoded
+    little-endian float32 values, or as int16 values with head = offset + value * scale.
+    """
+    nx, ny = heads.shape
+    rows = np.ascontiguousarray(heads.T)
+    grid = {
+        'format': 'grid',
+        'origin': [float(xOrigin), float(yOrigin)],
+        'cellSide': float(cellSide),
+        'nx': nx,
+        'ny': ny,
+    }
+    grid.update(encode_heads(rows, encoding))
+    return grid
+
+
+def encode_quadtree(tree, encoding='float32'):
+    """
+    Packs the cells of a QuadTree into a compact dictionary. Cell n has size cellSide / 2**level[n] and its lower left
+    corner at origin + (i[n], j[n]) * size; level (uint8), i and j (uint32) and the heads at the cell centers (see
+    encode_heads) are base64 encoded little-endian arrays.
+    """
+    quadtree = {
+        'format': 'quadtree',
+        'origin': [tree.xmin, tree.ymin],
+        'cellSide': tree.cellSide,
+        'nx': tree.nx,
+        'ny': tree.ny,
+        'cells': len(tree.level),
+        'level': base64.b64encode(tree.level.astype('u1').tostring()),
+        'i': base64.b64encode(tree.i.astype('<u4').tostring()),
+        'j': base64.b64encode(tree.j.astype('<u4').tostring()),
+    }
+    quadtree.update(encode_heads(tree.heads, encoding))
+    return quadtree
+
+
+def encode_heads(heads, encoding='float32'):
+    """
+    Returns a dictionary with the heads (an array) as base64 encoded little-endian float32 values, or as int16 values
+    with head = offset + value * scale
+    """
+    values = np.ravel(heads)
+    encoded = {'encoding': encoding}
+    if encoding == 'int16':
+        hmin = float(values.min())
+        hmax = float(values.max())
+        offset = 0.5 * (hmin + hmax)
+        scale = (hmax - hmin) / 65534.0
+        if scale == 0.0:
+            scale = 1.0
+        values = np.round((values - offset) / scale).astype('<i2')
+        encoded['offset'] = offset
+        encoded['scale'] = scale
+    elif encoding == 'float32':
+        values = values.astype('<f4')
+    else:
+        raise ValueError('Unknown grid encoding: ' + str(encoding))
+    encoded['heads'] = base64.b64encode(values.tostring())
+    return encoded
+
+
+def json_response(request, data, compress=False):
+    """
+    Returns data as a JSON response, gzip compressed if requested and accepted by the client.
+    """
+    if compress and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(compress_string(json.dumps(data)), content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+    return JsonResponse(data)
 
 
 # Assign elevations to raster grid
@@ -0,0 +1,291 @@
+"""
+TimML engine of the dewatering tool. TimML is resolved relative to this file and imported once, when a worker
+first imports this module, so requests don't touch sys.path or import anything. Plotting (matplotlib) is not
+imported and no GUI toolkit is needed.
+"""
+import copy
+import os
+import sys
+
+import numpy as np
+from scipy.optimize import linprog
+
+TIMML_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timml')
+
+if TIMML_PATH not in sys.path:
+    sys.path.insert(0, TIMML_PATH)
+
+from timml import Model, Constant, Well, GridCache, UnitResponse, QuadTree
+from timml import isolines, isobands, isolinesGeoJSON, isobandsGeoJSON
+
+# Radius of the wells [ft]
+WELL_RADIUS = 10
+
+# Distance in x and y of the reference point from the first well [ft]
+REFERENCE_OFFSET = 500
+
+# Drawdown below which the water table is shown at the initial elevation (see influence_radius) [ft]
+DRAWDOWN_TOLERANCE = 0.01
+
+# Objectives of optimize_rates: the smallest total discharge, or the smallest largest discharge of a well
+OBJECTIVES = ('total', 'max')
+
+# Objectives of rank_layouts: the layout with the fewest wells, or with the smallest total discharge
+DESIGN_OBJECTIVES = ('wells', 'total')
+
+# Relative increase of the discharges of rank_layouts above the threshold, so that the water table at the worst
+# control point ends up below dwte rather than on it after round-off
+DESIGN_SAFETY = 1e-6
+
+
+def well_rates(q, nwells, rates=None):
+    """
+    Returns the discharges of the wells: rates if given (one per well), else the total discharge q divided equally
+    """
+    if nwells == 0:
+        return []
+    if rates is None:
+        return [q / nwells] * nwells
+    assert len(rates) == nwells, 'One discharge is needed for every well'
+    return [float(r) for r in rates]
+
+
+def solve(k, bedrock, initial, q, wXCoords, wYCoords, progress=None, rates=None):
+    """
+    Builds and solves the model of a single unconfined aquifer with the total discharge q divided equally over
+    the wells, or with the discharges rates of the wells. The water table is fixed at the initial elevation at the
+    reference point. Without wells the model has only the Constant, so the water table is the initial elevation.
+    progress is passed on to Model.solve.
+    """
+    ml = Model(k=[k], zb=[bedrock], zt=[initial])
+    x0, y0 = (wXCoords[0], wYCoords[0]) if len(wXCoords) > 0 else (0.0, 0.0)
+    Constant(ml, x0 + REFERENCE_OFFSET, y0 + REFERENCE_OFFSET, initial, [0])
+
+    for x, y, pumpRate in zip(wXCoords, wYCoords, well_rates(q, len(wXCoords), rates)):
+        Well(ml, x, y, pumpRate, WELL_RADIUS, 0)
+
+    ml.solve(doIterations=True, progress=progress)
+    return ml
+
+
+def head(ml, x, y):
+    """
+    Returns the water table elevation at (x, y)
+    """
+    return ml.head(0, x, y)
+
+
+def point_heads(ml, x, y):
+    """
+    Returns the water table elevations at the points x, y (arrays of length N), evaluated for all points at once.
+    See Model.headVectorArray.
+    """
+    return ml.headVectorArray(np.asarray(x, dtype=float), np.asarray(y, dtype=float))[0]
+
+
+def influence_radius(ml, tol=DRAWDOWN_TOLERANCE):
+    """
+    Returns the center x, y of the wells of a model built by solve and the radius of influence beyond which the
+    drawdown is at most tol, or None when a well injects water or no water is pumped. With the reference point at
+    distance d_i of well i, the drawdown at distance r_i of the wells is sum Q_i (ln d_i - ln r_i) / (2 pi T), and
+    every r_i is at least r - a at distance r > a of the center, where a is the largest distance of a well to the
+    center. This bound is at most tol beyond the radius a + exp((sum Q_i ln d_i - 2 pi T tol) / Q). Beyond the radius
+    the water table is thus at least the initial elevation minus tol; it is higher than the initial elevation beyond
+    about the distance of the reference point.
+    """
+    constant = ml.elementList[0]
+    wells = [el for el in ml.elementList if el.type == 'well']
+    Q = np.array([well.discharge for well in wells])
+    if len(wells) == 0 or (Q < 0).any() or Q.sum() == 0:
+        return None
+
+    xw = np.array([well.xw for well in wells])
+    yw = np.array([well.yw for well in wells])
+    xc = xw.mean()
+    yc = yw.mean()
+    a = np.hypot(xw - xc, yw - yc).max()
+    d = np.maximum(np.hypot(constant.xr - xw, constant.yr - yw), WELL_RADIUS)
+    transmissivity = ml.aq.T[0]
+    radius = a + max(np.exp((np.sum(Q * np.log(d)) - 2 * np.pi * transmissivity * tol) / Q.sum()), WELL_RADIUS)
+    return xc, yc, radius
+
+
+def head_grid(ml, x, y, workers=1, progress=None, tiles=None):
+    """
+    Returns the water table elevations at the points x, y (arrays of the same shape), evaluated in tiles of rows
+    by workers processes. progress is called as progress('grid', fraction) after every tile.
+    See Model.evaluate_grid.
+    """
+    return ml.evaluate_grid(x, y, [0], workers, progress=progress, tiles=tiles)[0]
+
+
+def adaptive_grid(ml, xmin, ymin, cellSide, nx, ny, tol, maxLevel, progress=None):
+    """
+    Returns the QuadTree of the water table of a model built by solve on a coarse grid of nx by ny cells of size
+    cellSide from xmin, ymin, of which the cells are divided up to maxLevel times while the water table at their
+    corners differs more than tol, or while they contain a well. progress is called as progress('grid', fraction)
+    after every level.
+    """
+    return QuadTree(ml, xmin, ymin, cellSide, nx, ny, tol, maxLevel, 0, progress)
+
+
+def contours(x, y, heads, levels, filled=True):
+    """
+    Returns a GeoJSON FeatureCollection with the isobands between consecutive levels (filled, a MultiPolygon with
+    properties lower and upper for every band) or the isolines of levels (a MultiLineString with property level for
+    every level) of the water table elevations heads at the points x, y (arrays of the same shape)
+    """
+    if filled:
+        return isobandsGeoJSON(isobands(x, y, heads, levels), levels)
+    return isolinesGeoJSON(isolines(x, y, heads, levels), levels)
+
+
+def copy_model(ml):
+    """
+    Returns a copy of a solved model, which can be changed (see move_wells) while ml is used by other requests
+    """
+    return copy.deepcopy(ml)
+
+
+def grid_cache(ml, x, y):
+    """
+    Returns the GridCache of a model built by solve at the points x, y (arrays of the same shape), which stores
+    the drawdown of every well at unit discharge on the grid. See move_wells.
+    """
+    return GridCache(ml, x, y)
+
+
+def move_wells(ml, cache, q, wXCoords, wYCoords, rates=None):
+    """
+    Moves the wells of a model built by solve to wXCoords, wYCoords (the same number of wells), sets their
+    discharges as solve and solves the model again. Only the wells that moved are computed again on the grid of
+    cache; the Constant is the same on the whole grid, also when the reference point moves with the first well.
+    Returns the water table elevations on the grid of cache.
+    """
+    constant = ml.elementList[0]
+    wells = [el for el in ml.elementList if el.type == 'well']
+    assert len(wells) == len(wXCoords), 'move_wells cannot change the number of wells'
+
+    moved = []
+    for well, x, y, pumpRate in zip(wells, wXCoords, wYCoords, well_rates(q, len(wXCoords), rates)):
+        if well.xw != x or well.yw != y:
+            well.xw = float(x)
+            well.yw = float(y)
+            moved.append(well)
+        well.discharge = pumpRate
+    constant.xr = wXCoords[0] + REFERENCE_OFFSET
+    constant.yr = wYCoords[0] + REFERENCE_OFFSET
+
+    ml.solve(doIterations=True)
+    cache.update(moved)
+    return cache.heads([0])[0]
+
+
+def unit_response(ml, cache):
+    """
+    Returns the UnitResponse of the wells of a model built by solve on the grid of cache: the water table for any
+    discharges of the wells is then a single matrix-vector product (see pumping_heads). It is valid as long as the
+    wells don't move; the model is solved once for every well.
+    """
+    return UnitResponse(ml, [el for el in ml.elementList if el.type == 'well'], cache=cache, layers=[0])
+
+
+def pumping_heads(response, q, rates=None):
+    """
+    Returns the water table elevations on the grid of a UnitResponse for the total discharge q divided equally over
+    the wells, or for the discharges rates of the wells
+    """
+    return response.heads(well_rates(q, len(response.wells), rates))[0]
+
+
+def optimize_rates(ml, x, y, dwte, objective='total'):
+    """
+    Returns the discharges of the wells of a model built by solve that keep the water table at the control points
+    x, y at or below dwte, with the smallest total discharge (objective 'total') or the smallest largest discharge
+    of a well (objective 'max'), and a message. The discharges are None when no such discharges exist.
+    The heads at the control points are linear in the discharges (see UnitResponse), so this is a linear program:
+    base + responses * Q <= dwte with Q >= 0.
+    """
+    assert objective in OBJECTIVES, 'objective must be one of ' + ', '.join(OBJECTIVES)
+    wells = [el for el in ml.elementList if el.type == 'well']
+    response = UnitResponse(ml, wells, x=x, y=y, layers=[0])
+    nwells = len(wells)
+
+    if objective == 'total':
+        c = np.ones(nwells)
+        A = response.responses
+        b = dwte - response.base
+    else:
+        # The largest discharge t is an extra variable with Q <= t
+        c = np.hstack((np.zeros(nwells), 1.0))
+        A = np.vstack((np.hstack((response.responses, np.zeros((len(response.base), 1)))),
+                       np.hstack((np.eye(nwells), -np.ones((nwells, 1))))))
+        b = np.hstack((dwte - response.base, np.zeros(nwells)))
+
+    # Rows of unit norm, as the drawdowns of a unit discharge are large in units of the discharge
+    scale = np.sqrt((A * A).sum(1))
+    scale[scale == 0.0] = 1.0
+    try:
+        result = linprog(c, A_ub=A / scale[:, np.newaxis], b_ub=b / scale, bounds=(0, None))
+    except ValueError as e:
+        return None, str(e)
+    if result.status != 0:
+        return None, result.message
+    return [float(r) for r in result.x[:nwells]], result.message
+
+
+def unit_potentials(xw, yw, x, y):
+    """
+    Returns array of shape (len(x), len(xw)) with the potential at the points x, y of every well at xw, yw for a unit
+    discharge, as the Well of TimML: log(r**2 / rw**2) / (4 pi), with r at least the radius of the wells
+    """
+    rwsq = float(WELL_RADIUS) ** 2
+    rsq = (np.asarray(x, dtype=float)[:, np.newaxis] - xw) ** 2 + (np.asarray(y, dtype=float)[:, np.newaxis] - yw) ** 2
+    return np.log(np.maximum(rsq, rwsq) / rwsq) / (4 * np.pi)
+
+
+def rank_layouts(k, bedrock, initial, layouts, x, y, dwte, maxRate=None, objective='wells'):
+    """
+    Scores candidate layouts of wells (dictionaries with the arrays x and y of the wells, see excavation.rings) for
+    the model of solve, with the total discharge divided equally over the wells. Returns an array with the discharge
+    per well that every layout needs to keep the water table at the control points x, y at or below dwte (inf when
+    it can't, and DESIGN_SAFETY above the threshold), and the indices of the layouts that reach dwte with at most maxRate per well, best first: the fewest
+    wells (objective 'wells', ties by the smallest total discharge) or the smallest total discharge (objective
+    'total', ties by the fewest wells).
+    The model is closed form, so the unit responses of all wells of all layouts at the control points are computed
+    in one array and summed per layout; the reference point of every layout is at its first well, as in solve.
+    """
+    assert objective in DESIGN_OBJECTIVES, 'objective must be one of ' + ', '.join(DESIGN_OBJECTIVES)
+    counts = np.array([len(layout['x']) for layout in layouts])
+    starts = np.hstack((0, np.cumsum(counts)[:-1]))
+    xw = np.concatenate([np.asarray(layout['x'], dtype=float) for layout in layouts])
+    yw = np.concatenate([np.asarray(layout['y'], dtype=float) for layout in layouts])
+
+    # Reference point of the layout of every well
+    owner = np.repeat(np.arange(len(layouts)), counts)
+    xr = xw[starts][owner] + REFERENCE_OFFSET
+    yr = yw[starts][owner] + REFERENCE_OFFSET
+    rwsq = float(WELL_RADIUS) ** 2
+    reference = np.log(np.maximum((xr - xw) ** 2 + (yr - yw) ** 2, rwsq) / rwsq) / (4 * np.pi)
+
+    # Change of the water table at the control points for a unit discharge of every well of a layout
+    transmissivity = k * (initial - bedrock)
+    responses = (np.add.reduceat(unit_potentials(xw, yw, x, y), starts, axis=1) -
+                 np.add.reduceat(reference, starts)) / transmissivity
+
+    if dwte >= initial:
+        rates = np.zeros(len(layouts))
+    else:
+        # Every control point needs rate * response <= dwte - initial, which needs a drawdown (response < 0)
+        rates = np.where(responses < 0, (dwte - initial) / np.minimum(responses, -1e-300), np.inf).max(0)
+        rates *= 1.0 + DESIGN_SAFETY
+
+    feasible = np.isfinite(rates)
+    if maxRate is not None:
+        feasible &= rates <= maxRate
+    total = rates * counts
+    if objective == 'wells':
+        order = np.lexsort((total, counts))
+    else:
+        order = np.lexsort((counts, total))
+    return rates, order[feasible[order]]
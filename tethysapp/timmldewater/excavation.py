@@ -0,0 +1,121 @@
+"""
+Geometry of the excavation of the dewatering tool: the polygon that is drawn on the map and the control points in
+it, where the water table must be at or below the desired elevation.
+"""
+import numpy as np
+
+# Number of control points along the longest side of the bounding box of the excavation
+CONTROL_POINTS_PER_SIDE = 10
+
+
+def polygon(pXCoords, pYCoords):
+    """
+    Returns the vertices of the polygon as arrays x, y, without the last vertex when it repeats the first one
+    (OpenLayers closes its polygons)
+    """
+    x = np.asarray(pXCoords, dtype=float)
+    y = np.asarray(pYCoords, dtype=float)
+    if len(x) > 1 and x[0] == x[-1] and y[0] == y[-1]:
+        x = x[:-1]
+        y = y[:-1]
+    return x, y
+
+
+def inside(pXCoords, pYCoords, x, y):
+    """
+    Returns a boolean array that is True where the points x, y (arrays of the same shape) are inside the polygon,
+    with the even-odd rule: a point is inside when a ray to the right crosses an odd number of sides
+    """
+    px, py = polygon(pXCoords, pYCoords)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    result = np.zeros(x.shape, dtype=bool)
+    for x1, y1, x2, y2 in zip(px, py, np.roll(px, -1), np.roll(py, -1)):
+        if y1 == y2:
+            continue
+        crosses = (y1 > y) != (y2 > y)
+        xcross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        result ^= crosses & (x < xcross)
+    return result
+
+
+def control_points(pXCoords, pYCoords, n=CONTROL_POINTS_PER_SIDE):
+    """
+    Returns arrays x, y of the control points of the excavation: the vertices of the polygon, points along its sides
+    and a regular grid of points inside it, all with a spacing of the longest side of the bounding box divided by n
+    """
+    px, py = polygon(pXCoords, pYCoords)
+    spacing = max(px.max() - px.min(), py.max() - py.min()) / float(n)
+    if spacing == 0.0:
+        return px[:1], py[:1]
+
+    x = [px]
+    y = [py]
+    for x1, y1, x2, y2 in zip(px, py, np.roll(px, -1), np.roll(py, -1)):
+        nside = int(np.ceil(np.hypot(x2 - x1, y2 - y1) / spacing))
+        if nside > 1:
+            t = np.arange(1, nside) / float(nside)
+            x.append(x1 + t * (x2 - x1))
+            y.append(y1 + t * (y2 - y1))
+
+    xg, yg = np.meshgrid(np.arange(px.min() + spacing / 2, px.max(), spacing),
+                         np.arange(py.min() + spacing / 2, py.max(), spacing))
+    interior = inside(px, py, xg, yg)
+    x.append(xg[interior])
+    y.append(yg[interior])
+    return np.concatenate(x), np.concatenate(y)
+
+
+def offset_polygon(pXCoords, pYCoords, offset):
+    """
+    Returns the vertices x, y of the polygon moved outward by offset: every vertex moves along the bisector of its
+    two sides so that both sides move by offset (a mitered offset, which is exact for convex polygons such as the
+    boxes drawn on the map)
+    """
+    px, py = polygon(pXCoords, pYCoords)
+    # Outward normals of the sides, from the orientation of the polygon (positive area is counterclockwise)
+    area = 0.5 * np.sum(px * np.roll(py, -1) - np.roll(px, -1) * py)
+    dx = np.roll(px, -1) - px
+    dy = np.roll(py, -1) - py
+    length = np.hypot(dx, dy)
+    length[length == 0.0] = 1.0
+    sign = 1.0 if area > 0 else -1.0
+    nx = sign * dy / length
+    ny = -sign * dx / length
+    # Normals of the sides before and after every vertex
+    nx0 = np.roll(nx, 1)
+    ny0 = np.roll(ny, 1)
+    bx = nx0 + nx
+    by = ny0 + ny
+    scale = offset / np.maximum(1.0 + nx0 * nx + ny0 * ny, 1e-6)
+    return px + bx * scale, py + by * scale
+
+
+def ring(pXCoords, pYCoords, offset, spacing, phase=0.0):
+    """
+    Returns arrays x, y with the wells of a ring around the polygon at distance offset, spaced equally along the
+    offset polygon about spacing apart (at least three wells). The first well is phase times the spacing from the
+    first vertex
+    """
+    rx, ry = offset_polygon(pXCoords, pYCoords, offset)
+    rx = np.append(rx, rx[0])
+    ry = np.append(ry, ry[0])
+    distance = np.hstack((0.0, np.cumsum(np.hypot(np.diff(rx), np.diff(ry)))))
+    nwells = max(int(round(distance[-1] / spacing)), 3)
+    s = (np.arange(nwells) + phase) * distance[-1] / nwells
+    return np.interp(s, distance, rx), np.interp(s, distance, ry)
+
+
+def rings(pXCoords, pYCoords, offsets, spacings, phases=(0.0,)):
+    """
+    Returns a list with the candidate layouts of wells around the polygon, one ring for every combination of offset,
+    spacing and phase, as dictionaries with the offset, spacing, phase and the arrays x and y of the wells
+    """
+    layouts = []
+    for offset in offsets:
+        for spacing in spacings:
+            for phase in phases:
+                x, y = ring(pXCoords, pYCoords, offset, spacing, phase)
+                layouts.append({'offset': float(offset), 'spacing': float(spacing), 'phase': float(phase),
+                                'x': x, 'y': y})
+    return layouts
@@ -0,0 +1,119 @@
+import threading
+import time
+import traceback
+import uuid
+import Queue
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when a job is submitted while the queue of waiting jobs is full
+    """
+    pass
+
+
+class Job(object):
+    """
+    Status, progress and result of one background job
+    """
+
+    def __init__(self, func, args):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.status = 'queued'
+        self.phase = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def set_progress(self, phase, fraction):
+        self.phase = phase
+        self.progress = float(fraction)
+
+    def to_dict(self):
+        job = {
+            'job_id': self.id,
+            'status': self.status,
+            'phase': self.phase,
+            'progress': self.progress,
+        }
+        if self.status == 'complete':
+            job['result'] = self.result
+        elif self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+
+class JobManager(object):
+    """
+    Runs jobs in a fixed number of worker threads. At most maxqueued jobs can wait for a worker,
+    finished jobs are forgotten after keep seconds.
+    The job function is called as func(*args, progress=callback), with callback(phase, fraction).
+    """
+
+    def __init__(self, workers=2, maxqueued=16, keep=600):
+        self.workers = workers
+        self.keep = keep
+        self._queue = Queue.Queue(maxsize=maxqueued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, func, *args):
+        self._start_workers()
+        job = Job(func, args)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except Queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFull()
+        return job.id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return job.to_dict()
+
+    def _start_workers(self):
+        # Threads are started on first use, not when the module is imported
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                job.status = 'running'
+            # The result is published together with the status, so status() never sees one without the other
+            try:
+                result = job.func(*job.args, progress=job.set_progress)
+                with self._lock:
+                    job.result = result
+                    job.status = 'complete'
+                    job.finished = time.time()
+            except Exception as e:
+                traceback.print_exc()
+                with self._lock:
+                    job.error = str(e)
+                    job.status = 'failed'
+                    job.finished = time.time()
+            self._queue.task_done()
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in self._jobs.items():
+            if job.finished is not None and now - job.finished > self.keep:
+                del self._jobs[job_id]
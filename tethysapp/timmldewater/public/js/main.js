@@ -18,7 +18,11 @@ function welcome_modal() {
                 "your wells.</p>" +
                 "<h6>4. Perform calculations</h6>" +
                 "<p>Click on the 'Calculate Water Table Elevations' tool to perform the drawdown calculations and " +
-                "display the results on the map.</p>"+
+                "display the results on the map, click on the 'Check Excavation' tool to only check the water table in " +
+                "the excavation, or click on the 'Optimize Pumping Rates' tool to compute the smallest " +
+                "total pumping rate that lowers the water table in the excavation to the desired elevation. The 'Design Wells' " +
+                "tool places the wells itself, on the ring around the excavation with the fewest wells that lowers the " +
+                "water table to the desired elevation with at most the maximum flow per well.</p>"+
 				"<div align='center' id='Equation'><img src='/static/timmldewater/images/EQN.png'/></div>" +
 				'</div>';
     modal_dialog("Instructions", myHTMLBody, true);
@@ -30,7 +34,7 @@ $(document).ready(function(){
 
 //  #################################### Verify that the user has the necessary variables ##############################
 
-function verify(numFeatures, numWells, numPolys){
+function verify(numFeatures, numWells, numPolys, needWells){
     //initialize the variables for the functions to be used
 
     if (isNaN(k.value)){
@@ -83,7 +87,7 @@ function verify(numFeatures, numWells, numPolys){
         return false;
     }
 
-    if (Number(numWells) == 0) {
+    if (needWells && Number(numWells) == 0) {
         error_message('You need wells to perform the analysis, please add at least one well');
         return false;
     }
@@ -102,9 +106,9 @@ function verify(numFeatures, numWells, numPolys){
 
 function isOdd(num) {return !!(num % 2);}
 
-//  #################################### From the input shapes and variables, create a grid ############################
+//  #################################### Read the input shapes and the grid definition from the map ###################
 
-function dewater(){
+function readMapInputs(needWells){
 
     var pCoords;
     var wCoords;
@@ -146,8 +150,8 @@ function dewater(){
     }
 
     //Check the inputs. Exit if there is a problem.
-    if (!verify(mapFeatures.length, wells.length, perimeter.length)) {
-        return;
+    if (!verify(mapFeatures.length, wells.length, perimeter.length, needWells !== false)) {
+        return null;
     }
 
    // Obtain the map view extents for bounding the grid a second time
@@ -186,7 +190,7 @@ function dewater(){
     i = 0;
     iX = 0;
     iY = 0;
-    do {
+    while (wells.length > 0 && i < wCoords.length) {
         if (!isOdd(i)){
             wXCoords[iX] = parseFloat(wCoords[i]);
             i++;
@@ -199,7 +203,6 @@ function dewater(){
             iY++;
         }
     }
-    while (i < wCoords.length);
 
     // Map View Extent coordinates
 
@@ -226,42 +229,366 @@ function dewater(){
         cellSide = cellSide + Math.abs(pXCoords[0]-pXCoords[1])*scale;
     }
 
-    var waterTableRegional = [];
-    var long, lat;
+    return {
+        'pXCoords': pXCoords,
+        'pYCoords': pYCoords,
+        'wXCoords': wXCoords,
+        'wYCoords': wYCoords,
+        'mapXCoords': mapXCoords,
+        'mapYCoords': mapYCoords,
+        'cellSide': cellSide
+    };
+};
+
+//  #################################### From the input shapes and variables, create a grid ############################
+
+function dewater(){
+    var inputs = readMapInputs();
+
+    if (inputs === null) {
+        return;
+    }
+
+	// The water table is computed as a background job, its progress is polled until the result is ready
+	$.ajax({
+		type: 'GET',
+		url: 'submit-water-table-job',
+		dataType: 'json',
+		data: {
+			'xIndex': JSON.stringify(inputs.mapXCoords),
+			'yIndex': JSON.stringify(inputs.mapYCoords),
+			'wXCoords': JSON.stringify(inputs.wXCoords),
+			'wYCoords': JSON.stringify(inputs.wYCoords),
+			'cellSide': JSON.stringify(inputs.cellSide),
+			'initial': JSON.stringify(iwte.value),
+			'bedrock': JSON.stringify(bedrock.value),
+			'q': JSON.stringify(q.value),
+			'k': JSON.stringify(k.value),
+			'format': 'grid',
+			'adaptive': JSON.stringify($('#adaptive').is(':checked')),
+			'gzip': 'true',
+			},
+			success: function (job){
+					pollWaterTableJob(job.job_id, showWaterTable);
+					},
+			error: function (xhr){
+					showJobProgress('The water table could not be computed, try again later');
+					}
+			});
+};
+
+//  #################################### Check the water table in the excavation only #################################
+
+function checkExcavation(){
+    var inputs = readMapInputs();
+
+    if (inputs === null) {
+        return;
+    }
+
+	// Heads at the control points of the excavation, without the grid of the map
+	$.ajax({
+		type: 'GET',
+		url: 'check-excavation',
+		dataType: 'json',
+		data: {
+			'wXCoords': JSON.stringify(inputs.wXCoords),
+			'wYCoords': JSON.stringify(inputs.wYCoords),
+			'pXCoords': JSON.stringify(inputs.pXCoords),
+			'pYCoords': JSON.stringify(inputs.pYCoords),
+			'initial': JSON.stringify(iwte.value),
+			'bedrock': JSON.stringify(bedrock.value),
+			'q': JSON.stringify(q.value),
+			'k': JSON.stringify(k.value),
+			'dwte': JSON.stringify(dwte.value),
+			},
+			success: function (data){
+					showJobProgress((data.dewatered ? 'Dewatered: ' : 'Not dewatered: ') +
+					                'water table ' + data.minHead.toFixed(2) + ' to ' + data.maxHead.toFixed(2) +
+					                ' ft in the excavation, desired ' + data.dwte.toFixed(2) + ' ft');
+					},
+			error: function (xhr){
+					showJobProgress((xhr.responseJSON && xhr.responseJSON.error) || 'The excavation could not be checked');
+					}
+			});
+};
+
+//  #################################### Optimize the pumping rates for the desired water table elevation #############
+
+function optimizePumping(){
+    var inputs = readMapInputs();
+
+    if (inputs === null) {
+        return;
+    }
+
+    showJobProgress('Optimizing the pumping rates');
+
+	// The smallest total flow that keeps the water table in the excavation at or below the desired elevation
+	$.ajax({
+		type: 'GET',
+		url: 'optimize-pumping',
+		dataType: 'json',
+		data: {
+			'xIndex': JSON.stringify(inputs.mapXCoords),
+			'yIndex': JSON.stringify(inputs.mapYCoords),
+			'wXCoords': JSON.stringify(inputs.wXCoords),
+			'wYCoords': JSON.stringify(inputs.wYCoords),
+			'pXCoords': JSON.stringify(inputs.pXCoords),
+			'pYCoords': JSON.stringify(inputs.pYCoords),
+			'cellSide': JSON.stringify(inputs.cellSide),
+			'initial': JSON.stringify(iwte.value),
+			'bedrock': JSON.stringify(bedrock.value),
+			'q': JSON.stringify(q.value),
+			'k': JSON.stringify(k.value),
+			'dwte': JSON.stringify(dwte.value),
+			'objective': 'total',
+			'format': 'contours',
+			'gzip': 'true',
+			},
+			success: function (data){
+					q.value = data.q.toPrecision(4);
+					showJobProgress('Pumping rates [cfs]: ' + data.rates.map(function (rate){ return rate.toPrecision(3); }).join(', '));
+					showWaterTable(data);
+					},
+			error: function (xhr){
+					showJobProgress((xhr.responseJSON && xhr.responseJSON.error) || 'The pumping rates could not be optimized');
+					}
+			});
+};
+
+//  #################################### Place the wells on a ring around the excavation ###############################
 
+function designWells(){
+    var inputs = readMapInputs(false);
+
+    if (inputs === null) {
+        return;
+    }
+
+    if (isNaN(maxRate.value) || Number(maxRate.value) <= 0){
+        error_message('Maximum Flow per Well must be a positive value');
+        return;
+    }
+
+    showJobProgress('Designing the wells');
+
+	// The ring of wells with the fewest wells that keeps the water table in the excavation at or below the desired elevation
 	$.ajax({
 		type: 'GET',
-		url: 'generate-water-table',
+		url: 'design-wells',
 		dataType: 'json',
 		data: {
-			'xIndex': JSON.stringify(mapXCoords),
-			'yIndex': JSON.stringify(mapYCoords),
-			'wXCoords': JSON.stringify(wXCoords),
-			'wYCoords': JSON.stringify(wYCoords),
-			'cellSide': JSON.stringify(cellSide),
+			'xIndex': JSON.stringify(inputs.mapXCoords),
+			'yIndex': JSON.stringify(inputs.mapYCoords),
+			'pXCoords': JSON.stringify(inputs.pXCoords),
+			'pYCoords': JSON.stringify(inputs.pYCoords),
+			'cellSide': JSON.stringify(inputs.cellSide),
 			'initial': JSON.stringify(iwte.value),
 			'bedrock': JSON.stringify(bedrock.value),
 			'q': JSON.stringify(q.value),
 			'k': JSON.stringify(k.value),
+			'dwte': JSON.stringify(dwte.value),
+			'maxRate': JSON.stringify(maxRate.value),
+			'objective': 'wells',
+			'format': 'contours',
+			'gzip': 'true',
 			},
 			success: function (data){
-//					console.log(data)
-					waterTableRegional = (JSON.parse(data.local_Water_Table));
-					var raster_elev_mapView = {
-						'type': 'FeatureCollection',
-						'crs': {
-							'type': 'name',
-							'properties':{
-								'name':'EPSG:4326'
-								}
-						},
-						'features': waterTableRegional
-					};
-					addWaterTable(raster_elev_mapView,"Water Table");
-					addDewateredLayer(raster_elev_mapView,"Dewatered Region(s)");
+					var source = TETHYS_MAP_VIEW.getMap().getLayers().item(1).getSource();
+					var i;
+
+					// Replace the wells on the map by the designed wells
+					source.getFeatures().forEach(function (feature){
+						if (feature.getGeometry().getType() === 'Point') {
+							source.removeFeature(feature);
+						}
+					});
+					for (i = 0; i < data.wXCoords.length; i++) {
+						source.addFeature(new ol.Feature(new ol.geom.Point([data.wXCoords[i], data.wYCoords[i]])));
+					}
+
+					q.value = data.q.toPrecision(4);
+					showJobProgress(data.wXCoords.length + ' wells of ' + data.rate.toPrecision(3) + ' cfs, ' +
+					                data.layouts + ' rings compared');
+					showWaterTable(data);
+					},
+			error: function (xhr){
+					showJobProgress((xhr.responseJSON && xhr.responseJSON.error) || 'The wells could not be designed');
 					}
 			});
 };
+
+//  #################################### Show a computed water table on the map ########################################
+
+function showWaterTable(data){
+    var waterTableRegional;
+
+    if (data.format === 'grid') {
+        waterTableRegional = gridToFeatures(data);
+    }
+    else if (data.format === 'quadtree') {
+        waterTableRegional = quadtreeToFeatures(data);
+    }
+    else if (data.format === 'contours') {
+        waterTableRegional = data.waterTable.features;
+    }
+    else {
+        waterTableRegional = (JSON.parse(data.local_Water_Table));
+    }
+    var raster_elev_mapView = {
+        'type': 'FeatureCollection',
+        'crs': {
+            'type': 'name',
+            'properties':{
+                'name':'EPSG:4326'
+                }
+        },
+        'features': waterTableRegional
+    };
+    addWaterTable(raster_elev_mapView,"Water Table");
+    addDewateredLayer(raster_elev_mapView,"Dewatered Region(s)");
+};
+//  #################################### Poll the status of a water table job ##############################
+
+function pollWaterTableJob(jobId, onComplete){
+    var phases = {
+        'compile': 'Building matrix',
+        'factorization': 'Solving',
+        'iteration': 'Iterating',
+        'grid': 'Computing water table'
+    };
+
+    $.ajax({
+        type: 'GET',
+        url: 'water-table-job-status',
+        dataType: 'json',
+        data: {
+            'job_id': jobId,
+            'gzip': 'true',
+            },
+            success: function (job){
+                    if (job.status === 'complete') {
+                        $('#jobProgress').hide();
+                        onComplete(job.result);
+                    }
+                    else if (job.status === 'failed') {
+                        showJobProgress('The water table could not be computed: ' + job.error);
+                    }
+                    else {
+                        if (job.phase === null) {
+                            showJobProgress('Waiting for the model to start');
+                        }
+                        else {
+                            showJobProgress((phases[job.phase] || job.phase) + ' ' + Math.round(100 * job.progress) + '%');
+                        }
+                        setTimeout(function (){ pollWaterTableJob(jobId, onComplete); }, 500);
+                    }
+                    },
+            error: function (xhr){
+                    showJobProgress('The water table job was lost, try again');
+                    }
+            });
+};
+
+function showJobProgress(message){
+    $('#jobProgress').text(message).show();
+};
+//  #################################### Build the water table cells from the compact grid ##############################
+
+function decodeBytes(encoded){
+    // Base64 encoded little-endian values
+    var binary = atob(encoded);
+    var bytes = new Uint8Array(binary.length);
+    var i;
+
+    for (i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+}
+
+function decodeHeads(grid){
+    // The heads are base64 encoded little-endian float32, or int16 values with head = offset + value * scale
+    var bytes = decodeBytes(grid.heads);
+    var heads;
+    var quantized;
+    var i;
+
+    if (grid.encoding === 'int16') {
+        quantized = new Int16Array(bytes.buffer);
+        heads = new Float64Array(quantized.length);
+        for (i = 0; i < quantized.length; i++) {
+            heads[i] = grid.offset + quantized[i] * grid.scale;
+        }
+        return heads;
+    }
+    return new Float32Array(bytes.buffer);
+}
+
+function gridToFeatures(grid){
+    // Cells are defined at the corners, the heads are stored row by row starting at the lower left cell
+    var heads = decodeHeads(grid);
+    var cellSide = grid.cellSide;
+    var features = [];
+    var long, lat;
+    var i, j;
+
+    for (j = 0; j < grid.ny; j++) {
+        lat = grid.origin[1] + j * cellSide;
+        for (i = 0; i < grid.nx; i++) {
+            long = grid.origin[0] + i * cellSide;
+            features.push({
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Polygon',
+                    'coordinates': [[[long, lat],
+                                     [long + cellSide, lat],
+                                     [long + cellSide, lat + cellSide],
+                                     [long, lat + cellSide],
+                                     [long, lat]]]
+                },
+                'properties': {
+                    'elevation': heads[j * grid.nx + i]
+                }
+            });
+        }
+    }
+    return features;
+}
+
+function quadtreeToFeatures(tree){
+    // Cell n has size cellSide / 2^level[n] and its lower left corner at origin + (i[n], j[n]) * size
+    var heads = decodeHeads(tree);
+    var level = decodeBytes(tree.level);
+    var iCell = new Uint32Array(decodeBytes(tree.i).buffer);
+    var jCell = new Uint32Array(decodeBytes(tree.j).buffer);
+    var features = [];
+    var side, long, lat;
+    var n;
+
+    for (n = 0; n < tree.cells; n++) {
+        side = tree.cellSide / Math.pow(2, level[n]);
+        long = tree.origin[0] + iCell[n] * side;
+        lat = tree.origin[1] + jCell[n] * side;
+        features.push({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[long, lat],
+                                 [long + side, lat],
+                                 [long + side, lat + side],
+                                 [long, lat + side],
+                                 [long, lat]]]
+            },
+            'properties': {
+                'elevation': heads[n]
+            }
+        });
+    }
+    return features;
+}
+
 //  #################################### Add the new water table raster to the map #####################################
 
 function addWaterTable(raster_elev,titleName){
@@ -511,7 +838,7 @@ function toggle_legend(boolean,layer){
 
 //Create public functions to be called in the controller
 var app;
-app = {dewater: dewater}
+app = {dewater: dewater, optimizePumping: optimizePumping, checkExcavation: checkExcavation, designWells: designWells}
 
 
 
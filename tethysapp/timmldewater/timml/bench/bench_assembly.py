@@ -0,0 +1,60 @@
+'''
+Matrix assembly of Model.solveNonLinear: the rows of getMatrixRows of every element, collected
+in one Python list and converted with array, against Model.assembleMatrix, which preallocates the
+(Neq,Neq+1) array and fills it per element with influences computed for all control points at once.
+The model is a river of HeadLineSinks in a three-aquifer system.
+Run from the command line: python bench_assembly.py [Nlinesinks ...]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def riverModel(Nls):
+    ml = Model(k=[2, 6, 4], zb=[140, 80, 0], zt=[165, 120, 60], c=[2000, 20000])
+    Constant(ml, 0, 3000, 175, [0])
+    xr = linspace(-5000, 5000, Nls + 1)
+    yr = 500.0 * sin(xr / 700.0)
+    for i in range(Nls):
+        HeadLineSink(ml, xr[i], yr[i], xr[i+1], yr[i+1], 170 - i * 5.0 / Nls, [0])
+    Well(ml, 0, 1000, 3000, 0.3, [1])
+    ml.collectionDict = {}
+    for e in ml.elementList: e.addElementToCollection(ml)
+    return ml
+
+def listAssembly(ml):
+    # Assembly as done previously in solveNonLinear
+    matrix = []
+    for e in ml.elementList:
+        matrix.extend(e.getMatrixRows(ml.elementList))
+    matrix = array(matrix)
+    size = shape(matrix)
+    rhs = transpose(take(matrix, range(size[1]-1, size[1]), 1))[0]
+    matrix = take(matrix, range(0, size[1]-1), 1)
+    return matrix, rhs
+
+def run(Nlslist=[100, 400, 1000]):
+    print '%8s %14s %14s %10s %12s %12s' % ('unknowns', 'list [s]', 'prealloc [s]', 'speed-up', 'solve [s]', 'max diff')
+    for Nls in Nlslist:
+        ml = riverModel(Nls)
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')  # assembleMatrix prints its progress
+        t0 = time.time()
+        matrix, rhs = listAssembly(ml)
+        tlist = time.time() - t0
+        t0 = time.time()
+        full = ml.assembleMatrix()
+        tprealloc = time.time() - t0
+        sys.stdout = stdout
+        t0 = time.time()
+        linalg.solve(full[:, :-1], full[:, -1])
+        tsolve = time.time() - t0
+        diff = max(abs(matrix - full[:, :-1]).max(), abs(rhs - full[:, -1]).max())
+        print '%8d %14.3f %14.3f %10.1f %12.3f %12.2e' % (len(rhs), tlist, tprealloc, tlist / tprealloc, tsolve, diff)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run([int(a) for a in sys.argv[1:]])
+    else:
+        run()
@@ -0,0 +1,64 @@
+'''
+Throughput of the line-sink functions of the FORTRAN extension besselaes:
+one potbeslsho/disbeslsho call per (point, line-sink) pair from Python, as in
+LineSink.potentialCollection, against the batched potbeslshocollection and
+disbeslshocollection, which loop over all points and line-sinks in one call.
+Run from the command line: python bench_besselaes.py [Npoints] [Nlinesinks]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'timml'))
+from numpy import *
+from besselaes import potbeslsho, disbeslsho, potbeslshocollection, disbeslshocollection
+
+def river(Nls):
+    # Meandering river of Nls segments
+    xr = linspace(-1000, 1000, Nls+1)
+    yr = 200.0 * sin(xr / 150.0)
+    return xr[:-1], yr[:-1], xr[1:], yr[1:]
+
+def run(Npoints=500, Nls=100):
+    random.seed(1)
+    x = random.rand(Npoints) * 2400 - 1200
+    y = random.rand(Npoints) * 1000 - 500
+    x1, y1, x2, y2 = river(Nls)
+    lab = array([0.0, 80.0, 400.0])  # Three aquifers
+    Naq = len(lab)
+    paramxcoef = random.rand(Nls, Naq)
+    Npairs = Npoints * Nls
+
+    t0 = time.time()
+    pot = zeros((Npoints, Naq), 'd'); potadd = zeros(Naq, 'd')
+    for i in range(Npoints):
+        for j in range(Nls):
+            potbeslsho(x[i], y[i], x1[j], y1[j], x2[j], y2[j], Naq, lab, 0, potadd)
+            pot[i] = pot[i] + paramxcoef[j] * potadd
+    tpot = time.time() - t0
+    t0 = time.time()
+    potb = zeros((Npoints, Naq), 'd', order='F')
+    potbeslshocollection(x, y, x1, y1, x2, y2, lab, paramxcoef, potb)
+    tpotb = time.time() - t0
+
+    t0 = time.time()
+    disx = zeros((Npoints, Naq), 'd'); disy = zeros((Npoints, Naq), 'd')
+    qx = zeros(Naq, 'd'); qy = zeros(Naq, 'd')
+    for i in range(Npoints):
+        for j in range(Nls):
+            disbeslsho(x[i], y[i], x1[j], y1[j], x2[j], y2[j], Naq, lab, 0, qx, qy)
+            disx[i] = disx[i] + paramxcoef[j] * qx
+            disy[i] = disy[i] + paramxcoef[j] * qy
+    tdis = time.time() - t0
+    t0 = time.time()
+    disxb = zeros((Npoints, Naq), 'd', order='F'); disyb = zeros((Npoints, Naq), 'd', order='F')
+    disbeslshocollection(x, y, x1, y1, x2, y2, lab, paramxcoef, disxb, disyb)
+    tdisb = time.time() - t0
+
+    print '%d points, %d line-sinks, %d aquifers' % (Npoints, Nls, Naq)
+    print '%12s %16s %16s %10s %12s' % ('', 'per pair [1/s]', 'batched [1/s]', 'speed-up', 'max diff')
+    print '%12s %16.0f %16.0f %10.1f %12.2e' % ('potential', Npairs / tpot, Npairs / tpotb, tpot / tpotb, abs(pot - potb).max())
+    print '%12s %16.0f %16.0f %10.1f %12.2e' % ('discharge', Npairs / tdis, Npairs / tdisb, tdis / tdisb,
+        max(abs(disx - disxb).max(), abs(disy - disyb).max()))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
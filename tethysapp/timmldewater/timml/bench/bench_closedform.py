@@ -0,0 +1,48 @@
+'''
+Compares the generic solve and head grid of the dewatering model (one confined aquifer,
+a Constant and wells) with the closed-form path selected by Model.isClosedForm.
+Run from the command line: python bench_closedform.py [ngrid]
+The heads are evaluated on a grid of ngrid x ngrid cells (default 300)
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def dewateringModel(Nwells):
+    ml = Model(k=[0.000231], zb=[0.0], zt=[100.0])
+    Constant(ml, 500.0, 500.0, 100.0, [0])
+    theta = arange(Nwells) * 2.0 * pi / Nwells
+    for xw, yw in zip(50.0 * cos(theta), 50.0 * sin(theta)):
+        Well(ml, xw, yw, 2.0 / Nwells, 10, 0)
+    return ml
+
+def timeModel(Nwells, closedform, xg, yg):
+    ml = dewateringModel(Nwells)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    t0 = time.time()
+    ml.solve(doIterations=True, closedform=closedform)
+    tsolve = time.time() - t0
+    sys.stdout = stdout
+    t0 = time.time()
+    h = ml.headGrid(0, xg, yg)
+    tgrid = time.time() - t0
+    return tsolve, tgrid, h
+
+def run(ngrid=300):
+    xg, yg = meshgrid(linspace(-300, 300, ngrid), linspace(-300, 300, ngrid), indexing='ij')
+    print 'Grid of %dx%d cells' % (ngrid, ngrid)
+    print '%8s %12s %12s %12s %12s %10s %12s' % ('wells', 'solve [s]', 'closed [s]', 'grid [s]', 'closed [s]', 'speed-up', 'max diff')
+    for Nwells in [8, 50, 200]:
+        tsolve, tgrid, hgeneric = timeModel(Nwells, False, xg, yg)
+        csolve, cgrid, hclosed = timeModel(Nwells, True, xg, yg)
+        print '%8d %12.4f %12.4f %12.4f %12.4f %10.1f %12.2e' % (Nwells, tsolve, csolve, tgrid, cgrid,
+            (tsolve + tgrid) / (csolve + cgrid), abs(hgeneric - hclosed).max())
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
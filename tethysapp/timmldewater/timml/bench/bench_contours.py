@@ -0,0 +1,74 @@
+'''
+Water table of the dewatering tool returned as contours instead of cells: 12 wells around an excavation of
+200 by 100 ft on a map of 1200 by 1100 ft with cells of cellSide ft. Compared are the size of the JSON (plain
+and compressed) of the cells as GeoJSON polygons, of the compact float32 grid and of the isobands of
+engine.contours between the color classes of the map, and the time of the isobands against contourf of
+matplotlib, with the largest difference of the area of a band.
+Run from the command line: python bench_contours.py [cellSide]
+'''
+
+import os, sys, time, json, zlib, base64
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from numpy import *
+import engine
+from timml.mlcontour import ringArea
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def sizes(data):
+    s = json.dumps(data)
+    return len(s), len(zlib.compress(s))
+
+def run(cellSide=5.0):
+    wXCoords = list(linspace(-20, 220, 6)) * 2; wYCoords = [-30] * 6 + [130] * 6
+    bedrock, initial, dwte = 0.0, 100.0, 70.0
+    ml = quiet(engine.solve, 0.000231, bedrock, initial, 3.0, wXCoords, wYCoords)
+    xCells = arange(-500, 700, cellSide); yCells = arange(-500, 600, cellSide)
+    x, y = meshgrid(xCells + cellSide / 2, yCells + cellSide / 2, indexing='ij')
+    heads = engine.head_grid(ml, x, y)
+    levels = [dwte + f * (dwte - bedrock) for f in (-0.375, -0.25, -0.125, 0.0, 0.125, 0.25, 0.375)]
+    levels = [heads.min()] + [v for v in levels if heads.min() < v < heads.max()] + [heads.max() + 1e-9]
+
+    cells = [{'type': 'Feature',
+              'geometry': {'type': 'Polygon', 'coordinates': [[[a, b], [a + cellSide, b], [a + cellSide, b + cellSide],
+                                                               [a, b + cellSide], [a, b]]]},
+              'properties': {'elevation': float(h)}} for a, b, h in zip(x.ravel() - cellSide / 2,
+                                                                        y.ravel() - cellSide / 2, heads.ravel())]
+    grid = base64.b64encode(heads.T.astype('<f4').tostring())
+    t0 = time.time()
+    bands = engine.contours(x, y, heads, levels)
+    tbands = time.time() - t0
+
+    print '%d by %d cells of %.1f ft, %d bands' % (x.shape + (cellSide, len(levels) - 1))
+    print '%24s %12s %12s' % ('payload', 'bytes', 'compressed')
+    for name, data in (('GeoJSON cells', cells), ('compact grid', grid), ('isobands', bands)):
+        print '%24s %12d %12d' % ((name,) + sizes(data))
+    print '%24s %10.1f ms' % ('isobands', 1000 * tbands)
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return
+    t0 = time.time()
+    contourset = plt.contourf(x, y, heads, levels)
+    tmpl = time.time() - t0
+    maxdiff = 0.0
+    for feature, collection in zip(bands['features'], contourset.collections):
+        area = sum([ringArea(array(p[0])) - sum([ringArea(array(r)) for r in p[1:]])
+                    for p in feature['geometry']['coordinates']])
+        areampl = sum([abs(ringArea(poly)) for path in collection.get_paths() for poly in path.to_polygons()[:1]])
+        areampl -= sum([abs(ringArea(poly)) for path in collection.get_paths() for poly in path.to_polygons()[1:]])
+        maxdiff = max(maxdiff, abs(area - areampl))
+    print '%24s %10.1f ms' % ('matplotlib contourf', 1000 * tmpl)
+    print '%24s %10.2e ft2' % ('max area diff', maxdiff)
+
+if __name__ == '__main__':
+    args = [float(a) for a in sys.argv[1:2]]
+    run(*args)
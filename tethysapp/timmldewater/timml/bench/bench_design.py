@@ -0,0 +1,51 @@
+'''
+Ranking of candidate rings of wells around an excavation of 200 by 100 ft by the dewatering tool: every ring
+is built and solved as a model and the water table is evaluated at the control points (engine.solve), against
+engine.rank_layouts, which sums the unit responses of all wells of all rings at the control points in one
+array. Reported are the number of rings and wells, the time of both, and the largest difference of the
+discharge per well that the rings need to lower the water table to dwte.
+Run from the command line: python bench_design.py [Noffsets] [Nspacings] [Nphases]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from numpy import *
+import engine, excavation
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Noffsets=10, Nspacings=10, Nphases=3):
+    pXCoords = [0, 200, 200, 0, 0]; pYCoords = [0, 0, 100, 100, 0]
+    k, bedrock, initial, dwte = 0.000231, 0.0, 100.0, 70.0
+    layouts = excavation.rings(pXCoords, pYCoords, linspace(10, 100, Noffsets), linspace(10, 200, Nspacings),
+                               arange(Nphases) / float(Nphases))
+    xc, yc = excavation.control_points(pXCoords, pYCoords)
+    t0 = time.time()
+    rates, order = engine.rank_layouts(k, bedrock, initial, layouts, xc, yc, dwte)
+    trank = time.time() - t0
+    # Every ring solved with a unit discharge per well: the water table is linear in the discharge
+    t0 = time.time()
+    solved = zeros(len(layouts))
+    for i, layout in enumerate(layouts):
+        nwells = len(layout['x'])
+        ml = quiet(engine.solve, k, bedrock, initial, nwells, list(layout['x']), list(layout['y']))
+        drawdown = initial - ml.headVectorArray(xc, yc)[0]
+        solved[i] = (initial - dwte) / drawdown.min() if drawdown.min() > 0 else inf
+    tsolve = time.time() - t0
+    finite = isfinite(rates)
+    print '%d rings, %d wells, %d control points' % (len(layouts), sum([len(l['x']) for l in layouts]), len(xc))
+    print '%24s %10.1f ms' % ('solve every ring', 1000 * tsolve)
+    print '%24s %10.1f ms' % ('rank_layouts', 1000 * trank)
+    print '%24s %10.2f' % ('speed-up', tsolve / trank)
+    print '%24s %10.2e' % ('max rel diff', abs(rates[finite] / solved[finite] - 1).max())
+    print '%24s %10s' % ('same unreachable', all(finite == isfinite(solved)))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    run(*args)
@@ -0,0 +1,74 @@
+'''
+Startup time and per-request overhead of the TimML engine of the dewatering tool (engine.py)
+compared with the previous controller, which imported matplotlib.pyplot through the app package,
+appended three entries to sys.path and created a Tkinter root window on every request.
+Run from the command line: python bench_engine.py [Nrequests]
+The Tkinter part is skipped when no display is available
+'''
+
+import os, sys, time, subprocess
+appdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+timmldir = os.path.join(appdir, 'timml')
+
+legacyImport = 'import matplotlib.pyplot; from timml import *'
+engineImport = 'import engine'
+
+def startupTime(statement, path, repeat=3):
+    # Import time in a fresh interpreter, best of repeat
+    code = 'import sys, time; sys.path.insert(0, %r); t0 = time.time(); %s; print time.time() - t0' % (path, statement)
+    best = 1e30
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code], stderr=open(os.devnull, 'w'))
+        best = min(best, float(out.split()[-1]))
+    return best
+
+def legacyRequest(tk):
+    sys.path.append(timmldir)
+    sys.path.append("/usr/local/lib/python2.7/dist-packages")
+    sys.path.append("/usr/lib/python2.7/dist-packages")
+    from timml import Model, Constant, Well
+    if tk is not None:
+        root = tk.Tk()
+        root.destroy()
+
+def run(Nrequests=200):
+    print 'Startup (import in a fresh interpreter, best of 3)'
+    tlegacy = startupTime(legacyImport, timmldir)
+    tengine = startupTime(engineImport, appdir)
+    print '%30s %10.3f s' % ('matplotlib.pyplot + timml', tlegacy)
+    print '%30s %10.3f s' % ('engine', tengine)
+
+    sys.path.insert(0, appdir)
+    import engine
+    try:
+        import Tkinter as tk
+        tk.Tk().destroy()
+    except Exception:
+        print 'No display available, Tkinter root window is not included'
+        tk = None
+
+    # Both request types build and solve the same model after their setup
+    wXCoords = [0.0, 50.0, 0.0, -50.0]
+    wYCoords = [50.0, 0.0, -50.0, 0.0]
+    stdout = sys.stdout
+    pathlength = len(sys.path)
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    t0 = time.time()
+    for i in range(Nrequests):
+        legacyRequest(tk)
+        engine.solve(0.000231, 0.0, 100.0, 2.0, wXCoords, wYCoords)
+    tlegacy = (time.time() - t0) / Nrequests
+    t0 = time.time()
+    for i in range(Nrequests):
+        engine.solve(0.000231, 0.0, 100.0, 2.0, wXCoords, wYCoords)
+    tengine = (time.time() - t0) / Nrequests
+    sys.stdout = stdout
+    print 'Time per request (solve of 4 wells), %d requests' % Nrequests
+    print '%30s %10.3f ms, sys.path grew by %d entries' % ('previous controller', 1000 * tlegacy, len(sys.path) - pathlength)
+    print '%30s %10.3f ms' % ('engine', 1000 * tengine)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
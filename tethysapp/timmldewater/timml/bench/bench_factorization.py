@@ -0,0 +1,76 @@
+'''
+Reuse of the LU factorization that Model.solve keeps on the model:
+- a what-if change of the discharge of a well, solved again from scratch with Model.solve and
+  with Model.resolve_rhs, which only assembles the right-hand side and uses the stored factorization
+- a change of k rows of the matrix (as for percolating ResLineSinks), solved with linalg.solve
+  and with the Sherman-Morrison-Woodbury update of Model.solveFactorized
+The model is a river of HeadLineSinks in a three-aquifer system.
+Run from the command line: python bench_factorization.py [Nlinesinks]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def riverModel(Nls):
+    ml = Model(k=[2, 6, 4], zb=[140, 80, 0], zt=[165, 120, 60], c=[2000, 20000])
+    Constant(ml, 0, 3000, 175, [0])
+    xr = linspace(-5000, 5000, Nls + 1)
+    yr = 500.0 * sin(xr / 700.0)
+    for i in range(Nls):
+        HeadLineSink(ml, xr[i], yr[i], xr[i+1], yr[i+1], 170 - i * 5.0 / Nls, [0])
+    well = Well(ml, 0, 1000, 3000, 0.3, [1])
+    return ml, well
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nls=1000):
+    ml, well = riverModel(Nls)
+    t0 = time.time()
+    quiet(ml.solve, storematrix=True)
+    tsolve = time.time() - t0
+    well.discharge = 6000.0
+    t0 = time.time()
+    quiet(ml.resolve_rhs)
+    tresolve = time.time() - t0
+    h = ml.headVector(0, 1000)
+    ref, refwell = riverModel(Nls)
+    refwell.discharge = 6000.0
+    quiet(ref.solve)
+    print '%d unknowns' % len(ml.xsol)
+    print 'Discharge of the well changed from 3000 to 6000'
+    print '%30s %10.3f s' % ('solve', tsolve)
+    print '%30s %10.3f s (max head diff %.2e)' % ('resolve_rhs', tresolve, abs(h - ref.headVector(0, 1000)).max())
+
+    print 'Rows of the matrix changed after the factorization'
+    print '%8s %16s %16s %10s %12s' % ('rows', 'linalg.solve [s]', 'Woodbury [s]', 'speed-up', 'max diff')
+    random.seed(1)
+    matrix = ml.matrix; rhs = ml.rhs
+    for k in [1, 10, 50]:
+        ml.factorize(matrix)
+        rows = random.permutation(len(rhs))[:k]
+        for i in rows:
+            ml.luRows[i] = matrix[i, :].copy()
+            matrix[i, :] = 0.0; matrix[i, i] = 1.0  # As for a percolating ResLineSink
+        t0 = time.time()
+        xsol = linalg.solve(matrix, rhs)
+        tdirect = time.time() - t0
+        t0 = time.time()
+        xwood = ml.solveFactorized(rhs)
+        twood = time.time() - t0
+        print '%8d %16.4f %16.4f %10.1f %12.2e' % (k, tdirect, twood, tdirect / twood, abs(xsol - xwood).max())
+        for i in rows:
+            matrix[i, :] = ml.luRows[i]
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,56 @@
+'''
+Grid evaluation of the head with Model.headVectorArray by direct summation over all elements
+against the far-field expansions of FarField, selected with the accuracy parameter tol, for a
+model with many wells or line-sinks in a single aquifer. Reported are the number of levels of the
+quadtree (0 means FarField chose the direct sum), the number of terms of the expansions and the
+maximum difference with the direct sum.
+Run from the command line: python bench_fmm.py [Nwells] [Nlinesinks] [Ngrid]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+from timml.mlfmm import FarField
+
+def wellFieldModel(Nw, Nls):
+    random.seed(2)
+    ml = Model(k=[10.0], zb=[0.0], zt=[50.0])
+    Constant(ml, 50000.0, 50000.0, 50.0, [0])
+    for i in range(Nw):
+        Well(ml, random.rand() * 8000 - 4000, random.rand() * 8000 - 4000, 50.0 * random.rand(), 0.3, [0])
+    xr = linspace(-5000, 5000, Nls + 1)
+    yr = 500.0 * sin(xr / 700.0)
+    for i in range(Nls):
+        HeadLineSink(ml, xr[i], yr[i], xr[i+1], yr[i+1], 45.0 - i * 0.02 / Nls, [0])
+    return ml
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nw=500, Nls=500, Ngrid=200):
+    ml = wellFieldModel(Nw, Nls)
+    quiet(ml.solve, closedform=False)
+    xg = linspace(-6000, 6000, Ngrid)
+    x, y = [a.ravel() for a in meshgrid(xg, xg)]
+    t0 = time.time()
+    hdirect = ml.headVectorArray(x, y)
+    tdirect = time.time() - t0
+    print '%d wells, %d line-sinks, %d points, direct sum %.3f s' % (Nw, Nls, len(x), tdirect)
+    print '%8s %8s %8s %12s %10s %12s' % ('tol', 'levels', 'terms', 'time [s]', 'speed-up', 'max diff')
+    for tol in [1e-4, 1e-6, 1e-8]:
+        t0 = time.time()
+        h = ml.headVectorArray(x, y, tol=tol)
+        t = time.time() - t0
+        ff = FarField(ml, ml.aq, tol)
+        ff.potentialCollectionArray(zeros((1, len(x)), 'd'), x, y)
+        print '%8.0e %8d %8d %12.3f %10.1f %12.2e' % (tol, ff.Nlevels, ff.Nterms, t, tdirect / t, abs(h - hdirect).max())
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    run(*args)
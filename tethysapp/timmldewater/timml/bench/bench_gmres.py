@@ -0,0 +1,62 @@
+'''
+Scaling of the direct solve (LU factorization) against solver='gmres' (GMRES with the block-Jacobi
+preconditioner of Model.solveIterative) for the assembled matrix of a model with N head-specified
+line-sinks: a network of meandering streams in a single aquifer, so that assembly stays cheap.
+Only the solve of the assembled matrix is timed; the matrix takes 8*N**2 bytes (0.8 GB for N=10000).
+Run from the command line: python bench_gmres.py [N ...]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def streamModel(N, Nstreams=10):
+    ml = Model(k=[10.0], zb=[0.0], zt=[50.0])
+    Constant(ml, 0.0, 20000.0, 60.0, [0])
+    Nls = N / Nstreams
+    for j in range(Nstreams):
+        xr = linspace(-10000, 10000, Nls + 1)
+        yr = j * 2000.0 - 9000.0 + 300.0 * sin(xr / 900.0 + j)
+        for i in range(Nls):
+            HeadLineSink(ml, xr[i], yr[i], xr[i+1], yr[i+1], 45.0 + 0.5 * j + i * 5.0 / Nls, [0])
+    for j in range(20):
+        Well(ml, -9500.0 + 1000.0 * j, 500.0 * (j % 3) - 500.0, 500.0, 0.3, [0])
+    return ml
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model methods print their progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nlist=[500, 1000, 2000, 4000]):
+    print '%8s %12s %12s %12s %10s %10s %12s' % ('unknowns', 'assembly [s]', 'direct [s]', 'gmres [s]', 'iterations', 'speed-up', 'max diff')
+    for N in Nlist:
+        ml = streamModel(N)
+        ml.collectionDict = {}
+        for e in ml.elementList: e.addElementToCollection(ml)
+        t0 = time.time()
+        full = quiet(ml.assembleMatrix)
+        tassembly = time.time() - t0
+        matrix = full[:, :-1]; rhs = full[:, -1].copy()
+        t0 = time.time()
+        ml.factorize(matrix)
+        xdirect = ml.solveFactorized(rhs)
+        tdirect = time.time() - t0
+        ml.lu = None
+        ml.tol = 1e-10
+        t0 = time.time()
+        xgmres = quiet(ml.solveIterative, matrix, rhs)
+        tgmres = time.time() - t0
+        print '%8d %12.2f %12.3f %12.3f %10d %10.1f %12.2e' % (len(rhs), tassembly, tdirect, tgmres, ml.iterations,
+            tdirect / tgmres, abs(xdirect - xgmres).max() / abs(xdirect).max())
+        del full, matrix
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run([int(a) for a in sys.argv[1:]])
+    else:
+        run()
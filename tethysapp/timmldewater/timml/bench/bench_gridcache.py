@@ -0,0 +1,55 @@
+'''
+Latency of moving one of 50 wells of the dewatering tool on a 300 by 300 grid: the model is built and
+solved again and the heads are evaluated on the whole grid (engine.solve and engine.head_grid), against
+the GridCache of engine.move_wells, which computes only the moved well on the grid again and superposes
+the stored grids of all wells. Reported are the median time of Nmoves moves, the time to build the cache,
+its memory and the maximum difference of the heads.
+Run from the command line: python bench_gridcache.py [Nwells] [Ngrid] [Nmoves]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from numpy import *
+import engine
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nwells=50, Ngrid=300, Nmoves=10):
+    # Wells on a ring around an excavation of 200 ft in an aquifer of 100 ft
+    random.seed(7)
+    angle = linspace(0, 2 * pi, Nwells, endpoint=False)
+    wXCoords = list(100 * cos(angle)); wYCoords = list(100 * sin(angle))
+    k, bedrock, initial, q = 0.000231, 0.0, 100.0, 2.0
+    xg, yg = meshgrid(linspace(-600, 600, Ngrid), linspace(-600, 600, Ngrid), indexing='ij')
+    t0 = time.time()
+    ml = quiet(engine.solve, k, bedrock, initial, q, wXCoords, wYCoords)
+    cache = engine.grid_cache(ml, xg, yg)
+    tcache = time.time() - t0
+    trebuild = []; tmove = []; maxdiff = 0.0
+    for i in range(Nmoves):
+        iw = random.randint(Nwells)
+        wXCoords[iw] += random.rand() * 20 - 10; wYCoords[iw] += random.rand() * 20 - 10
+        t0 = time.time()
+        hrebuild = engine.head_grid(quiet(engine.solve, k, bedrock, initial, q, wXCoords, wYCoords), xg, yg)
+        trebuild.append(time.time() - t0)
+        t0 = time.time()
+        hcache = quiet(engine.move_wells, ml, cache, q, wXCoords, wYCoords)
+        tmove.append(time.time() - t0)
+        maxdiff = max(maxdiff, abs(hcache - hrebuild).max())
+    print '%d wells, %d by %d grid, median of %d moves' % (Nwells, Ngrid, Ngrid, Nmoves)
+    print '%24s %10.1f ms' % ('rebuild', 1000 * median(trebuild))
+    print '%24s %10.1f ms' % ('grid cache', 1000 * median(tmove))
+    print '%24s %10.2f' % ('speed-up', median(trebuild) / median(tmove))
+    print '%24s %10.1f ms' % ('build cache', 1000 * tcache)
+    print '%24s %10.1f MB' % ('cache memory', cache.memory() / 1e6)
+    print '%24s %10.2e' % ('max diff', maxdiff)
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    run(*args)
@@ -0,0 +1,50 @@
+'''
+Compares the head grid of the dewatering tool computed with one ml.head call per cell
+against Model.headGrid, which evaluates all cell centers in one pass.
+Run from the command line: python bench_headgrid.py [maxloopcells]
+The per-cell loop is skipped for grids with more than maxloopcells cells (default 250000)
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def dewateringModel(Nwells=8):
+    # Same setup as the Tethys controller: one aquifer, a reference point and a ring of wells
+    ml = Model(k=[0.000231], zb=[0.0], zt=[100.0])
+    Constant(ml, 500.0, 500.0, 100.0, [0])
+    theta = arange(Nwells) * 2.0 * pi / Nwells
+    for xw, yw in zip(50.0 * cos(theta), 50.0 * sin(theta)):
+        Well(ml, xw, yw, 2.0 / Nwells, 10, 0)
+    ml.solve(doIterations=True)
+    return ml
+
+def headLoop(ml, xg, yg):
+    h = zeros(shape(xg), 'd')
+    for i in range(shape(xg)[0]):
+        for j in range(shape(xg)[1]):
+            h[i, j] = ml.head(0, xg[i, j], yg[i, j])
+    return h
+
+def run(maxloopcells=250000):
+    ml = dewateringModel()
+    print '%10s %12s %12s %10s %12s' % ('cells', 'loop [s]', 'grid [s]', 'speed-up', 'max diff')
+    for n in [50, 200, 500]:
+        xg, yg = meshgrid(linspace(-300, 300, n), linspace(-300, 300, n), indexing='ij')
+        t0 = time.time()
+        hgrid = ml.headGrid(0, xg, yg)
+        tgrid = time.time() - t0
+        if n * n <= maxloopcells:
+            t0 = time.time()
+            hloop = headLoop(ml, xg, yg)
+            tloop = time.time() - t0
+            print '%10s %12.4f %12.4f %10.1f %12.2e' % ('%dx%d' % (n, n), tloop, tgrid, tloop / tgrid, abs(hloop - hgrid).max())
+        else:
+            print '%10s %12s %12.4f %10s %12s' % ('%dx%d' % (n, n), 'skipped', tgrid, '-', '-')
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,68 @@
+'''
+Compression and accuracy of Model.solve with solver='hmatrix', which stores the matrix as a
+hierarchical matrix with low-rank blocks from adaptive cross approximation (see HMatrix), against
+the dense matrix of solver='direct', for streams of thousands of HeadLineSinks in a system of three
+aquifers with leakage factors of kilometers, so that the far field is not truncated.
+Reported are the memory of the matrix and the compression ratio, the assembly and solve times,
+the number of GMRES iterations and the maximum difference of the heads at the line-sinks with
+the direct solution (skipped when the dense matrix is larger than maxdense MB).
+Run from the command line: python bench_hmatrix.py [Nlinesinks ...]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def regionalModel(Nls):
+    # Meandering streams of 50 m long line-sinks in the top aquifer and a few wells
+    random.seed(6)
+    ml = Model(k=[2, 6, 4], zb=[140, 80, 0], zt=[165, 120, 60], c=[2000, 20000])
+    Constant(ml, 50000, 0, 175, [0])
+    Nstream = max(Nls / 100, 1)
+    for i in range(Nstream):
+        z = complex(*(random.rand(2) * 20000 - 10000))
+        angle = random.rand() * 2 * pi
+        for j in range(Nls / Nstream):
+            angle += 0.3 * random.randn()
+            znew = z + 50.0 * exp(1j * angle)
+            HeadLineSink(ml, z.real, z.imag, znew.real, znew.imag, 170 - 0.001 * j, [0])
+            z = znew
+    for i in range(Nls / 100):
+        Well(ml, random.rand() * 20000 - 10000, random.rand() * 20000 - 10000, 1000.0, 0.3, [1])
+    return ml
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nlslist=[1000, 2000, 4000], maxdense=1000.0):
+    print '%8s %10s %12s %12s %8s %14s %10s %8s %12s' % ('elements', 'unknowns', 'memory [MB]', 'dense [MB]', 'ratio',
+        'assembly [s]', 'solve [s]', 'GMRES', 'max diff')
+    for Nls in Nlslist:
+        ml = regionalModel(Nls)
+        quiet(ml.solve, solver='hmatrix', storematrix=True)
+        x = array([e.xc for e in ml.elementList if isinstance(e, HeadLineSink)])
+        y = array([e.yc for e in ml.elementList if isinstance(e, HeadLineSink)])
+        hcompressed = ml.headVectorArray(x, y)
+        nbytes, densebytes = ml.matrix.memory()
+        hmatrix = '%8d %10d %12.1f %12.1f %8.1f' % (len(ml.elementList), len(ml.rhs), nbytes / 1e6, densebytes / 1e6,
+            float(densebytes) / nbytes) + ' %14.2f %10.2f %8d' % (ml.assemblyTime, ml.solveTime, ml.iterations)
+        if densebytes / 1e6 > maxdense:
+            print hmatrix
+            continue
+        ml = regionalModel(Nls)
+        quiet(ml.solve, solver='direct')
+        hdirect = ml.headVectorArray(x, y)
+        print hmatrix + ' %12.2e' % abs(hcompressed - hdirect).max()
+        print '%8s %10s %12s %12s %8s %14.2f %10.2f' % ('', 'direct', '', '', '', ml.assemblyTime, ml.solveTime)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run([int(a) for a in sys.argv[1:]])
+    else:
+        run()
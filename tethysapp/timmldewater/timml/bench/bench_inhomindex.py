@@ -0,0 +1,69 @@
+'''
+Lookup of the AquiferData of points in a model with N polygon inhomogeneities:
+- one point at a time, with the loop over inhomList of all inhomogeneities (as done previously)
+  and with Aquifer.findAquiferData, which only tests the inhomogeneities of the cell of its
+  uniform grid index
+- all points at once, with Aquifer.findAquiferDataArray, and for a grid that was rasterized
+  before with Aquifer.findAquiferDataGrid
+Run from the command line: python bench_inhomindex.py [Ninhoms ...]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def patchModel(Ninhom):
+    # Polygons of random shape scattered over a 10 by 10 km area
+    random.seed(3)
+    ml = Model(k=[10.0, 5.0], zb=[0.0, -30.0], zt=[20.0, -10.0], c=[100.0])
+    for i in range(Ninhom):
+        xc, yc = random.rand(2) * 10000
+        n = random.randint(3, 12)
+        theta = sort(random.rand(n)) * 2 * pi
+        r = 100 + 400 * random.rand(n)
+        PolygonInhom(ml, [5.0, 5.0], [0.0, -30.0], [20.0, -10.0], [200.0], zip(xc + r * cos(theta), yc + r * sin(theta)))
+    return ml
+
+def linearLookup(aq, x, y):
+    # Lookup as done previously in Aquifer.findAquiferData
+    for inhom in aq.inhomList:
+        if inhom.isInside(x, y):
+            return inhom
+    return aq
+
+def run(Ninhomlist=[10, 50, 200, 1000], Npoints=5000, Ngrid=200):
+    random.seed(4)
+    x = random.rand(Npoints) * 11000 - 500
+    y = random.rand(Npoints) * 11000 - 500
+    xg, yg = meshgrid(linspace(-500, 10500, Ngrid), linspace(-500, 10500, Ngrid))
+    print '%d points one at a time and all at once; grid of %d points' % (Npoints, xg.size)
+    print '%8s %14s %14s %14s %14s %14s' % ('inhoms', 'linear [1/s]', 'index [1/s]', 'array [1/s]', 'grid [1/s]', 'rasterized [1/s]')
+    for Ninhom in Ninhomlist:
+        ml = patchModel(Ninhom)
+        aq = ml.aq
+        t0 = time.time()
+        ref = [linearLookup(aq, x[i], y[i]) for i in range(Npoints)]
+        tlinear = time.time() - t0
+        t0 = time.time()
+        found = [aq.findAquiferData(x[i], y[i]) for i in range(Npoints)]
+        tindex = time.time() - t0
+        t0 = time.time()
+        aqlist, iaq = aq.findAquiferDataArray(x, y)
+        tarray = time.time() - t0
+        assert all([a is b for a, b in zip(ref, found)]), 'findAquiferData differs from the linear lookup'
+        assert all([aqlist[i] is a for i, a in zip(iaq, ref)]), 'findAquiferDataArray differs from the linear lookup'
+        t0 = time.time()
+        aq.findAquiferDataGrid(xg, yg)
+        tgrid = time.time() - t0
+        t0 = time.time()
+        aq.findAquiferDataGrid(xg, yg)
+        traster = time.time() - t0
+        print '%8d %14.0f %14.0f %14.0f %14.0f %14.0f' % (Ninhom, Npoints / tlinear, Npoints / tindex, Npoints / tarray,
+            xg.size / tgrid, xg.size / traster)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run([int(a) for a in sys.argv[1:]])
+    else:
+        run()
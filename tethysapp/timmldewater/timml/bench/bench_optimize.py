@@ -0,0 +1,46 @@
+'''
+Time of engine.optimize_rates, which computes the discharges of the wells of the dewatering tool that keep
+the water table at the control points of the excavation at or below the desired elevation with a linear
+program, against one solve of the model with a 300 by 300 grid of heads (a manual try of a total discharge),
+for a rectangular excavation surrounded by a ring of Nwells wells. Reported are the times, the total and
+largest discharge for both objectives and the highest head at the control points for those discharges.
+Run from the command line: python bench_optimize.py [Nwells] [Ngrid]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from numpy import *
+import engine, excavation
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nwells=20, Ngrid=300):
+    k, bedrock, initial, q, dwte = 0.000231, 0.0, 100.0, 2.0, 70.0
+    pXCoords = [-100, 100, 100, -100, -100]; pYCoords = [-60, -60, 60, 60, -60]
+    angle = linspace(0, 2 * pi, Nwells, endpoint=False)
+    wXCoords = list(150 * cos(angle)); wYCoords = list(100 * sin(angle))
+    xc, yc = excavation.control_points(pXCoords, pYCoords)
+    xg, yg = meshgrid(linspace(-600, 600, Ngrid), linspace(-600, 600, Ngrid), indexing='ij')
+    t0 = time.time()
+    engine.head_grid(quiet(engine.solve, k, bedrock, initial, q, wXCoords, wYCoords), xg, yg)
+    print '%d wells, %d control points, %d by %d grid' % (Nwells, len(xc), Ngrid, Ngrid)
+    print '%12s %12s %12s %12s %14s' % ('', 'time [ms]', 'total Q', 'largest Q', 'highest head')
+    print '%12s %12.1f' % ('manual try', 1000 * (time.time() - t0))
+    for objective in engine.OBJECTIVES:
+        t0 = time.time()
+        ml = quiet(engine.solve, k, bedrock, initial, q, wXCoords, wYCoords)
+        rates, message = quiet(engine.optimize_rates, ml, xc, yc, dwte, objective)
+        t = time.time() - t0
+        ml = quiet(engine.solve, k, bedrock, initial, q, wXCoords, wYCoords, rates=rates)
+        print '%12s %12.1f %12.4f %12.4f %14.6f' % (objective, 1000 * t, sum(rates), max(rates),
+            ml.headVectorArray(xc, yc)[0].max())
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,48 @@
+'''
+Matrix assembly of Model.solve with 1 to N worker processes (the workers argument of solve),
+against the factorization, for a river of HeadLineSinks in a three-aquifer system with a
+polygonal inhomogeneity, whose line-doublets fill their rows with getMatrixRows.
+Run from the command line: python bench_parallel_assembly.py [Nworkers] [Nlinesinks]
+'''
+
+import os, sys, time, multiprocessing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def riverModel(Nls):
+    ml = Model(k=[2, 6, 4], zb=[140, 80, 0], zt=[165, 120, 60], c=[2000, 20000])
+    Constant(ml, 0, 3000, 175, [0])
+    xr = linspace(-5000, 5000, Nls + 1)
+    yr = 500.0 * sin(xr / 700.0)
+    for i in range(Nls):
+        HeadLineSink(ml, xr[i], yr[i], xr[i+1], yr[i+1], 170 - i * 5.0 / Nls, [0])
+    Well(ml, 0, 1500, 3000, 0.3, [1])
+    xy = [(-2000, -3000), (2000, -3000), (2000, -1500), (-2000, -1500)]
+    PolygonInhom(ml, [4, 6, 4], [140, 80, 0], [165, 120, 60], [500, 20000], xy)
+    MakeInhomPolySide(ml, xy, 2, True)
+    return ml
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nworkers=multiprocessing.cpu_count(), Nls=400):
+    print '%d cores' % multiprocessing.cpu_count()
+    print '%8s %10s %14s %10s %12s %12s' % ('workers', 'unknowns', 'assembly [s]', 'speed-up', 'solve [s]', 'max diff')
+    workers = sorted(set([1, 2, 4, 8, 16, 32, Nworkers]))
+    for n in [w for w in workers if w <= Nworkers]:
+        ml = riverModel(Nls)
+        quiet(ml.solve, storematrix=True, workers=n)
+        if n == 1:
+            t1 = ml.assemblyTime; ref = ml.matrix
+        print '%8d %10d %14.3f %10.2f %12.3f %12.2e' % (n, len(ml.rhs), ml.assemblyTime, t1 / ml.assemblyTime,
+            ml.solveTime, abs(ml.matrix - ref).max())
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,50 @@
+'''
+Speed-up of Model.evaluate_grid with 1 to N worker processes, for the grid of heads of a model
+with a river of HeadLineSinks and a few wells in a three-aquifer system. Every worker gets the
+solved model once, when the pool is started; the time includes starting the pool.
+Run from the command line: python bench_parallel_grid.py [Nworkers] [Ngrid] [Nlinesinks]
+'''
+
+import os, sys, time, multiprocessing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def riverModel(Nls):
+    ml = Model(k=[2, 6, 4], zb=[140, 80, 0], zt=[165, 120, 60], c=[2000, 20000])
+    Constant(ml, 0, 3000, 175, [0])
+    xr = linspace(-5000, 5000, Nls + 1)
+    yr = 500.0 * sin(xr / 700.0)
+    for i in range(Nls):
+        HeadLineSink(ml, xr[i], yr[i], xr[i+1], yr[i+1], 170 - i * 5.0 / Nls, [0])
+    for j in range(5):
+        Well(ml, -4000.0 + 2000.0 * j, 1500.0, 1000.0, 0.3, [1])
+    return ml
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nworkers=multiprocessing.cpu_count(), Ngrid=200, Nls=100):
+    ml = riverModel(Nls)
+    quiet(ml.solve)
+    xg, yg = meshgrid(linspace(-6000, 6000, Ngrid), linspace(-3000, 3000, Ngrid))
+    print 'Grid of %d points, %d aquifers, %d elements, %d cores' % (xg.size, ml.aq.Naquifers, len(ml.elementList),
+                                                                    multiprocessing.cpu_count())
+    print '%8s %10s %10s %12s' % ('workers', 'time [s]', 'speed-up', 'max diff')
+    workers = sorted(set([1, 2, 4, 8, 16, 32, Nworkers]))
+    for n in [w for w in workers if w <= Nworkers]:
+        t0 = time.time()
+        h = ml.evaluate_grid(xg, yg, workers=n)
+        t = time.time() - t0
+        if n == 1:
+            t1 = t; href = h
+        print '%8d %10.3f %10.2f %12.2e' % (n, t, t1 / t, abs(h - href).max())
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    run(*args)
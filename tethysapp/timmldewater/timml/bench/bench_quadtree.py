@@ -0,0 +1,57 @@
+'''
+Adaptive grid of the water table of the dewatering tool (engine.adaptive_grid, a QuadTree) against uniform grids:
+12 wells around an excavation of 200 by 100 ft on a map of 2000 by 2000 ft. The heads are interpolated bilinearly
+from the corners of the cells at Npoints random points and compared with the heads of the model. The uniform cell
+size is halved until its error is at most the error of the adaptive grid. Reported are the number of cells, the
+number of evaluated heads, the time and the largest interpolation error of every grid.
+Run from the command line: python bench_quadtree.py [tol] [maxLevel] [Npoints]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from numpy import *
+import engine
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def uniform(ml, xmin, ymin, side, n, x, y):
+    '''Returns the largest error of bilinear interpolation at x, y from a uniform grid of n by n cells, the number
+    of evaluated heads and the time'''
+    t0 = time.time()
+    xg, yg = meshgrid(xmin + arange(n + 1) * side, ymin + arange(n + 1) * side, indexing='ij')
+    hg = engine.head_grid(ml, xg, yg)
+    t = time.time() - t0
+    i = minimum(floor((x - xmin) / side).astype(int), n - 1); j = minimum(floor((y - ymin) / side).astype(int), n - 1)
+    u = (x - xmin) / side - i; v = (y - ymin) / side - j
+    h = (1-u)*(1-v)*hg[i,j] + u*(1-v)*hg[i+1,j] + u*v*hg[i+1,j+1] + (1-u)*v*hg[i,j+1]
+    return abs(h - ml.headVectorArray(x, y)[0]).max(), hg.size, t
+
+def run(tol=2.0, maxLevel=5, Npoints=20000):
+    wXCoords = list(linspace(-20, 220, 6)) * 2; wYCoords = [-30] * 6 + [130] * 6
+    ml = quiet(engine.solve, 0.000231, 0.0, 100.0, 3.0, wXCoords, wYCoords)
+    xmin, ymin, width, ncoarse = -900.0, -950.0, 2000.0, 8
+    random.seed(11)
+    x = xmin + width * random.rand(Npoints); y = ymin + width * random.rand(Npoints)
+    t0 = time.time()
+    tree = engine.adaptive_grid(ml, xmin, ymin, width / ncoarse, ncoarse, ncoarse, tol, maxLevel)
+    tadaptive = time.time() - t0
+    error = abs(tree.interpolate(x, y) - ml.headVectorArray(x, y)[0]).max()
+    print 'tol %.2f ft, %d levels, %d random points' % (tol, maxLevel, Npoints)
+    print '%24s %10s %10s %10s %12s' % ('grid', 'cells', 'heads', 'time', 'max error')
+    print '%24s %10d %10d %7.1f ms %12.3e' % ('adaptive', len(tree.level), tree.Nevaluated, 1000 * tadaptive, error)
+    n = ncoarse
+    while True:
+        uerror, nheads, t = uniform(ml, xmin, ymin, width / n, n, x, y)
+        print '%24s %10d %10d %7.1f ms %12.3e' % ('uniform %.1f ft' % (width / n), n * n, nheads, 1000 * t, uerror)
+        if uerror <= error or n >= ncoarse * 2**(maxLevel + 2): break
+        n = 2 * n
+
+if __name__ == '__main__':
+    args = [float(a) for a in sys.argv[1:2]] + [int(a) for a in sys.argv[2:4]]
+    run(*args)
@@ -0,0 +1,96 @@
+'''
+Memory and time of Model.solve with solver='sparse', which stores the near field of the matrix
+in a sparse matrix and the far field as multipole expansions (see NearFarMatrix), against the
+dense matrix of solver='direct', for a synthetic system of five leaky aquifers over 20 by 20 km
+with streams of thousands of HeadLineSinks and a few hundred wells. Reported are the memory of the matrix,
+the assembly and solve times, the number of GMRES iterations and the maximum difference of the
+heads at the line-sinks with the direct solution (skipped when the dense matrix is larger than
+maxdense MB). First, check compares the heads with the direct solution for a model with fewer
+elements than a leaf of the tree, which has no far field.
+Run from the command line: python bench_sparse.py [Nlinesinks ...]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from numpy import *
+from timml import *
+
+def leakyModel(Nls):
+    # Leakage factors between about 40 and 200 m; meandering streams of 50 m long line-sinks, in the
+    # top three aquifers, and one well for every ten line-sinks
+    random.seed(5)
+    ml = Model(k=[10, 20, 5, 15, 8], zb=[80, 50, 30, 10, -20], zt=[100, 75, 45, 25, 5], c=[50, 80, 40, 60])
+    Constant(ml, 50000, 0, 95, [0])
+    Nstream = max(Nls / 100, 1)
+    for i in range(Nstream):
+        z = complex(*(random.rand(2) * 20000 - 10000))
+        angle = random.rand() * 2 * pi
+        layer = random.randint(0, 3)
+        for j in range(Nls / Nstream):
+            angle += 0.3 * random.randn()
+            znew = z + 50.0 * exp(1j * angle)
+            HeadLineSink(ml, z.real, z.imag, znew.real, znew.imag, 90 + 0.001 * j, [layer])
+            z = znew
+    for i in range(Nls / 10):
+        Well(ml, random.rand() * 20000 - 10000, random.rand() * 20000 - 10000, 300.0, 0.3, [random.randint(0, 5)])
+    return ml
+
+def smallModel():
+    # The three aquifers, wells and area sink of timmltest.py with a single stream
+    ml = Model(k=[2, 6, 4], zb=[140, 80, 0], zt=[165, 120, 60], c=[2000, 20000])
+    Constant(ml, 20000, 20000, 175, [0])
+    CircAreaSink(ml, 10000, 10000, 15000, 0.0002, [0])
+    Well(ml, 10000, 8000, 3000, .3, [1])
+    Well(ml, 12000, 8000, 5000, .3, [2])
+    Well(ml, 10000, 4600, 5000, .3, [1, 2])
+    xy = [(9510, 19466), (12620, 17376), (12753, 14976), (13020, 12176), (15066, 9466), (16443, 7910), (17510, 5286)]
+    for (x1, y1), (x2, y2), h in zip(xy[:-1], xy[1:], range(170, 158, -2)):
+        HeadLineSink(ml, x1, y1, x2, y2, h, [0])
+    return ml
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nlslist=[1000, 2000, 4000], maxdense=1000.0):
+    print '%8s %10s %12s %12s %14s %10s %10s %12s' % ('elements', 'unknowns', 'memory [MB]', 'dense [MB]',
+        'assembly [s]', 'solve [s]', 'GMRES', 'max diff')
+    for Nls in Nlslist:
+        ml = leakyModel(Nls)
+        quiet(ml.solve, solver='sparse', storematrix=True)
+        x = array([e.xc for e in ml.elementList if isinstance(e, HeadLineSink)])
+        y = array([e.yc for e in ml.elementList if isinstance(e, HeadLineSink)])
+        hsparse = ml.headVectorArray(x, y)
+        nearbytes, farbytes, densebytes = ml.matrix.memory()
+        row = (len(ml.elementList), len(ml.rhs), (nearbytes + farbytes) / 1e6, densebytes / 1e6)
+        sparse = '%8d %10d %12.1f %12.1f' % row + ' %14.2f %10.2f %10d' % (ml.assemblyTime, ml.solveTime, ml.iterations)
+        if densebytes / 1e6 > maxdense:
+            print sparse
+            continue
+        ml = leakyModel(Nls)
+        quiet(ml.solve, solver='direct')
+        hdirect = ml.headVectorArray(x, y)
+        print sparse + ' %12.2e' % abs(hsparse - hdirect).max()
+        print '%8s %10s %12s %12s %14.2f %10.2f %10s' % ('', 'direct', '', '', ml.assemblyTime, ml.solveTime, '')
+
+def check(tol=1e-8):
+    x, y = [a.ravel() for a in meshgrid(linspace(0, 20000, 21), linspace(0, 20000, 21))]
+    heads = []
+    for solver in ['direct', 'sparse']:
+        ml = smallModel()
+        quiet(ml.solve, solver=solver)
+        heads.append(ml.headVectorArray(x, y))
+    maxdiff = abs(heads[1] - heads[0]).max()
+    print '%d elements, max diff of sparse and direct %.2e' % (len(ml.elementList), maxdiff)
+    assert maxdiff < tol, 'solver sparse differs from direct'
+
+if __name__ == '__main__':
+    check()
+    if len(sys.argv) > 1:
+        run([int(a) for a in sys.argv[1:]])
+    else:
+        run()
@@ -0,0 +1,56 @@
+'''
+Latency of changing the discharges of 50 wells of the dewatering tool on a 300 by 300 grid: the model is
+built and solved again and the heads are evaluated on the whole grid (engine.solve and engine.head_grid),
+against the UnitResponse of engine.unit_response, which evaluates any discharges of the wells as one
+matrix-vector product. Half of the changes scale the total discharge and half set a different discharge
+for every well. Reported are the median time of Nchanges changes, the time to compute the unit responses,
+their memory and the maximum difference of the heads.
+Run from the command line: python bench_unitresponse.py [Nwells] [Ngrid] [Nchanges]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from numpy import *
+import engine
+
+def quiet(func, *args, **kwargs):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # Model.solve prints its progress
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def run(Nwells=50, Ngrid=300, Nchanges=10):
+    # Wells on a ring around an excavation of 200 ft in an aquifer of 100 ft
+    random.seed(8)
+    angle = linspace(0, 2 * pi, Nwells, endpoint=False)
+    wXCoords = list(100 * cos(angle)); wYCoords = list(100 * sin(angle))
+    k, bedrock, initial, q = 0.000231, 0.0, 100.0, 2.0
+    xg, yg = meshgrid(linspace(-600, 600, Ngrid), linspace(-600, 600, Ngrid), indexing='ij')
+    t0 = time.time()
+    ml = quiet(engine.solve, k, bedrock, initial, q, wXCoords, wYCoords)
+    response = quiet(engine.unit_response, ml, engine.grid_cache(ml, xg, yg))
+    tresponse = time.time() - t0
+    trebuild = []; tchange = []; maxdiff = 0.0
+    for i in range(Nchanges):
+        q = 1.0 + 2.0 * random.rand()
+        rates = None if i % 2 == 0 else list(q / Nwells * (0.5 + random.rand(Nwells)))
+        t0 = time.time()
+        hrebuild = engine.head_grid(quiet(engine.solve, k, bedrock, initial, q, wXCoords, wYCoords, rates=rates), xg, yg)
+        trebuild.append(time.time() - t0)
+        t0 = time.time()
+        hresponse = engine.pumping_heads(response, q, rates)
+        tchange.append(time.time() - t0)
+        maxdiff = max(maxdiff, abs(hresponse - hrebuild).max())
+    print '%d wells, %d by %d grid, median of %d changes of the discharges' % (Nwells, Ngrid, Ngrid, Nchanges)
+    print '%24s %10.1f ms' % ('rebuild', 1000 * median(trebuild))
+    print '%24s %10.1f ms' % ('unit responses', 1000 * median(tchange))
+    print '%24s %10.2f' % ('speed-up', median(trebuild) / median(tchange))
+    print '%24s %10.1f ms' % ('compute responses', 1000 * tresponse)
+    print '%24s %10.1f MB' % ('memory', response.responses.nbytes / 1e6)
+    print '%24s %10.2e' % ('max diff', maxdiff)
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    run(*args)
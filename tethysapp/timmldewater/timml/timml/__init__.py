@@ -26,7 +26,35 @@ from mlpolyareasink import PolyAreaSink
 from mlinhom import MakeInhomPolySide, MakeInhomogeneity
 from mlcircinhom import CircleInhom
 from mltrace import traceline
-from mlutil import timcontour, timlayout, timtracelines, timvertcontour, capturezone
+from mlgridcache import GridCache, UnitResponse
+from mlquadtree import QuadTree
+from mlcontour import isolines, isobands, isolinesGeoJSON, isobandsGeoJSON
+
+# The plotting functions import matplotlib.pyplot from mlutil on first use, so the
+# model classes can be imported without matplotlib or a GUI toolkit
+def timcontour(*args, **kwargs):
+    if not kwargs.pop('plot', True):
+        # Contours as coordinates, without matplotlib
+        import mlcontour
+        return mlcontour.timcontour(*args, **kwargs)
+    import mlutil
+    return mlutil.timcontour(*args, **kwargs)
+
+def timlayout(*args, **kwargs):
+    import mlutil
+    return mlutil.timlayout(*args, **kwargs)
+
+def timtracelines(*args, **kwargs):
+    import mlutil
+    return mlutil.timtracelines(*args, **kwargs)
+
+def timvertcontour(*args, **kwargs):
+    import mlutil
+    return mlutil.timvertcontour(*args, **kwargs)
+
+def capturezone(*args, **kwargs):
+    import mlutil
+    return mlutil.capturezone(*args, **kwargs)
 
 # Matlab utilities and some other ones
 # from mlutilities import *
@@ -41,7 +41,8 @@ subroutine potbeslsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rv)
     real*8, dimension(Naquifers) :: lambda
     ! integer, parameter :: Nmax = 50
     ! real*8, dimension(0:Nmax) :: rRange  ! Maximum order set to 50 (like you ever want that!)
-    real*8, dimension(0:Nterms,0:Nterms) :: rbinom
+    real*8, dimension(0:Nterms,0:Nterms), save :: rbinom
+    logical, save :: binomdone = .false.
 
     ! Coefficients of Table 1
     ac(0) = -0.500004211065677e0;   bc(0) = 0.115956920789028e0
@@ -62,12 +63,15 @@ subroutine potbeslsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rv)
         lambda(1:Naquifers-1) = lambdain(2:Naquifers)
     end if
 
-    ! Precompute binomials
-    do n=0,Nterms
-        do m=0,Nterms
-            rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+    ! Precompute binomials; they are the same in every call
+    if (.not. binomdone) then
+        do n=0,Nterms
+            do m=0,Nterms
+                rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+            end do
         end do
-    end do
+        binomdone = .true.
+    end if
 
     zin = cmplx(x,y,8); z1in = cmplx(x1in,y1in,8); z2in = cmplx(x2in,y2in,8)
     Lin = abs(z2in-z1in)
@@ -148,7 +152,8 @@ subroutine disbeslsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rvx,rvy)
 
     real*8, dimension(0:Nterms) :: ac,bc
     real*8, dimension(Naquifers) :: lambda
-    real*8, dimension(0:Nterms,0:Nterms) :: rbinom
+    real*8, dimension(0:Nterms,0:Nterms), save :: rbinom
+    logical, save :: binomdone = .false.
 
     ! Coefficients of Table 1
     ac(0) = -0.500004211065677e0;   bc(0) = 0.115956920789028e0
@@ -169,12 +174,15 @@ subroutine disbeslsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rvx,rvy)
         lambda(1:Naquifers-1) = lambdain(2:Naquifers)
     end if
 
-    ! Precompute binomials
-    do n=0,Nterms
-        do m=0,Nterms
-            rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+    ! Precompute binomials; they are the same in every call
+    if (.not. binomdone) then
+        do n=0,Nterms
+            do m=0,Nterms
+                rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+            end do
         end do
-    end do
+        binomdone = .true.
+    end if
 
     zin = cmplx(x,y,8); z1in = cmplx(x1in,y1in,8); z2in = cmplx(x2in,y2in,8)
     Lin = abs(z2in-z1in)
@@ -260,7 +268,8 @@ subroutine potbesonlylsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambda,order,rv)
     complex*16 :: pcor, comega
 
     real*8, dimension(0:Nterms) :: ac,bc
-    real*8, dimension(0:Nterms,0:Nterms) :: rbinom
+    real*8, dimension(0:Nterms,0:Nterms), save :: rbinom
+    logical, save :: binomdone = .false.
 
     ! Coefficients of Table 1
     ac(0) = -0.500004211065677e0;   bc(0) = 0.115956920789028e0
@@ -276,12 +285,15 @@ subroutine potbesonlylsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambda,order,rv)
     ! Radius of convergence
     Rconv = 7.0
 
-    ! Precompute binomials
-    do n=0,Nterms
-        do m=0,Nterms
-            rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+    ! Precompute binomials; they are the same in every call
+    if (.not. binomdone) then
+        do n=0,Nterms
+            do m=0,Nterms
+                rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+            end do
         end do
-    end do
+        binomdone = .true.
+    end if
 
     zin = cmplx(x,y,8); z1in = cmplx(x1in,y1in,8); z2in = cmplx(x2in,y2in,8)
     Lin = abs(z2in-z1in)
@@ -346,7 +358,8 @@ subroutine disbesonlylsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambda,order,rvx,rvy
     complex*16 :: pcor, wdis, cdum
 
     real*8, dimension(0:Nterms) :: ac,bc
-    real*8, dimension(0:Nterms,0:Nterms) :: rbinom
+    real*8, dimension(0:Nterms,0:Nterms), save :: rbinom
+    logical, save :: binomdone = .false.
 
     ! Coefficients of Table 1
     ac(0) = -0.500004211065677e0;   bc(0) = 0.115956920789028e0
@@ -362,12 +375,15 @@ subroutine disbesonlylsho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambda,order,rvx,rvy
     ! Radius of convergence
     Rconv = 7.0
 
-    ! Precompute binomials
-    do n=0,Nterms
-        do m=0,Nterms
-            rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+    ! Precompute binomials; they are the same in every call
+    if (.not. binomdone) then
+        do n=0,Nterms
+            do m=0,Nterms
+                rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+            end do
         end do
-    end do
+        binomdone = .true.
+    end if
 
     zin = cmplx(x,y,8); z1in = cmplx(x1in,y1in,8); z2in = cmplx(x2in,y2in,8)
     Lin = abs(z2in-z1in)
@@ -652,7 +668,8 @@ subroutine potbesldho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rv)
 
     real*8, dimension(0:Nterms) :: ac,bc
     real*8, dimension(Naquifers) :: lambda
-    real*8, dimension(0:Nterms,0:Nterms) :: rbinom
+    real*8, dimension(0:Nterms,0:Nterms), save :: rbinom
+    logical, save :: binomdone = .false.
 
     ! Coefficients of K1
     ac(0) = 0.250000197208863e0;   bc(0) = -0.307966963840932e0  
@@ -673,12 +690,15 @@ subroutine potbesldho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rv)
         lambda(1:Naquifers-1) = lambdain(2:Naquifers)
     end if
 
-    ! Precompute binomials
-    do n=0,Nterms
-        do m=0,Nterms
-            rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+    ! Precompute binomials; they are the same in every call
+    if (.not. binomdone) then
+        do n=0,Nterms
+            do m=0,Nterms
+                rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+            end do
         end do
-    end do
+        binomdone = .true.
+    end if
 
     zin = cmplx(x,y,8); z1in = cmplx(x1in,y1in,8); z2in = cmplx(x2in,y2in,8)
     Lin = abs(z2in-z1in)
@@ -766,7 +786,8 @@ subroutine disbesldho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rvx,rvy)
 
     real*8, dimension(0:Nterms) :: ac,bc
     real*8, dimension(Naquifers) :: lambda
-    real*8, dimension(0:Nterms,0:Nterms) :: rbinom
+    real*8, dimension(0:Nterms,0:Nterms), save :: rbinom
+    logical, save :: binomdone = .false.
 
     ! Coefficients of K1
     ac(0) = 0.250000197208863e0;   bc(0) = -0.307966963840932e0  
@@ -787,12 +808,15 @@ subroutine disbesldho(x,y,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rvx,rvy)
         lambda(1:Naquifers-1) = lambdain(2:Naquifers)
     end if
 
-    ! Precompute binomials
-    do n=0,Nterms
-        do m=0,Nterms
-            rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+    ! Precompute binomials; they are the same in every call
+    if (.not. binomdone) then
+        do n=0,Nterms
+            do m=0,Nterms
+                rbinom(n,m) = product(rRange(m+1:n)) / product(rRange(1:n-m))
+            end do
         end do
-    end do
+        binomdone = .true.
+    end if
 
     zin = cmplx(x,y,8); z1in = cmplx(x1in,y1in,8); z2in = cmplx(x2in,y2in,8)
     Lin = abs(z2in-z1in)
@@ -1497,6 +1521,199 @@ subroutine IntegralLapLineDipoleDis(zin,z1,z2,del0,ra,order,rbinom,Nterms,wdis)
     
 end subroutine IntegralLapLineDipoleDis
 
+! Batched versions of the line-sink functions, which loop over many evaluation points
+! and line-sinks in one call. Results are stored with the points (or line-sinks) along
+! the first dimension so that numpy arrays of shape (Naquifers,Np) can be passed transposed
+
+subroutine potbeslshomatrix(Np,x,y,Nls,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rv)
+
+    ! Input:
+    !   Np: Number of points
+    !   x(Np),y(Np): Points where potential is computed
+    !   Nls: Number of line-sinks
+    !   x1in(Nls),y1in(Nls): Begin points of line-sinks
+    !   x2in(Nls),y2in(Nls): End points of line-sinks
+    !   Naquifers: Number of aquifers
+    !   lambdain(Naquifers): Array with zero in first spot and lambda's in remaining spots
+    !   order: Order of the line-sinks
+    ! Output:
+    !   rv(Np,Nls,Naquifers): Potentials as returned by potbeslsho for every point and line-sink
+
+    implicit none
+    ! Input / Output
+    integer, intent(in) :: Np, Nls, Naquifers, order
+    real*8, intent(in) :: x(Np), y(Np), x1in(Nls), y1in(Nls), x2in(Nls), y2in(Nls)
+    real*8, intent(in) :: lambdain(Naquifers)
+    real*8, intent(out) :: rv(Np,Nls,Naquifers)
+
+    ! Locals
+    integer :: i, j
+    real*8 :: pot(Naquifers)
+
+    do j=1,Nls
+        do i=1,Np
+            call potbeslsho(x(i),y(i),x1in(j),y1in(j),x2in(j),y2in(j),Naquifers,lambdain,order,pot)
+            rv(i,j,:) = pot
+        end do
+    end do
+
+end subroutine potbeslshomatrix
+
+subroutine disbeslshomatrix(Np,x,y,Nls,x1in,y1in,x2in,y2in,Naquifers,lambdain,order,rvx,rvy)
+
+    ! Input:
+    !   Same as potbeslshomatrix
+    ! Output:
+    !   rvx(Np,Nls,Naquifers),rvy(Np,Nls,Naquifers): Discharges as returned by disbeslsho
+    !                                                for every point and line-sink
+
+    implicit none
+    ! Input / Output
+    integer, intent(in) :: Np, Nls, Naquifers, order
+    real*8, intent(in) :: x(Np), y(Np), x1in(Nls), y1in(Nls), x2in(Nls), y2in(Nls)
+    real*8, intent(in) :: lambdain(Naquifers)
+    real*8, intent(out) :: rvx(Np,Nls,Naquifers), rvy(Np,Nls,Naquifers)
+
+    ! Locals
+    integer :: i, j
+    real*8 :: disx(Naquifers), disy(Naquifers)
+
+    do j=1,Nls
+        do i=1,Np
+            call disbeslsho(x(i),y(i),x1in(j),y1in(j),x2in(j),y2in(j),Naquifers,lambdain,order,disx,disy)
+            rvx(i,j,:) = disx
+            rvy(i,j,:) = disy
+        end do
+    end do
+
+end subroutine disbeslshomatrix
+
+subroutine potbeslshocollection(Np,x,y,Nls,x1in,y1in,x2in,y2in,Naquifers,lambdain,paramxcoef,potsum)
+
+    ! Input:
+    !   Np: Number of points
+    !   x(Np),y(Np): Points where potential is computed
+    !   Nls: Number of line-sinks of order 0
+    !   x1in(Nls),y1in(Nls): Begin points of line-sinks
+    !   x2in(Nls),y2in(Nls): End points of line-sinks
+    !   Naquifers: Number of aquifers
+    !   lambdain(Naquifers): Array with zero in first spot and lambda's in remaining spots
+    !   paramxcoef(Nls,Naquifers): Parameters times coefficients of the line-sinks
+    !   potsum(Np,Naquifers): Potentials to add to
+    ! Output:
+    !   potsum(Np,Naquifers): Potentials with the contribution of all line-sinks added
+
+    implicit none
+    ! Input / Output
+    integer, intent(in) :: Np, Nls, Naquifers
+    real*8, intent(in) :: x(Np), y(Np), x1in(Nls), y1in(Nls), x2in(Nls), y2in(Nls)
+    real*8, intent(in) :: lambdain(Naquifers), paramxcoef(Nls,Naquifers)
+    real*8, intent(inout) :: potsum(Np,Naquifers)
+
+    ! Locals
+    integer :: i, j
+    real*8 :: pot(Naquifers)
+
+    do j=1,Nls
+        do i=1,Np
+            call potbeslsho(x(i),y(i),x1in(j),y1in(j),x2in(j),y2in(j),Naquifers,lambdain,0,pot)
+            potsum(i,:) = potsum(i,:) + paramxcoef(j,:) * pot
+        end do
+    end do
+
+end subroutine potbeslshocollection
+
+subroutine disbeslshocollection(Np,x,y,Nls,x1in,y1in,x2in,y2in,Naquifers,lambdain,paramxcoef,disxsum,disysum)
+
+    ! Input:
+    !   Same as potbeslshocollection
+    !   disxsum(Np,Naquifers),disysum(Np,Naquifers): Discharges to add to
+    ! Output:
+    !   disxsum(Np,Naquifers),disysum(Np,Naquifers): Discharges with the contribution of all line-sinks added
+
+    implicit none
+    ! Input / Output
+    integer, intent(in) :: Np, Nls, Naquifers
+    real*8, intent(in) :: x(Np), y(Np), x1in(Nls), y1in(Nls), x2in(Nls), y2in(Nls)
+    real*8, intent(in) :: lambdain(Naquifers), paramxcoef(Nls,Naquifers)
+    real*8, intent(inout) :: disxsum(Np,Naquifers), disysum(Np,Naquifers)
+
+    ! Locals
+    integer :: i, j
+    real*8 :: disx(Naquifers), disy(Naquifers)
+
+    do j=1,Nls
+        do i=1,Np
+            call disbeslsho(x(i),y(i),x1in(j),y1in(j),x2in(j),y2in(j),Naquifers,lambdain,0,disx,disy)
+            disxsum(i,:) = disxsum(i,:) + paramxcoef(j,:) * disx
+            disysum(i,:) = disysum(i,:) + paramxcoef(j,:) * disy
+        end do
+    end do
+
+end subroutine disbeslshocollection
+
+subroutine potlaplshocollection(Np,x,y,Nls,x1in,y1in,x2in,y2in,paramxcoef,potsum)
+
+    ! Input:
+    !   Np: Number of points
+    !   x(Np),y(Np): Points where potential is computed
+    !   Nls: Number of line-sinks of order 0
+    !   x1in(Nls),y1in(Nls): Begin points of line-sinks
+    !   x2in(Nls),y2in(Nls): End points of line-sinks
+    !   paramxcoef(Nls): Strengths of the line-sinks
+    !   potsum(Np): Laplace potentials to add to
+    ! Output:
+    !   potsum(Np): Laplace potentials with the contribution of all line-sinks added
+
+    implicit none
+    ! Input / Output
+    integer, intent(in) :: Np, Nls
+    real*8, intent(in) :: x(Np), y(Np), x1in(Nls), y1in(Nls), x2in(Nls), y2in(Nls)
+    real*8, intent(in) :: paramxcoef(Nls)
+    real*8, intent(inout) :: potsum(Np)
+
+    ! Locals
+    integer :: i, j
+    real*8 :: pot(1)
+
+    do j=1,Nls
+        do i=1,Np
+            call potlaplsho(x(i),y(i),x1in(j),y1in(j),x2in(j),y2in(j),0,pot)
+            potsum(i) = potsum(i) + paramxcoef(j) * pot(1)
+        end do
+    end do
+
+end subroutine potlaplshocollection
+
+subroutine dislaplshocollection(Np,x,y,Nls,x1in,y1in,x2in,y2in,paramxcoef,disxsum,disysum)
+
+    ! Input:
+    !   Same as potlaplshocollection
+    !   disxsum(Np),disysum(Np): Laplace discharges to add to
+    ! Output:
+    !   disxsum(Np),disysum(Np): Laplace discharges with the contribution of all line-sinks added
+
+    implicit none
+    ! Input / Output
+    integer, intent(in) :: Np, Nls
+    real*8, intent(in) :: x(Np), y(Np), x1in(Nls), y1in(Nls), x2in(Nls), y2in(Nls)
+    real*8, intent(in) :: paramxcoef(Nls)
+    real*8, intent(inout) :: disxsum(Np), disysum(Np)
+
+    ! Locals
+    integer :: i, j
+    real*8 :: disx(1), disy(1)
+
+    do j=1,Nls
+        do i=1,Np
+            call dislaplsho(x(i),y(i),x1in(j),y1in(j),x2in(j),y2in(j),0,disx,disy)
+            disxsum(i) = disxsum(i) + paramxcoef(j) * disx(1)
+            disysum(i) = disysum(i) + paramxcoef(j) * disy(1)
+        end do
+    end do
+
+end subroutine dislaplshocollection
+
 !!! Program used for testing
 Program BesselLS
   integer :: Naquifers,order
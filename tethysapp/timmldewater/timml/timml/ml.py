@@ -1,24 +1,42 @@
 from sys import stdout
+import time
 from numpy import *
 import numpy.linalg as linalg
 from mlaquifer import *
 from mlelement import *
 #from TimMLgui import setActiveModel
 from mltrace import *
+from mlclosedform import *
+from mlfmm import *
+from mlsparse import *
+from mlhmatrix import *
 from scipy.integrate import romberg
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import gmres, LinearOperator, spilu
+import multiprocessing
 
 class Model:
     '''Model class; all parameters from top down as lists
     Attributes:
     - elementList: List of elements in model
     - aq: instance of (background) AquiferData class
+    - lu: LU factorization of the matrix of the last solve (None if there is none)
+    - solver: 'direct', 'gmres', 'sparse' or 'hmatrix', and tol: relative tolerance of the iterative solvers (see solve)
+    - workers: number of processes of the matrix assembly (see solve)
     For parameters provided on input see AquiferData class
     '''
+    maxLowRank = 50  # Maximum number of changed rows handled with Sherman-Morrison-Woodbury before refactorizing
+    farFieldTol = 1e-12  # Relative accuracy of the multipole expansions of solver='sparse'
+    hmatrixTol = 1e-9  # Relative accuracy of the low-rank blocks of solver='hmatrix'
     def __init__(self,k=[1],zb=[0],zt=[1],c=[],n=[],nll=[],semi=False,type='conf',hstar=0.0):
         self.elementList = []
         self.elementDict = {}
         self.collectionDict = {}
         self.lakeList = []
+        self.closedForm = None
+        self.lu = None
+        self.solver = 'direct'; self.tol = 1e-10
+        self.workers = 1
         self.aq = Aquifer(k,zb,zt,c,n,nll,semi=False,type=type,hstar=hstar)
 #        setActiveModel(self)
     def __repr__(self):
@@ -26,6 +44,7 @@ class Model:
     def addElement(self,el):
         '''Adds Element instance el to elementList'''
         self.elementList.append(el)
+        self.closedForm = None; self.lu = None
         if el.label != None:
             self.elementDict[el.label] = el
     def addElementToCollection(self,el):
@@ -40,6 +59,7 @@ class Model:
         for i in range(len(self.elementList)):
             if el == self.elementList[i]:
                 del self.elementList[i]
+                self.closedForm = None; self.lu = None
                 print 'The following element was removed: ',el
                 return
     def potentialVector(self,x,y,aq=None):
@@ -56,7 +76,115 @@ class Model:
         potadd = zeros(aq.Naquifers,'d')
         for col in self.collectionDict:
             potsum = self.collectionDict[col][0].potentialCollection(potsum,potadd,self.collectionDict[col],aq,x,y)
-        return sum( potsum * aq.eigvec , 1 )        
+        return sum( potsum * aq.eigvec , 1 )
+    def potentialCollectionArray(self,x,y,aq,tol=None):
+        '''Returns array of potentials of shape (aq.Naquifers,N) at the points x,y (arrays of length N),
+        which must all be in AquiferData aq. Only works after a solve
+        tol: if given, wells and line-sinks are evaluated with the treecode of FarField with relative
+        accuracy tol instead of summed directly'''
+        if self.closedForm is not None and tol is None:
+            return self.closedForm.potentialArray(x,y)[newaxis,:]
+        potsum = zeros((aq.Naquifers,len(x)),'d')
+        if tol is None:
+            for col in self.collectionDict:
+                potsum = self.collectionDict[col][0].potentialCollectionArray(potsum,self.collectionDict[col],aq,x,y)
+        else:
+            farfield = FarField(self,aq,tol)
+            potsum = farfield.potentialCollectionArray(potsum,x,y)
+            for col in self.collectionDict:
+                rest = [el for el in self.collectionDict[col] if not farfield.handles(el)]
+                if len(rest) > 0:
+                    potsum = rest[0].potentialCollectionArray(potsum,rest,aq,x,y)
+        return dot( aq.eigvec, potsum )
+    def headCollectionArray(self,x,y,aq,tol=None):
+        '''Returns array of heads of shape (aq.Naquifers,N) at the points x,y (arrays of length N),
+        which must all be in AquiferData aq. Only works after a solve. See potentialCollectionArray for tol'''
+        return aq.potentialArrayToHeadArray( self.potentialCollectionArray(x,y,aq,tol) )
+    def headVectorArray(self,x,y,tol=None,aqid=None):
+        '''Returns array of heads of shape (Naquifers,N) at the points x,y (arrays of length N).
+        Layers are numbered as in head, so the fake top layer of a semi-confined inhomogeneity is left out.
+        Points are grouped by AquiferData and every element collection is evaluated for all points
+        of a group at once. Only works after a solve
+        tol: relative accuracy of the treecode for wells and line-sinks (see FarField); None sums directly
+        aqid: list of AquiferData and aquifer ids of the points as returned by findAquiferDataArray;
+        looked up when None'''
+        x = atleast_1d(asarray(x,'d')); y = atleast_1d(asarray(y,'d'))
+        if self.closedForm is not None and tol is None:
+            return self.closedForm.headArray(x,y)[newaxis,:]
+        h = zeros((self.aq.Naquifers,len(x)),'d')
+        if aqid is None:
+            aqlist,iaq = self.aq.findAquiferDataArray(x,y)
+        else:
+            aqlist,iaq = aqid
+        for i in range(len(aqlist)):
+            index = flatnonzero( iaq == i )
+            if len(index) == 0: continue
+            aq = aqlist[i]
+            hv = self.headCollectionArray(x[index],y[index],aq,tol)
+            if aq.fakesemi: hv = hv[1:]
+            h[:,index] = hv
+        return h
+    def headGrid(self,layer,xg,yg,tol=None):
+        '''Returns array of heads in layer at the points xg,yg, which are arrays of the same shape
+        (for example obtained with meshgrid). See headVectorArray for tol. The aquifer ids of the
+        grid are rasterized once with findAquiferDataGrid and reused for the same grid'''
+        xg = asarray(xg,'d'); yg = asarray(yg,'d')
+        aqlist,iaq = self.aq.findAquiferDataGrid(xg,yg)
+        h = self.headVectorArray(xg.ravel(),yg.ravel(),tol,(aqlist,iaq.ravel()))
+        return h[layer].reshape(xg.shape)
+    def evaluate_grid(self,xg,yg,layers=None,workers=1,tol=None,progress=None,tiles=None):
+        '''Returns array of heads of shape (Nlayers,)+xg.shape at the points xg,yg, which are arrays
+        of the same shape (for example obtained with meshgrid). Only works after a solve
+        layers: list of layers (numbered as in headVectorArray); all layers when None
+        workers: number of processes. The grid is split in tiles of rows (along the first axis), which
+        are evaluated with headVectorArray in a multiprocessing Pool. The model is passed to every
+        worker once, when the pool is started, and not per tile
+        tol: see headVectorArray
+        progress: Function called as progress('grid',fraction) after every tile
+        tiles: number of tiles; 4 per worker when None, so that a slow tile doesn't keep the other workers idle'''
+        xg = asarray(xg,'d'); yg = asarray(yg,'d')
+        if xg.ndim < 2: xg = xg.reshape(1,-1); yg = yg.reshape(1,-1)
+        if layers is None: layers = range(self.aq.Naquifers)
+        layers = list(layers)
+        aqlist,iaq = self.aq.findAquiferDataGrid(xg,yg)
+        Nrow = xg.shape[0]
+        if tiles is None: tiles = 4 * workers
+        bounds = linspace(0,Nrow,min(max(tiles,1),Nrow)+1).astype(int)
+        tasks = [ (bounds[i],bounds[i+1],xg[bounds[i]:bounds[i+1]],yg[bounds[i]:bounds[i+1]],
+                   iaq[bounds[i]:bounds[i+1]],layers,tol) for i in range(len(bounds)-1) ]
+        h = zeros((len(layers),)+xg.shape,'d')
+        if workers > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool( min(workers,len(tasks)), _initWorker, (self,) )
+            try:
+                results = pool.imap_unordered(_evaluateGridTile,tasks)
+                for n,(i0,i1,htile) in enumerate(results):
+                    h[:,i0:i1] = htile
+                    if progress is not None: progress('grid',float(n+1)/len(tasks))
+            finally:
+                pool.terminate()
+        else:
+            for n,task in enumerate(tasks):
+                i0,i1,htile = _evaluateGridTile(task,self)
+                h[:,i0:i1] = htile
+                if progress is not None: progress('grid',float(n+1)/len(tasks))
+        return h
+    def head3DArray(self,x,y,z):
+        '''Returns array of heads at the points x,y,z (arrays of length N); 0 where z is not in an aquifer,
+        as in head3D. Only works after a solve'''
+        x = atleast_1d(asarray(x,'d')); y = atleast_1d(asarray(y,'d')); z = atleast_1d(asarray(z,'d'))
+        h = zeros(len(x),'d')
+        aqlist,iaq = self.aq.findAquiferDataArray(x,y)
+        for i in range(len(aqlist)):
+            index = flatnonzero( iaq == i )
+            if len(index) == 0: continue
+            aq = aqlist[i]
+            pylayer = array([aq.inWhichPyLayer(zz) for zz in z[index]],'i')
+            inaquifer = (pylayer >= 0) & (pylayer != 9999)
+            index = index[inaquifer]; pylayer = pylayer[inaquifer]
+            if len(index) == 0: continue
+            hv = self.headCollectionArray(x[index],y[index],aq)
+            h[index] = hv[pylayer,arange(len(index))]
+        return h
     def potentialVectorCol(self,x,y,aq=None):
         '''Returns column vector of potentials at (x,y) for AquiferData aq; if aq=None, program will find it'''
         pot = self.potentialVector(x,y,aq)
@@ -99,6 +227,27 @@ class Model:
         disx = sum( dissum[0,:] * aq.eigvec , 1 )
         disy = sum( dissum[1,:] * aq.eigvec , 1 )
         return [disx, disy]
+    def dischargeCollectionArray(self,x,y,aq):
+        '''Returns a list of Qx array and Qy array, each of shape (aq.Naquifers,N), at the points x,y
+        (arrays of length N), which must all be in AquiferData aq. Only works after a solve'''
+        dissum = zeros((2,aq.Naquifers,len(x)),'d')
+        for col in self.collectionDict:
+            dissum = self.collectionDict[col][0].dischargeCollectionArray(dissum,self.collectionDict[col],aq,x,y)
+        return [dot( aq.eigvec, dissum[0] ), dot( aq.eigvec, dissum[1] )]
+    def dischargeVectorArray(self,x,y):
+        '''Returns a list of Qx array and Qy array, each of shape (Naquifers,N), at the points x,y
+        (arrays of length N). Layers are numbered as in headVectorArray. Only works after a solve'''
+        x = atleast_1d(asarray(x,'d')); y = atleast_1d(asarray(y,'d'))
+        disx = zeros((self.aq.Naquifers,len(x)),'d'); disy = zeros((self.aq.Naquifers,len(x)),'d')
+        aqlist,iaq = self.aq.findAquiferDataArray(x,y)
+        for i in range(len(aqlist)):
+            index = flatnonzero( iaq == i )
+            if len(index) == 0: continue
+            aq = aqlist[i]
+            [qx,qy] = self.dischargeCollectionArray(x[index],y[index],aq)
+            if aq.fakesemi: qx = qx[1:]; qy = qy[1:]
+            disx[:,index] = qx; disy[:,index] = qy
+        return [disx, disy]
     def head(self,layer,x,y,aq=None):
         '''Returns head in layer at (x,y) for AquiferData aq; if aq=None, program will find it''' 
         if aq == None: aq = self.aq.findAquiferData(x,y)
@@ -434,21 +583,74 @@ class Model:
         a,b,c,d = traceline(self,xstart,ystart,zstart,stepin,tmax,maxsteps,tstart,window,labfrac,Hfrac)
         return a,b,c,d
 
-    def solve(self,reInitializeAllElements=1,doIterations=False,maxIter=5,storematrix=False,conditionnumber=False):
+    def isClosedForm(self):
+        '''Returns True if the model has one confined aquifer without inhomogeneities and contains
+        at most one Constant and otherwise only wells, so that it can be solved and evaluated in closed form'''
+        if self.aq.Naquifers != 1 or self.aq.type != self.aq.conf: return False
+        if len(self.aq.inhomList) > 0 or len(self.lakeList) > 0: return False
+        Nconstant = 0
+        for el in self.elementList:
+            if el.type == 'constant':
+                Nconstant = Nconstant + 1
+            elif el.type != 'well':
+                return False
+        return Nconstant <= 1
+    def solveClosedForm(self,reInitializeAllElements=1,progress=None):
+        '''Initializes the elements like solveNonLinear and computes the closed-form solution'''
+        self.collectionDict = {}
+        for e in self.elementList: e.addElementToCollection(self)
+        if reInitializeAllElements == 1:
+            self.aq.setCoefs()
+            for e in self.elementList:
+                e.setCoefs()
+        print 'Number of elements: ',len(self.elementList)
+        print 'Closed-form solution'
+        self.closedForm = ClosedForm(self)
+        self.closedForm.solve()
+        if progress is not None: progress('factorization',1.0)
+    def solve(self,reInitializeAllElements=1,doIterations=False,maxIter=5,storematrix=False,conditionnumber=False,progress=None,closedform=True,\
+              solver='direct',tol=1e-10,workers=1):
         '''Compute solution
         reInitializeAllElements: Initializes all elements and aquifers (default is 1)
         doIterations: Iterates for non-linear conditions if present
         maxIter: Maximum number of iterations. If reached before convergence a message is written to the screen
         storematrix: Logical to to indicate whether the matrix should remain stored. Only useful during development
+            The LU factorization of the matrix is always kept for resolve_rhs
+        progress: Function called as progress(phase,fraction) during the solve. Phases are 'compile'
+            (at the milestones of the matrix compilation), 'factorization' and 'iteration'
+        closedform: Use the closed-form solution if the model allows it (see isClosedForm); no matrix is
+            compiled in that case, so it is not used when storematrix or conditionnumber is set
+        solver: 'direct' solves the matrix with an LU factorization; 'gmres' uses GMRES with
+            a block-Jacobi preconditioner (see solveIterative), which avoids the O(N**3) factorization
+            for large models. No factorization is kept for resolve_rhs with 'gmres'
+            'sparse' stores only the near field of the matrix and computes the coupling of elements beyond
+            the truncation of the Bessel functions from multipole expansions (see NearFarMatrix); it is
+            solved with GMRES, preconditioned with the near field and the far field on coarse boxes (see
+            solveSparse). It needs much less memory than the other solvers for large leaky systems
+            'hmatrix' stores the matrix as a hierarchical matrix with low-rank blocks for clusters of
+            elements that are far apart (see HMatrix), also for confined aquifers, and solves it with
+            GMRES with a block-Jacobi preconditioner on the clusters (see solveHMatrix)
+        tol: Relative tolerance of the residual for solver='gmres', 'sparse' and 'hmatrix'
+        workers: Number of processes that assemble the matrix (see assembleMatrix). Processes rather than
+            threads, as the elements compute their influences in scratch arrays that they keep
         '''
+        assert solver in ('direct','gmres','sparse','hmatrix'), "TimML Input error: solver must be 'direct', 'gmres', 'sparse' or 'hmatrix'"
         self.matrix = 0; self.rhs = 0; self.xsol = 0; self.eqlist = 0; self.eqcumlist = 0  # If not created (no unknowns) they need to exist to be deleted
+        self.closedForm = None; self.lu = None
+        self.solver = solver; self.tol = tol
+        self.workers = workers
         print 'Starting solve'
-        newsolution = self.solveNonLinear( 1, reInitializeAllElements )
+        if closedform and not storematrix and not conditionnumber and self.isClosedForm():
+            self.solveClosedForm( reInitializeAllElements, progress )
+            newsolution = False
+        else:
+            newsolution = self.solveNonLinear( 1, reInitializeAllElements, progress )
         lakechange = False  # Need to start with false in case there are no lakes
         if doIterations:
             i = 0
             while (newsolution or lakechange) and i < maxIter:
                 print 'Iteration ',i+1
+                if progress is not None: progress('iteration',float(i)/maxIter)
                 if len(self.lakeList) == 0:
                     newsolution = self.solveNonLinear( start=0 ) # Only reinitializes if start = 1
                 else:
@@ -457,7 +659,7 @@ class Model:
                     for lake in self.lakeList:
                         change = lake.change_lake()
                         if change: lakechange = True
-                    if lakechange: solution = self.solveNonLinear( 1, reInitializeAllElements ) #Cannot modify existing matrix; need to recompile
+                    if lakechange: solution = self.solveNonLinear( 1, reInitializeAllElements, progress ) #Cannot modify existing matrix; need to recompile
                     # Check for percolating line-sinks
                     newsolution = self.solveNonLinear( start=0 )
                 i+=1
@@ -465,18 +667,296 @@ class Model:
                 print 'Warning: Maximum number of iterations reached before convergence'
             else:
                 print 'Iterations complete'
+            if progress is not None: progress('iteration',1.0)
         if conditionnumber:
-            u,s,vh = linalg.svd(self.matrix)
+            if self.solver in ('sparse','hmatrix'):
+                u,s,vh = linalg.svd(self.matrix.toarray())
+            else:
+                u,s,vh = linalg.svd(self.matrix)
             print 'Condition number: ',s[0]/s[-1]
         if not storematrix:
             del self.matrix; del self.rhs; del self.xsol; del self.eqlist; del self.eqcumlist
         print 'Solution complete'
         return
         
-    def solveNonLinear(self,start=1,reInitializeAllElements=1):
+    def assembleMatrix(self,progress=None):
+        '''Returns the matrix of unknowns of shape (Neq,Neq+1) with the right-hand side in the last column.
+        The array is allocated once and the elements fill their rows in place. Rows of elements that have
+        controlPoints are filled by column block: every element with unknowns computes its coefficients
+        at all control points in an aquifer and layer at once (potentialInfluenceInLayerArray), and
+        minus the potential at the control points is computed with potentialCollectionArray.
+        The other rows are copied from getMatrixRows by fillMatrixRows.
+        With workers > 1 the column blocks of consecutive elements and the rows of elements without
+        controlPoints are computed by a pool of workers processes (see solve). Every block is written at its own columns or rows, in the order of eqlist, so the
+        matrix is the same as with one worker. The rows of elements with controlPoints are filled last,
+        as they may change the diagonal (ResLineSink).
+        progress: Function called as progress(phase,fraction); see solve
+        '''
+        Nel = len(self.elementList)
+        print 'Number of elements: ',Nel
+        print 'Percent progress: ',
+        stdout.flush()
+        eq_list = [ e.Nunknowns() for e in self.elementList ]
+        eqcumlist = cumsum(eq_list)
+        self.eqlist = eq_list
+        self.eqcumlist = eqcumlist - 1
+        irowlist = eqcumlist - eq_list  # First row (and column) of every element
+        Neq = sum(eq_list)
+        matrix = zeros((Neq,Neq+1),'d',order='F')  # matrix[:,:-1] is contiguous, so it is not copied for LAPACK and BLAS
+        groups = self.controlPointGroups(irowlist)
+        for aq,pylayer,rows,x,y in groups:
+            matrix[rows,-1] = -self.potentialCollectionArray(x,y,aq)[pylayer]
+        cprows = concatenate( [ zeros(0,'i') ] + [ rows for aq,pylayer,rows,x,y in groups ] )  # Rows of the control points
+        self.assemblyLayout = (Neq,irowlist,eq_list,groups,cprows)  # Read by assembleColumns and assembleRows
+        # Compile matrix in 10 blocks of columns and 10 blocks of rows; a milestone after every block
+        bounds = linspace(0,Nel,min(10,Nel)+1).astype(int)
+        blocks = [ ('columns',bounds[i],bounds[i+1]) for i in range(len(bounds)-1) ]
+        rowbounds = array([0] + [ i+1 for i,e in enumerate(self.elementList) if e.controlPoints() is None ])
+        rowbounds = rowbounds[ linspace(0,len(rowbounds)-1,min(10,len(rowbounds)-1)+1).astype(int) ]
+        blocks = blocks + [ ('rows',rowbounds[i],rowbounds[i+1]) for i in range(len(rowbounds)-1) ]
+        if self.workers > 1:
+            pool = multiprocessing.Pool( self.workers, _initWorker, (self,) )
+            try:
+                for iblock,(kind,i0,rv) in enumerate( pool.imap_unordered( _assembleBlock, blocks ) ):
+                    if kind == 'columns':
+                        icol = irowlist[i0]
+                        matrix[cprows,icol:icol+rv.shape[1]] = rv  # Other rows may already be filled by a block of rows
+                    else:
+                        for irow,rows in rv: matrix[irow:irow+len(rows),:] = rows
+                    self.assemblyProgress(iblock,len(blocks),progress)
+            finally:
+                pool.terminate()
+        else:
+            for iblock,(kind,i0,i1) in enumerate(blocks):
+                if kind == 'columns':
+                    self.assembleColumns(i0,i1,matrix)
+                else:
+                    for irow,rows in self.assembleRows(i0,i1): matrix[irow:irow+len(rows),:] = rows
+                self.assemblyProgress(iblock,len(blocks),progress)
+        for e,irow in zip(self.elementList,irowlist):
+            if e.controlPoints() is not None: e.fillMatrixRows(matrix,irow,self.elementList)
+        del self.assemblyLayout
+        print ' ' # Just to end the printing in a row
+        return matrix
+    def assembleSparse(self,progress=None):
+        '''Returns the matrix of assembleMatrix as a NearFarMatrix, with the right-hand side in its
+        attribute rhs. The near field is computed element by element; workers is not used.
+        The memory of the near field and the trees is printed with that of the dense matrix.
+        progress: Function called as progress(phase,fraction); see solve
+        '''
+        print 'Number of elements: ',len(self.elementList)
+        print 'Percent progress: ',
+        stdout.flush()
+        matrix = NearFarMatrix(self,self.farFieldTol,progress)
+        print ' '
+        nearbytes,farbytes,densebytes = matrix.memory()
+        print 'Sparse matrix memory [MB]: ',(nearbytes+farbytes)/1e6,'( near field',nearbytes/1e6,', far field',farbytes/1e6,\
+              '); dense matrix [MB]: ',densebytes/1e6
+        return matrix
+    def assembleHMatrix(self,progress=None):
+        '''Returns the matrix of assembleMatrix as an HMatrix, with the right-hand side in its attribute
+        rhs; workers is not used. The memory of the blocks is printed with that of the dense matrix.
+        progress: Function called as progress(phase,fraction); see solve
+        '''
+        print 'Number of elements: ',len(self.elementList)
+        print 'Percent progress: ',
+        stdout.flush()
+        matrix = HMatrix(self,self.hmatrixTol,progress)
+        print ' '
+        nbytes,densebytes = matrix.memory()
+        print 'H-matrix memory [MB]: ',nbytes/1e6,'; dense matrix [MB]: ',densebytes/1e6,\
+              '; compression ratio: ',densebytes/max(float(nbytes),1.0),'; low-rank blocks stored dense: ',matrix.rejected
+        return matrix
+    def assemblyProgress(self,iblock,Nblocks,progress):
+        '''Prints the milestones passed with block iblock of Nblocks of assembleMatrix'''
+        if iblock == 0:
+            first = 0
+        else:
+            first = 10*iblock/Nblocks + 1
+        for iprog in range(first,10*(iblock+1)/Nblocks+1):
+            print int(10.0*iprog),
+            stdout.flush()
+            if progress is not None: progress('compile',0.1*iprog)
+    def assembleColumns(self,iel0,iel1,matrix=None):
+        '''Returns the columns of the elements iel0 up to iel1 in the rows of the control points of
+        assembleMatrix (cprows), of shape (len(cprows),Ncolumns), or fills them in matrix when given'''
+        Neq,irowlist,eq_list,groups,cprows = self.assemblyLayout
+        icol0 = irowlist[iel0]
+        if matrix is None:
+            Ncol = sum(eq_list[iel0:iel1])
+            block = zeros((Neq,Ncol),'d',order='F'); offset = icol0
+        else:
+            block = matrix; offset = 0
+        for e,icol,Ncol in zip(self.elementList[iel0:iel1],irowlist[iel0:iel1],eq_list[iel0:iel1]):
+            if Ncol > 0:
+                for aq,pylayer,rows,x,y in groups:
+                    block[rows,icol-offset:icol-offset+Ncol] = transpose( e.potentialInfluenceInLayerArray(aq,pylayer,x,y) )
+        if matrix is None: return block[cprows]
+    def assembleRows(self,iel0,iel1):
+        '''Returns list of (irow,rows) with the rows of getMatrixRows of the elements iel0 up to iel1
+        that have no controlPoints, starting at row irow (see Element.fillMatrixRows)'''
+        Neq,irowlist,eq_list,groups,cprows = self.assemblyLayout
+        rv = []
+        for e,irow in zip(self.elementList[iel0:iel1],irowlist[iel0:iel1]):
+            if e.controlPoints() is not None: continue
+            rows = e.getMatrixRows(self.elementList)
+            if len(rows) > 0: rv.append( (irow,array(rows,'d')) )
+        return rv
+    def controlPointGroups(self,irowlist):
+        '''Returns list with the controlPoints of all elements grouped by aquifer and layer as
+        (aq,pylayer,rows,x,y), where rows, x and y are arrays; irowlist has the first row of every element'''
+        groups = {}
+        for e,irow in zip(self.elementList,irowlist):
+            cp = e.controlPoints()
+            if cp is None: continue
+            for i in range(len(cp)):
+                aq,pylayer,x,y = cp[i]
+                key = (id(aq),pylayer)
+                if key not in groups: groups[key] = [aq,pylayer,[],[],[]]
+                groups[key][2].append(irow+i); groups[key][3].append(x); groups[key][4].append(y)
+        return [ (aq,pylayer,array(rows,'i'),array(x,'d'),array(y,'d')) for aq,pylayer,rows,x,y in groups.values() ]
+    def assembleRhs(self):
+        '''Returns the right-hand side of the matrix of assembleMatrix for the current parameters of the
+        elements without computing the coefficients (see fillRhs)'''
+        eq_list = [ e.Nunknowns() for e in self.elementList ]
+        irowlist = cumsum(eq_list) - eq_list
+        rhs = zeros(sum(eq_list),'d')
+        for aq,pylayer,rows,x,y in self.controlPointGroups(irowlist):
+            rhs[rows] = -self.potentialCollectionArray(x,y,aq)[pylayer]
+        for e,irow in zip(self.elementList,irowlist):
+            e.fillRhs(rhs,irow,self.elementList)
+        return rhs
+    def factorize(self,matrix):
+        '''Stores the LU factorization of matrix in lu; no rows have changed since'''
+        self.lu = lu_factor(matrix)
+        self.luRows = {}  # Original rows of the rows that changed after the factorization
+        self.luUpdate = None
+    def solveFactorized(self,rhs):
+        '''Returns the solution for the right-hand side rhs with the stored LU factorization.
+        Rows that changed after the factorization (luRows) are taken into account with the
+        Sherman-Morrison-Woodbury formula; with more than maxLowRank changed rows, self.matrix is factorized again'''
+        if len(self.luRows) > self.maxLowRank:
+            print 'Number of changed rows larger than ',self.maxLowRank,'; factorizing again'
+            self.factorize(self.matrix)
+        xsol = lu_solve(self.lu,rhs)
+        if len(self.luRows) == 0: return xsol
+        if self.luUpdate is None:
+            # matrix = A + E * D with A the factorized matrix and E the columns of the identity matrix of the changed rows
+            rows = sorted(self.luRows.keys())
+            D = self.matrix[rows,:] - array([ self.luRows[i] for i in rows ])
+            E = zeros((len(rhs),len(rows)),'d')
+            E[rows,range(len(rows))] = 1.0
+            Z = lu_solve(self.lu,E)
+            self.luUpdate = (D,Z,lu_factor( eye(len(rows)) + dot(D,Z) ))
+        D,Z,C = self.luUpdate
+        return xsol - dot( Z, lu_solve(C,dot(D,xsol)) )
+    def solveIterative(self,matrix,rhs):
+        '''Returns the solution of matrix * x = rhs computed with GMRES (scipy.sparse.linalg.gmres) to
+        relative tolerance self.tol. The preconditioner is block Jacobi: the inverse of the block of every
+        element with its own unknowns (its self-influence). The number of iterations is stored in self.iterations'''
+        # Inverses of the diagonal blocks, grouped by block size so that they are applied at once
+        blocks = {}
+        for irow,n in zip(cumsum(self.eqlist) - self.eqlist,self.eqlist):
+            if n == 0: continue
+            try:
+                Binv = linalg.inv(matrix[irow:irow+n,irow:irow+n])
+            except linalg.LinAlgError:
+                Binv = eye(n)
+            if n not in blocks: blocks[n] = ([],[])
+            blocks[n][0].append(arange(irow,irow+n)); blocks[n][1].append(Binv)
+        blocks = [ (array(rows),array(Binv)) for rows,Binv in blocks.values() ]
+        def precondition(r):
+            z = empty(len(r),'d')
+            for rows,Binv in blocks:
+                z[rows] = einsum('ijk,ik->ij',Binv,r[rows])
+            return z
+        N = len(rhs)
+        M = LinearOperator((N,N),matvec=precondition,dtype='d')
+        return self.iterate(matrix,rhs,M)
+    def solveSparse(self,matrix,rhs):
+        '''Returns the solution of matrix * x = rhs for the NearFarMatrix matrix, computed with GMRES
+        to relative tolerance self.tol. The preconditioner is the inverse of the near field plus the
+        coarse far field U * W * V of NearFarMatrix.coarse, with the Sherman-Morrison-Woodbury formula
+        and an incomplete LU factorization of the near field (scipy.sparse.linalg.spilu)'''
+        N = len(rhs)
+        ilu = spilu(matrix.nearMatrix(),drop_tol=1e-6,fill_factor=20)
+        U,W,V = matrix.coarse()
+        Z = array([ ilu.solve(u) for u in transpose(U.toarray()) ]).reshape((-1,N))
+        C = lu_factor( eye(len(W)) + dot( W, V.dot(transpose(Z)) ) ) if len(W) > 0 else None
+        def precondition(r):
+            z = ilu.solve(r)
+            if C is None: return z
+            return z - dot( transpose(Z), lu_solve(C,dot(W,V.dot(z))) )
+        M = LinearOperator((N,N),matvec=precondition,dtype='d')
+        A = LinearOperator((N,N),matvec=matrix.dot,dtype='d')
+        return self.iterate(A,rhs,M)
+    def solveHMatrix(self,matrix,rhs):
+        '''Returns the solution of matrix * x = rhs for the HMatrix matrix, computed with GMRES to
+        relative tolerance self.tol. The preconditioner is block Jacobi: the LU factorizations of the
+        dense blocks of the leaves of the cluster tree with themselves (HMatrix.diagonalBlocks)'''
+        blocks = []
+        for rows,D in matrix.diagonalBlocks():
+            try:
+                blocks.append( (rows,lu_factor(D)) )
+            except (ValueError,linalg.LinAlgError):
+                pass
+        def precondition(r):
+            z = r.copy()
+            for rows,lu in blocks:
+                z[rows] = lu_solve(lu,r[rows])
+            return z
+        N = len(rhs)
+        M = LinearOperator((N,N),matvec=precondition,dtype='d')
+        A = LinearOperator((N,N),matvec=matrix.dot,dtype='d')
+        return self.iterate(A,rhs,M)
+    def iterate(self,matrix,rhs,M):
+        '''Returns the solution of matrix * x = rhs computed with GMRES with preconditioner M to
+        relative tolerance self.tol; the number of iterations is stored in self.iterations.
+        When GMRES doesn't converge, the matrix (an array, or a LinearOperator of which the columns are
+        computed with matvec) is solved with an LU factorization instead'''
+        N = len(rhs)
+        self.iterations = 0
+        def count(rk):
+            self.iterations = self.iterations + 1
+        xsol,info = gmres(matrix,rhs,tol=self.tol,atol=0.0,restart=min(N,100),maxiter=N,M=M,callback=count)
+        print 'GMRES iterations: ',self.iterations
+        if info > 0:
+            print 'Warning: GMRES did not converge to tolerance ',self.tol,'; solving with an LU factorization'
+            if isinstance(matrix,LinearOperator):
+                matrix = transpose( [ matrix.matvec(e) for e in eye(N) ] )
+            xsol = lu_solve(lu_factor(matrix),rhs)
+        return xsol
+    def resolve_rhs(self,progress=None):
+        '''Solves the model again with the stored LU factorization after changes that only affect the
+        right-hand side: the discharge of wells, the strength of line-sinks, or the heads of Constants
+        and head-specified line-sinks. Elements without unknown parameters are initialized again
+        (setCoefs); the coefficients of the matrix must not have changed (no elements added, moved or removed).
+        Returns True if a solution was computed and False if solve must be called instead'''
+        if self.closedForm is not None:
+            for e in self.elementList: e.setCoefs()
+            self.solveClosedForm( 0, progress )
+            return True
+        if self.lu is None:
+            print 'No stored factorization (or an iterative solver was used); call solve'
+            return False
+        for e in self.elementList:
+            if e.Nunknowns() == 0: e.setCoefs()
+        rhs = self.assembleRhs()
+        if progress is not None: progress('factorization',0.0)
+        t0 = time.time()
+        xsol = self.solveFactorized(rhs)
+        self.solveTime = time.time() - t0
+        print 'Solve time [s]: ',self.solveTime
+        if progress is not None: progress('factorization',1.0)
+        icount = 0
+        for e in self.elementList:
+            icount = e.takeParameters(xsol,icount)
+        return True
+    def solveNonLinear(self,start=1,reInitializeAllElements=1,progress=None):
         '''Do one iteration step
         When start=1 it solves in the old fashioned way
         When start=0 is will use the stored matrix and only adjust the rows that have changed
+        progress: Function called as progress(phase,fraction); see solve
         '''
         newsolution_computed = False
         if start == 1:  # Generate matrix
@@ -489,41 +969,26 @@ class Model:
                     p.setCoefs()
                 for e in self.elementList:
                     e.setCoefs()
-            matrix = []
-            Nel = len(self.elementList)
-            print 'Number of elements: ',Nel
-            print 'Percent progress: ',
-	    stdout.flush()
-            imilestone = (Nel-1)*arange(0,11,1,'i')/10
-            icount = 0; iprog = 0
-            eq_list = []
-            # Compile matrix
-            for e in self.elementList:
-                rows = e.getMatrixRows(self.elementList)
-                eq_list.append( len(rows) )
-                matrix.extend( rows )
-                if icount == imilestone[iprog]:
-                    print int(10.0*iprog),
-		    stdout.flush()
-                    iprog = iprog + 1
-                icount = icount + 1
-            print ' ' # Just to end the printing in a row
-            eqcumlist = cumsum(eq_list)
-            self.eqlist = eq_list
-            self.eqcumlist = eqcumlist - 1
-            #print 'matrix ',matrix
-            matrix = array(matrix)
-            size = shape(matrix)
-            if size[0] == 0:
+            t0 = time.time()
+            if self.solver == 'sparse':
+                matrix = self.assembleSparse(progress)
+                rhs = matrix.rhs
+            elif self.solver == 'hmatrix':
+                matrix = self.assembleHMatrix(progress)
+                rhs = matrix.rhs
+            else:
+                matrix = self.assembleMatrix(progress)
+                rhs = matrix[:,-1].copy()
+                matrix = matrix[:,:-1]
+            self.assemblyTime = time.time() - t0
+            print 'Matrix assembly time [s]: ',self.assemblyTime,'with',self.workers,'worker(s)'
+            if len(rhs) == 0:
                 print 'No unknown parameters'
                 return newsolution_computed
-            rhs = take( matrix, range(size[1]-1,size[1]),1)
-            rhs = transpose(rhs)[0]   # Transfer to row vector
-            matrix = take( matrix, range(0,size[1]-1), 1)
         else:  # Matrix is already compiled, just need correction
             changed = False; ichange = 0
             matrix = self.matrix; rhs = self.rhs; xsol = self.xsol; eqcumlist = self.eqcumlist
-            rhs = rhs - dot( matrix, xsol )
+            rhs = rhs - matrix.dot( xsol )
             for e,iel in zip( self.elementList, range(len(self.elementList)) ):
                 newrows = e.getMatrixRows_nonlinear(self.elementList)
                 if newrows != None:
@@ -533,6 +998,10 @@ class Model:
                         print 'Non-linear iteration for element with multiple unknown strengths not implemented'
                         return
                     else:
+                        if self.lu is not None:  # Keep original row for solveFactorized
+                            if eqcumlist[iel] not in self.luRows:
+                                self.luRows[ eqcumlist[iel] ] = matrix[ eqcumlist[iel],: ].copy()
+                            self.luUpdate = None
                         matrix[ eqcumlist[iel],: ] = array( newrows[0][:-1] )
                         rhs[ eqcumlist[iel] ] = newrows[0][-1]
             print 'Number of elements changed (such as percolating line-sinks): ',ichange
@@ -540,7 +1009,21 @@ class Model:
         size = shape(matrix)
         print 'size of matrix '+str(size)
         if size[0] == size[1]:
-            xsol = transpose( linalg.solve(matrix,rhs) )
+            if progress is not None: progress('factorization',0.0)
+            t0 = time.time()
+            if self.solver == 'gmres':
+                xsol = self.solveIterative(matrix,rhs)
+            elif self.solver == 'sparse':
+                xsol = self.solveSparse(matrix,rhs)
+            elif self.solver == 'hmatrix':
+                xsol = self.solveHMatrix(matrix,rhs)
+            else:
+                if start == 1: self.factorize(matrix)
+                xsol = self.solveFactorized(rhs)
+            self.solveTime = time.time() - t0
+            print 'Solve time [s]: ',self.solveTime
+            if start == 1: print 'Assembly / solve time: ',self.assemblyTime/max(self.solveTime,1e-6)
+            if progress is not None: progress('factorization',1.0)
         else:
             print 'Error: different number of unknowns than equations'
             return
@@ -568,6 +1051,26 @@ class Model:
         #Npoints = len(zbegin)
         #timtracelines( self.ml, Npoints*[event.xdata], Npoints*[event.ydata], zbegin, step, tmax=tmax, Nmax=200, window=(x1,y1,x2,y2), xsec=xsec )
 
+_workerModel = None  # Model of the worker processes of Model.evaluate_grid and Model.assembleMatrix
+
+def _initWorker(ml):
+    global _workerModel
+    _workerModel = ml
+
+def _assembleBlock(block):
+    '''Returns kind, first element and the columns or rows of one block of Model.assembleMatrix'''
+    kind,iel0,iel1 = block
+    if kind == 'columns':
+        return kind,iel0,_workerModel.assembleColumns(iel0,iel1)
+    return kind,iel0,_workerModel.assembleRows(iel0,iel1)
+
+def _evaluateGridTile(task,ml=None):
+    '''Returns first and last row and the heads of one tile of Model.evaluate_grid'''
+    i0,i1,xg,yg,iaq,layers,tol = task
+    if ml is None: ml = _workerModel
+    h = ml.headVectorArray(xg.ravel(),yg.ravel(),tol,([ml.aq] + ml.aq.inhomList,iaq.ravel()))
+    return i0,i1,h[layers].reshape((len(layers),)+xg.shape)
+
 def Model3D(z=[1,0.5,0],kh=1.0,kzoverkh=1.0):
     z=array(z,'d')
     Naq = len(z) - 1
@@ -122,8 +122,21 @@ class AquiferData:
         elif self.type == self.semi:
             rv = potVec / self.T + self.hstar
         return rv
+    def potentialArrayToHeadArray(self,potArray):
+        '''Same as potentialVectorToHeadVector for an array of shape (Naquifers,N)'''
+        if self.type == self.conf:
+            rv = potArray / self.Tcol
+        elif self.type == self.semi:
+            rv = potArray / self.Tcol + self.hstar
+        return rv
     def isInside(self,x,y):
         return 0
+    def isInsideArray(self,x,y):
+        '''Returns boolean array that is True where the points x,y (arrays) are inside, as isInside'''
+        return array([self.isInside(xx,yy) for xx,yy in zip(x,y)],bool)
+    def boundingBox(self):
+        '''Returns (xmin,xmax,ymin,ymax) of the area where isInside may be true, or None if not bounded'''
+        return None
     def inWhichPyLayer(self,z):
         '''Returns -9999 if above top of system, +9999 if below bottom of system, negative for in leaky layer.
         leaky layer -n is on top of aquifer n'''
@@ -153,20 +166,111 @@ class Aquifer(AquiferData):
     Attributes:
     - inhomList: list of inhomogeneity elements (for now only PolygonInhom)
     - all attributes of AquiferData
+    Attributes computed:
+    - inhomIndex: uniform grid over the bounding boxes of the inhomogeneities, built by buildInhomIndex
+      when first needed: x0,y0,dx,dy,Nx,Ny, list with for every cell the indices in inhomList of the
+      inhomogeneities whose bounding box overlaps the cell, array with for every inhomogeneity the
+      range of cells ix1,ix2,iy1,iy2 of its bounding box (-1 if unbounded), and the indices of
+      unbounded inhomogeneities
+    - gridMask: xg,yg and the aquifer-id array of the last call of findAquiferDataGrid
     '''
+    cellsPerInhom = 4  # Number of cells of the inhomIndex per inhomogeneity
     def __init__(self,k=[1],zb=[0],zt=[1],c=[],n=[],nll=[],semi=False,type='conf',hstar=0.0):
         AquiferData.__init__(self,k,zb,zt,c,n,nll,semi,type,hstar)
         self.inhomList = []
+        self.inhomIndex = None; self.gridMask = None
     def addInhom(self,aq):
         self.inhomList.append(aq)
+        self.inhomIndex = None; self.gridMask = None
+    def buildInhomIndex(self):
+        '''Bins the bounding boxes of the inhomogeneities in a uniform grid of about cellsPerInhom cells
+        per inhomogeneity. The boxes are padded a little, so that points on the boundary are candidates too'''
+        boxes = []; unbounded = []
+        boxcells = -ones((len(self.inhomList),4),'i')
+        for i,inhom in enumerate(self.inhomList):
+            bb = inhom.boundingBox()
+            if bb is None:
+                unbounded.append(i)
+            else:
+                pad = 1e-8 * max( bb[1]-bb[0], bb[3]-bb[2], 1.0 )
+                boxes.append( (i, bb[0]-pad, bb[1]+pad, bb[2]-pad, bb[3]+pad) )
+        if len(boxes) == 0:
+            self.inhomIndex = (0.0,0.0,1.0,1.0,0,0,[],boxcells,unbounded)
+            return
+        b = array(boxes)
+        x0 = b[:,1].min(); y0 = b[:,3].min()
+        width = max( b[:,2].max() - x0, 1e-8 ); height = max( b[:,4].max() - y0, 1e-8 )
+        Ncells = self.cellsPerInhom * len(boxes)
+        Nx = int( min( max( round( sqrt( Ncells * width / height ) ), 1 ), Ncells ) )
+        Ny = int( min( max( round( float(Ncells) / Nx ), 1 ), Ncells ) )
+        dx = width / Nx; dy = height / Ny
+        cells = [ [] for i in range(Nx*Ny) ]
+        for i,xmin,xmax,ymin,ymax in boxes:
+            ix1,ix2 = [ min( int( (xx-x0) / dx ), Nx-1 ) for xx in (xmin,xmax) ]
+            iy1,iy2 = [ min( int( (yy-y0) / dy ), Ny-1 ) for yy in (ymin,ymax) ]
+            boxcells[int(i)] = [ix1,ix2,iy1,iy2]
+            for iy in range(iy1,iy2+1):
+                for ix in range(ix1,ix2+1):
+                    cells[iy*Nx+ix].append(int(i))
+        if len(unbounded) > 0:  # Keep the order of inhomList, as the first inhomogeneity that contains a point wins
+            cells = [ sorted(c + unbounded) for c in cells ]
+        self.inhomIndex = (x0,y0,dx,dy,Nx,Ny,cells,boxcells,unbounded)
+    def inhomCandidates(self,x,y):
+        '''Returns the indices in inhomList of the inhomogeneities that may contain the point x,y'''
+        if self.inhomIndex is None: self.buildInhomIndex()
+        x0,y0,dx,dy,Nx,Ny,cells,boxcells,unbounded = self.inhomIndex
+        ix = (x-x0) / dx; iy = (y-y0) / dy
+        if ix < 0 or ix >= Nx or iy < 0 or iy >= Ny: return unbounded
+        return cells[int(iy)*Nx+int(ix)]
     def findAquiferData(self,x,y):
         rv = self
-        for inhom in self.inhomList:
+        if len(self.inhomList) == 0: return rv
+        for i in self.inhomCandidates(x,y):
+            inhom = self.inhomList[i]
             if inhom.isInside(x,y):
                 rv = inhom
                 return rv
         return rv
-  
+    def findAquiferDataArray(self,x,y):
+        '''Returns list of AquiferData (background aquifer first, followed by inhomList)
+        and integer array with for each point (x,y) the index in that list.
+        The points are binned in the cells of inhomIndex; every inhomogeneity only tests the points in
+        the cells of its bounding box that are not yet in an earlier inhomogeneity, with isInsideArray'''
+        aqlist = [self] + self.inhomList
+        x = asarray(x,'d'); y = asarray(y,'d')
+        iaq = zeros(len(x),'i')
+        if len(self.inhomList) == 0: return aqlist,iaq
+        if self.inhomIndex is None: self.buildInhomIndex()
+        x0,y0,dx,dy,Nx,Ny,cells,boxcells,unbounded = self.inhomIndex
+        ix = floor( (x-x0) / dx ); iy = floor( (y-y0) / dy )
+        cell = where( (ix >= 0) & (ix < Nx) & (iy >= 0) & (iy < Ny), iy*Nx+ix, -1 ).astype('i')
+        order = argsort(cell,kind='mergesort'); cellsorted = cell[order]
+        for i,inhom in enumerate(self.inhomList):
+            ix1,ix2,iy1,iy2 = boxcells[i]
+            if ix1 < 0:
+                index = flatnonzero( iaq == 0 )
+            else:
+                rows = arange(iy1,iy2+1) * Nx
+                start = searchsorted(cellsorted,rows+ix1); end = searchsorted(cellsorted,rows+ix2+1)
+                index = concatenate( [ order[s:e] for s,e in zip(start,end) ] )
+                index = index[ iaq[index] == 0 ]
+            if len(index) == 0: continue
+            iaq[ index[ inhom.isInsideArray(x[index],y[index]) ] ] = i+1
+        return aqlist,iaq
+    def findAquiferDataGrid(self,xg,yg):
+        '''Returns list of AquiferData and the raster of aquifer ids, of the same shape as xg and yg, as
+        findAquiferDataArray. The raster is kept and returned again for the same grid (for example when
+        contouring several layers or after a new solve), until an inhomogeneity is added'''
+        xg = asarray(xg,'d'); yg = asarray(yg,'d')
+        if self.gridMask is not None:
+            xm,ym,iaq = self.gridMask
+            if xm.shape == xg.shape and all( xm == xg ) and all( ym == yg ):
+                return [self] + self.inhomList, iaq
+        aqlist,iaq = self.findAquiferDataArray(xg.ravel(),yg.ravel())
+        iaq = iaq.reshape(xg.shape)
+        self.gridMask = (xg.copy(),yg.copy(),iaq)
+        return aqlist,iaq
+
 class PolygonInhom(AquiferData):
     '''Class containing data of a polygonal inhomogeneity. Derived from AquiferData
     Attributes provided on input:
@@ -222,6 +326,24 @@ class PolygonInhom(AquiferData):
             angle = sum(angles)
             if angle > pi: rv = 1
         return rv
+    def isInsideArray(self,x,y):
+        '''Returns boolean array that is True where the points x,y (arrays) are inside, with the
+        same arithmetic as isInside, one row of sides per point'''
+        x = asarray(x,'d'); y = asarray(y,'d')
+        rv = zeros(len(x),bool)
+        index = flatnonzero( (x >= self.xmin) & (x <= self.xmax) & (y >= self.ymin) & (y <= self.ymax) )
+        if len(index) == 0: return rv
+        z = x[index] + 1j * y[index]
+        bigZ = ( 2.0*z[:,newaxis] - (self.z1 + self.z2) )/ (self.z2 - self.z1)
+        bigZmin1 = bigZ - 1.0; bigZplus1 = bigZ + 1.0
+        inside = ( abs(bigZmin1).min(1) < self.tiny ) | ( abs(bigZplus1).min(1) < self.tiny )  # At a corner
+        i = flatnonzero( ~inside )
+        angle = log( bigZmin1[i] / bigZplus1[i] ).imag.sum(1)
+        inside[i] = angle > pi
+        rv[index] = inside
+        return rv
+    def boundingBox(self):
+        return (self.xmin,self.xmax,self.ymin,self.ymax)
     def movePoint(self,zin):
         # Move point if at corner point; this doesn't happy very often, so it is not that efficient
         bigZ = ( 2.0*zin - (self.z1 + self.z2) )/ (self.z2 - self.z1)
@@ -392,6 +514,10 @@ class CircleInhomData(AquiferData):
                                                           list(self.c),self.xc,self.yc,self.R))
     def isInside(self,x,y):
         return ( (x-self.xc)**2 + (y-self.yc)**2 ) < self.Rsq
+    def isInsideArray(self,x,y):
+        return ( (asarray(x)-self.xc)**2 + (asarray(y)-self.yc)**2 ) < self.Rsq
+    def boundingBox(self):
+        return (self.xc-self.R,self.xc+self.R,self.yc-self.R,self.yc+self.R)
     def layout(self):
         theta = arange(0,2*pi+1e-5,pi/50)
         return [ list( self.xc + self.R * cos(theta) ), list( self.yc + self.R * sin(theta) ) ]
@@ -471,6 +597,10 @@ class EllipseInhomData(AquiferData):
     def isInside(self,x,y):
         [eta,psi] = self.xytoetapsi(x,y)
         return eta < self.etastar
+    def boundingBox(self):
+        hx = sqrt( (self.along*self.cosal)**2 + (self.bshort*self.sinal)**2 )
+        hy = sqrt( (self.along*self.sinal)**2 + (self.bshort*self.cosal)**2 )
+        return (self.xc-hx,self.xc+hx,self.yc-hy,self.yc+hy)
     def outwardNormal(self,x,y):
         [eta,psi] = self.xytoetapsi(x,y)
         alpha = arctan2( cosh(eta)*sin(psi), sinh(eta)*cos(psi) ) + self.angle
@@ -0,0 +1,86 @@
+'''
+mlclosedform.py contains the ClosedForm class
+This file is part of the TimML library and is distributed under
+the GNU LPGL. See the TimML.py file for more details.
+'''
+
+from numpy import *
+
+class ClosedForm:
+    '''Closed-form solution of a model with one confined aquifer without inhomogeneities
+    that contains at most one Constant and any number of wells (see Model.isClosedForm).
+    The potential is C + sum of Qw*log(r**2/rw**2)/(4*pi) over the wells, so the
+    Constant follows directly from the head at the reference point and the potential
+    is evaluated for arrays of points and wells at once.
+    Attributes:
+    - modelParent: model it belongs to
+    - xw, yw, Qw, rwsq: arrays with locations, discharges and squared radii of the wells
+    - constant: Constant element or None
+    - T: transmissivity of the aquifer
+    '''
+    Nblock = 2**16  # Maximum number of well-point pairs evaluated at once
+    Ngroup = 4  # Minimum number of wells with equal discharge that share logarithms
+    def __init__(self,ml):
+        self.modelParent = ml
+        wells = [el for el in ml.elementList if el.type == 'well']
+        Qw = array([w.parameters[0,0] for w in wells],'d')
+        order = argsort(Qw,kind='mergesort')  # Wells with equal discharge are adjacent
+        self.xw = array([w.xw for w in wells],'d')[order]
+        self.yw = array([w.yw for w in wells],'d')[order]
+        self.Qw = Qw[order]
+        self.rwsq = array([w.rwsq for w in wells],'d')[order]
+        self.constant = None
+        for el in ml.elementList:
+            if el.type == 'constant': self.constant = el
+        self.T = ml.aq.T[0]
+        # Groups of Ngroup or more wells with equal discharge (start,end) and indices of all other wells
+        self.groups = []; self.single = []
+        start = 0
+        for i in range(1,len(self.Qw)+1):
+            if i == len(self.Qw) or self.Qw[i] != self.Qw[start]:
+                if i - start >= self.Ngroup:
+                    self.groups.append((start,i))
+                else:
+                    self.single.extend(range(start,i))
+                start = i
+        self.single = array(self.single,'i')
+    def solve(self):
+        '''Sets the parameter of the Constant so that the head at the reference point is met'''
+        if self.constant is None: return
+        potwells = self.potentialWells(array([self.constant.xr]),array([self.constant.yr]))[0]
+        self.constant.parameters[0,0] = self.constant.pot - potwells
+    def potentialWells(self,x,y):
+        '''Returns array with the potential of all wells at the points x,y (arrays of length N).
+        Within a group of wells with equal discharge the log of the product of r**2/rw**2 is
+        taken over as many wells as possible without overflow'''
+        pot = zeros(len(x),'d')
+        if len(self.xw) == 0: return pot
+        Npoints = max( self.Nblock / len(self.xw), 1 )
+        for i in range(0,len(x),Npoints):
+            xb = x[i:i+Npoints]; yb = y[i:i+Npoints]
+            ratio = subtract.outer(xb,self.xw); ratio *= ratio
+            dysq = subtract.outer(yb,self.yw); dysq *= dysq
+            ratio += dysq
+            maximum(ratio,self.rwsq,ratio); ratio /= self.rwsq  # r**2/rw**2 >= 1
+            potb = pot[i:i+Npoints]
+            if len(self.single) > 0:
+                potb += dot( log(ratio[:,self.single]), self.Qw[self.single] )
+            if len(self.groups) > 0:
+                rmaxsq = max( xb.max()-self.xw.min(), self.xw.max()-xb.min() )**2 + \
+                         max( yb.max()-self.yw.min(), self.yw.max()-yb.min() )**2
+                Nprod = int( 700.0 / log( max( rmaxsq / self.rwsq.min(), e ) ) )  # exp(709) is the largest double
+                for start,end in self.groups:
+                    if Nprod < 2:
+                        potb += self.Qw[start] * log(ratio[:,start:end]).sum(1)
+                    else:
+                        for j in range(start,end,Nprod):
+                            potb += self.Qw[start] * log( ratio[:,j:min(j+Nprod,end)].prod(1) )
+        return pot / (4*pi)
+    def potentialArray(self,x,y):
+        '''Returns array of potentials at the points x,y (arrays of length N)'''
+        pot = self.potentialWells(x,y)
+        if self.constant is not None: pot = pot + self.constant.parameters[0,0]
+        return pot
+    def headArray(self,x,y):
+        '''Returns array of heads at the points x,y (arrays of length N)'''
+        return self.potentialArray(x,y) / self.T
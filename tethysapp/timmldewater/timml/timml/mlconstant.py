@@ -44,6 +44,10 @@ class Constant(Element):
         pot = zeros((1,aq.Naquifers),'d')
         if aq.type == aq.conf: pot[0,0] = 1.0
         return pot
+    def potentialInfluenceArray(self,aq,x,y):
+        pot = zeros((1,aq.Naquifers,len(x)),'d')
+        if aq.type == aq.conf: pot[0,0,:] = 1.0
+        return pot
     def potentialContribution(self,aq,x,y):
         '''Returns VECTOR of potentialContribution; doesn't multiply with eigenvectors'''
         return self.parameters[0,0] * self.potentialInfluence(aq,x,y)[0,:]
@@ -51,11 +55,18 @@ class Constant(Element):
         if aq.type == aq.conf:
             potsum[0] = potsum[0] + self.parameters[0,0]
         return potsum
+    def potentialCollectionArray(self,potsum,elementList,aq,x,y):
+        if aq.type == aq.conf:
+            for el in elementList:
+                potsum[0,:] = potsum[0,:] + el.parameters[0,0]
+        return potsum
     def dischargeInfluence(self,aq,x,y):
         dis = zeros((1,aq.Naquifers),'d')
         return [ dis,dis ]
     def dischargeCollection(self,dissum,disadd,elementList,aq,x,y):
         return dissum
+    def dischargeCollectionArray(self,dissum,elementList,aq,x,y):
+        return dissum
     def totalDischargeInfluence(self,aq,pylayer,x,y):
         rv = zeros(1,'d')
         return rv    
@@ -67,6 +78,17 @@ class Constant(Element):
             row = hstack(( row, rowpart ))
         row = hstack(( row, self.pot - self.modelParent.potentialInLayer(self.aquiferParent,self.pylayer,self.xr,self.yr) ))
         return [row.tolist()]
+    def controlPoints(self):
+        return [ (self.aquiferParent,self.pylayer,self.xr,self.yr) ]
+    def fillMatrixRows(self,matrix,irow,elementList):
+        self.fillRhs(matrix[:,-1],irow,elementList)
+    def fillRhs(self,rhs,irow,elementList):
+        self.pot = self.aquiferParent.headToPotential(self.pylayer,self.head)  # head may have changed since setCoefs
+        rhs[irow] = rhs[irow] + self.pot
+    def potentialInfluenceInLayerArray(self,aq,pylayer,x,y):
+        rv = zeros((1,len(x)),'d')
+        if aq.type == aq.conf: rv[0,:] = aq.eigvec[pylayer,0]
+        return rv
     def getMatrixCoefficients(self,aq,pylayer,x,y,func):
         return func(self,aq,pylayer,x,y)
     def takeParameters(self,xsol,icount):
@@ -91,6 +113,12 @@ class NoFlowFromInfinity(Constant):
             row = hstack(( row, rowpart ))
         row = hstack(( row, -self.modelParent.totalDischargeFromInf() ))
         return [row.tolist()]
+    def controlPoints(self):
+        return None
+    def fillMatrixRows(self,matrix,irow,elementList):
+        Element.fillMatrixRows(self,matrix,irow,elementList)
+    def fillRhs(self,rhs,irow,elementList):
+        Element.fillRhs(self,rhs,irow,elementList)
     def check(self):
         print 'NoFlorFromInfinity. Constant: '+str(self.parameters[0,0])
         print 'Computed flow from infinity: '+str(self.modelParent.totalDischargeFromInf())
@@ -0,0 +1,227 @@
+'''
+mlcontour.py contains functions that contour a grid of heads without matplotlib:
+isolines and filled isobands with marching squares, as arrays of coordinates or GeoJSON
+This file is part of the TimML library and is distributed under
+the GNU LPGL. See the TimML.py file for more details.
+'''
+
+from numpy import *
+
+def cellEdges(h,lower,upper):
+    '''Returns the directed edges of the boundary of the part of the grid h (array of shape (M,N)) where
+    lower <= h < upper, as arrays start,end with the keys of the points, and a boolean array that is True for the
+    edges inside a cell (the isolines); the other edges are on the boundary of the grid. In every cell the part in
+    the band is a polygon that follows the sides of the cell from corner (i,j) to (i,j+1), (i+1,j+1) and (i+1,j)
+    and contains the corners in the band and the points on the sides where h crosses lower or upper (by linear
+    interpolation). Keys below M*N are the grid points (i*N+j); the other keys are M*N + 2*side + 0 (lower) or
+    1 (upper), where the sides along the rows are numbered i*(N-1)+j and the sides along the columns
+    M*(N-1)+i*N+j. The edges of a polygon along a side of its cell are also edges of the polygon of the neighboring
+    cell, in the opposite direction, so they are left out, except on the boundary of the grid'''
+    M,N = h.shape
+    r,c = meshgrid( arange(M-1), arange(N-1), indexing='ij' )
+    r = r.ravel(); c = c.ravel()
+    # Only cells with corners on both sides of a level, and cells in the band on the boundary of the grid, have edges
+    band = ( h >= lower ).astype('int8') + ( h >= upper )
+    corners = [ band[:-1,:-1].ravel(), band[:-1,1:].ravel(), band[1:,1:].ravel(), band[1:,:-1].ravel() ]
+    mixed = ( corners[0] != corners[1] ) | ( corners[0] != corners[2] ) | ( corners[0] != corners[3] )
+    boundary = ( r == 0 ) | ( r == M-2 ) | ( c == 0 ) | ( c == N-2 )
+    active = mixed | ( boundary & ( corners[0] == 1 ) )
+    r = r[active]; c = c[active]
+    node = lambda i,j: i*N + j
+    rowSide = lambda i,j: i*(N-1) + j
+    colSide = lambda i,j: M*(N-1) + i*N + j
+    # The four sides of every cell in the order of the polygon: start corner, end corner, side
+    sides = [ ( node(r,c), node(r,c+1), rowSide(r,c) ), ( node(r,c+1), node(r+1,c+1), colSide(r,c+1) ),
+              ( node(r+1,c+1), node(r+1,c), rowSide(r+1,c) ), ( node(r+1,c), node(r,c), colSide(r,c) ) ]
+    hflat = h.ravel()
+    keys = zeros((len(r),12),'int64'); valid = zeros((len(r),12),'bool')
+    for k,(a,b,side) in enumerate(sides):
+        ha = hflat[a]; hb = hflat[b]
+        keys[:,3*k] = a; valid[:,3*k] = ( ha >= lower ) & ( ha < upper )
+        crossLower = ( ha >= lower ) != ( hb >= lower )
+        crossUpper = ( ha >= upper ) != ( hb >= upper )
+        # Along a side h is linear, so lower is crossed before upper when h increases
+        up = ha < hb
+        keys[:,3*k+1] = M*N + 2*side + where(up,0,1); valid[:,3*k+1] = where(up,crossLower,crossUpper)
+        keys[:,3*k+2] = M*N + 2*side + where(up,1,0); valid[:,3*k+2] = where(up,crossUpper,crossLower)
+    index = flatnonzero(valid)
+    if len(index) == 0: return zeros(0,'int64'),zeros(0,'int64'),zeros(0,'bool')
+    cell = index // 12; slot = index % 12
+    points = keys.ravel()[index]
+    first = hstack(( True, cell[1:] != cell[:-1] ))
+    last = hstack(( cell[1:] != cell[:-1], True ))
+    firstOfCell = maximum.accumulate( where(first,arange(len(cell)),0) )
+    following = arange(1,len(cell)+1)
+    following[last] = firstOfCell[last]
+    start = points; end = points[following]
+    # An edge is along side k of the cell when it doesn't pass the corner at the end of side k
+    step = ( slot[following] - slot ) % 12
+    along = step <= 3 * ( slot // 3 ) + 3 - slot
+    side = slot // 3
+    rc = r[cell]; cc = c[cell]
+    outer = ( (side == 0) & (rc == 0) ) | ( (side == 1) & (cc == N-2) ) | \
+            ( (side == 2) & (rc == M-2) ) | ( (side == 3) & (cc == 0) )
+    chord = ~along
+    keep = ( step > 0 ) & ( start != end ) & ( chord | outer )
+    return start[keep],end[keep],chord[keep]
+
+def keyCoordinates(xg,yg,h,levels,keys):
+    '''Returns arrays x,y of the points with keys (see cellEdges); levels are lower,upper'''
+    M,N = h.shape
+    xflat = xg.ravel(); yflat = yg.ravel(); hflat = h.ravel()
+    keys = asarray(keys,'int64')
+    x = zeros(len(keys),'d'); y = zeros(len(keys),'d')
+    nodes = keys < M*N
+    x[nodes] = xflat[keys[nodes]]; y[nodes] = yflat[keys[nodes]]
+    crossing = keys[~nodes] - M*N
+    side = crossing // 2
+    level = array(levels,'d')[crossing % 2]
+    alongRow = side < M*(N-1)
+    # Interpolate from the grid point with the lower index, so that both cells of a side get the same point
+    a = where( alongRow, (side // (N-1))*N + side % (N-1), side - M*(N-1) )
+    b = where( alongRow, a + 1, a + N )
+    t = ( level - hflat[a] ) / ( hflat[b] - hflat[a] )
+    x[~nodes] = xflat[a] + t * ( xflat[b] - xflat[a] )
+    y[~nodes] = yflat[a] + t * ( yflat[b] - yflat[a] )
+    return x,y
+
+def chain(start,end):
+    '''Returns list of arrays of keys of the paths formed by the directed edges start,end: open paths first
+    (from a key that is not the end of an edge), then closed paths, which repeat their first key at the end'''
+    following = {}
+    for s,e in zip(start.tolist(),end.tolist()):
+        following.setdefault(s,[]).append(e)
+    ends = set(end.tolist())
+    paths = []
+    for first in [ s for s in start.tolist() if s not in ends ] + start.tolist():
+        if not following.get(first): continue
+        path = [first]
+        while following.get(path[-1]):
+            path.append( following[path[-1]].pop() )
+            if path[-1] == first: break
+        paths.append(path)
+    return [ array(path,'int64') for path in paths ]
+
+def insideRing(ring,x,y):
+    '''Returns True when point x,y is inside the closed ring (array of shape (n,2)), with the even-odd rule'''
+    x1 = ring[:-1,0]; y1 = ring[:-1,1]; x2 = ring[1:,0]; y2 = ring[1:,1]
+    crosses = ( y1 > y ) != ( y2 > y )
+    xcross = x1[crosses] + ( y - y1[crosses] ) * ( x2[crosses] - x1[crosses] ) / ( y2[crosses] - y1[crosses] )
+    return sum( x < xcross ) % 2 == 1
+
+def ringArea(ring):
+    '''Returns the absolute area of the closed ring (array of shape (n,2))'''
+    return 0.5 * abs( sum( ring[:-1,0] * ring[1:,1] - ring[1:,0] * ring[:-1,1] ) )
+
+def isolines(xg,yg,h,levels):
+    '''Returns list with for every level in levels a list of arrays of shape (n,2) with the coordinates of the
+    isolines of the grid h at the points xg,yg (arrays of shape (M,N), for example obtained with meshgrid).
+    A closed isoline repeats its first point at the end'''
+    xg = asarray(xg,'d'); yg = asarray(yg,'d'); h = asarray(h,'d')
+    lines = []
+    for level in atleast_1d(levels):
+        start,end,chord = cellEdges(h,level,inf)
+        paths = chain(start[chord],end[chord])
+        linesLevel = []
+        for path in paths:
+            x,y = keyCoordinates(xg,yg,h,[level,inf],path)
+            linesLevel.append( vstack((x,y)).T )
+        lines.append(linesLevel)
+    return lines
+
+def isobands(xg,yg,h,levels):
+    '''Returns list with for every band between two consecutive levels (lower <= h < upper) a list of polygons
+    of the grid h at the points xg,yg (arrays of shape (M,N), for example obtained with meshgrid). A polygon is a
+    list of closed rings (arrays of shape (n,2) that repeat their first point at the end): the outer ring and
+    its holes. The parts of the cells in a band are merged by leaving out the sides that two cells share'''
+    xg = asarray(xg,'d'); yg = asarray(yg,'d'); h = asarray(h,'d')
+    levels = atleast_1d(levels)
+    bands = []
+    for lower,upper in zip(levels[:-1],levels[1:]):
+        start,end,chord = cellEdges(h,lower,upper)
+        rings = []
+        for path in chain(start,end):
+            if len(path) < 4: continue
+            x,y = keyCoordinates(xg,yg,h,[lower,upper],path)
+            rings.append( vstack((x,y)).T )
+        bands.append( nestRings(rings) )
+    return bands
+
+def nestRings(rings):
+    '''Returns list of polygons (lists of rings, the outer ring first) from closed rings: a ring inside an odd
+    number of other rings is a hole of the smallest ring it is inside of'''
+    areas = array([ ringArea(ring) for ring in rings ])
+    contains = zeros((len(rings),len(rings)),'bool')
+    for i,ring in enumerate(rings):
+        xt = 0.5 * ( ring[0,0] + ring[1,0] ); yt = 0.5 * ( ring[0,1] + ring[1,1] )
+        for j,other in enumerate(rings):
+            if i != j and areas[j] > areas[i] and insideRing(other,xt,yt):
+                contains[j,i] = True
+    depth = contains.sum(0)
+    polygons = {}
+    for i in argsort(-areas) if len(rings) > 0 else []:
+        if depth[i] % 2 == 0:
+            polygons[i] = [ rings[i] ]
+        else:
+            outer = [ j for j in flatnonzero(contains[:,i]) if depth[j] == depth[i] - 1 ]
+            if len(outer) > 0: polygons[outer[0]].append( rings[i] )
+    return [ polygons[i] for i in sorted(polygons, key=lambda i: -areas[i]) ]
+
+def isolinesGeoJSON(lines,levels):
+    '''Returns a GeoJSON FeatureCollection with a MultiLineString for every level of isolines, with property level'''
+    features = []
+    for level,linesLevel in zip(atleast_1d(levels),lines):
+        features.append( { 'type': 'Feature',
+                           'geometry': { 'type': 'MultiLineString', 'coordinates': [ l.tolist() for l in linesLevel ] },
+                           'properties': { 'level': float(level) } } )
+    return { 'type': 'FeatureCollection', 'features': features }
+
+def isobandsGeoJSON(bands,levels):
+    '''Returns a GeoJSON FeatureCollection with a MultiPolygon for every band of isobands, with properties
+    lower and upper'''
+    levels = atleast_1d(levels)
+    features = []
+    for lower,upper,polygons in zip(levels[:-1],levels[1:],bands):
+        features.append( { 'type': 'Feature',
+                           'geometry': { 'type': 'MultiPolygon',
+                                         'coordinates': [ [ ring.tolist() for ring in p ] for p in polygons ] },
+                           'properties': { 'lower': float(lower), 'upper': float(upper) } } )
+    return { 'type': 'FeatureCollection', 'features': features }
+
+def gridLevels(h,levels,filled=False):
+    '''Returns array of levels as timcontour: a list is start,stop,step (as arange), an array is used as is and
+    an integer is the number of levels equally spaced between the smallest and largest head (for isobands
+    including the smallest and largest head, so that the bands cover the grid)'''
+    if type(levels) is list:
+        return arange( levels[0],levels[1],levels[2] )
+    elif isinstance(levels,ndarray):
+        return levels
+    hmin = nanmin(h); hmax = nanmax(h)
+    if filled:
+        return linspace( hmin, hmax + 1e-10 * max(abs(hmax),1.0), levels+1 )
+    return linspace( hmin, hmax, levels+2 )[1:-1]
+
+def timcontour( ml, xmin, xmax, nx, ymin, ymax, ny, layers = 1, levels = 10, fillcontour = 0, returnheads = 0,
+                verbose = True, workers = 1, **kwargs ):
+    '''Contours head without matplotlib (timcontour with plot=False). Returns a list with for every layer the
+    isolines (see isolines) or, with fillcontour, the isobands (see isobands) and the levels, preceded by
+    xg,yg,head with returnheads. Options of timcontour that only affect the plot are ignored'''
+    if layers == 'all':
+        aquiferRange = range(ml.aq.Naquifers)
+    elif type(layers) == list:
+        aquiferRange = layers
+    else:
+        aquiferRange = range( min(layers,ml.aq.Naquifers) )
+    xg,yg = meshgrid( linspace( xmin, xmax, nx ), linspace( ymin, ymax, ny ) )
+    if verbose: print 'grid of '+str((nx,ny))+'. gridding in progress. hit ctrl-c to abort'
+    head = ml.evaluate_grid( xg, yg, aquiferRange, workers )
+    contours = []
+    for k in range(len(aquiferRange)):
+        levelsLayer = gridLevels( head[k], levels, fillcontour )
+        if fillcontour:
+            contours.append( ( isobands( xg, yg, head[k], levelsLayer ), levelsLayer ) )
+        else:
+            contours.append( ( isolines( xg, yg, head[k], levelsLayer ), levelsLayer ) )
+    if returnheads:
+        return xg,yg,head,contours
+    return contours
@@ -47,6 +47,14 @@ class Element:
         for e in elementList:
             potsum = potsum + e.potentialContribution(aq,x,y)
         return potsum
+    def potentialCollectionArray(self,potsum,elementList,aq,x,y):
+        '''Adds the potential of all elements in elementList at the points x,y (arrays of length N)
+        to potsum, which is an array of shape (aq.Naquifers,N); doesn't multiply with eigenvectors.
+        Loops over the points; overload with a vectorized version where possible'''
+        potadd = zeros(aq.Naquifers,'d')
+        for i in range(len(x)):
+            potsum[:,i] = self.potentialCollection(potsum[:,i],potadd,elementList,aq,x[i],y[i])
+        return potsum
     def potentialInfluenceAllLayers(self,aq,pylayer,x,y):
         '''Returns PotentialInfluence function in aquifer aq in all layers'''
         # Faster version, the old one was DOG slow
@@ -59,6 +67,14 @@ class Element:
         for e in elementList:
             dissum = dissum + e.dischargeContribution(aq,x,y)
         return dissum
+    def dischargeCollectionArray(self,dissum,elementList,aq,x,y):
+        '''Adds the discharge of all elements in elementList at the points x,y (arrays of length N)
+        to dissum, which is an array of shape (2,aq.Naquifers,N); doesn't multiply with eigenvectors.
+        Loops over the points; overload with a vectorized version where possible'''
+        disadd = zeros((2,aq.Naquifers),'d')
+        for i in range(len(x)):
+            dissum[:,:,i] = self.dischargeCollection(dissum[:,:,i],disadd,elementList,aq,x[i],y[i])
+        return dissum
     def dischargeInfluence(self,aq,x,y):
         '''Returns an array containing two lists, one for Qx, one for Qy.
         Each list is a list of lists with Laplacian solution in first spot and
@@ -122,6 +138,59 @@ class Element:
         can be any of the influence functions that have the form
         func(self,aq,pylayer,x,y), or a combination there-off.'''
         return zeros(0,'d')
+    def Nunknowns(self):
+        '''Returns the number of unknown parameters of the element, which is also
+        the number of rows it adds to the matrix'''
+        return len( self.getMatrixCoefficients(self.aqdum,self.ldum,self.xdum,self.ydum,\
+                    lambda el,aqdum,ldum,xdum,ydum:el.zeroFunction(aqdum,ldum,xdum,ydum)) )
+    def controlPoints(self):
+        '''Returns a list with a tuple (aq,pylayer,x,y) for each row of the element when every
+        row specifies the potential in aq and pylayer at (x,y). Model.assembleMatrix fills the
+        coefficients of these rows with potentialInfluenceInLayerArray of all elements and
+        puts minus the potential at (x,y) in the right-hand side; fillMatrixRows adds the rest.
+        Returns None when the rows are built with getMatrixRows'''
+        return None
+    def fillMatrixRows(self,matrix,irow,elementList):
+        '''Fills the rows of the element in matrix, the preallocated array of Model.assembleMatrix,
+        starting at row irow, which is also the column of the first unknown parameter of the element.
+        Copies the rows of getMatrixRows; overload together with controlPoints'''
+        rows = self.getMatrixRows(elementList)
+        if len(rows) > 0:
+            matrix[irow:irow+len(rows),:] = rows
+    def fillRhs(self,rhs,irow,elementList):
+        '''Fills the right-hand side of the rows of the element in rhs, starting at row irow.
+        For elements with controlPoints, rhs already contains minus the potential at the control points.
+        Takes the last column of getMatrixRows; overload together with controlPoints'''
+        rows = self.getMatrixRows(elementList)
+        for i in range(len(rows)):
+            rhs[irow+i] = rows[i][-1]
+    def potentialInfluenceInLayerArray(self,aq,pylayer,x,y):
+        '''Returns the matrix coefficients of the unknown parameters of the element for the potential
+        in aq and pylayer at the points x,y (arrays of length N) as an array of shape (Nunknowns,N).
+        Loops over the points; overload with a vectorized version where possible'''
+        rv = zeros((self.Nunknowns(),len(x)),'d')
+        for i in range(len(x)):
+            rv[:,i] = self.getMatrixCoefficients(aq,pylayer,x[i],y[i],\
+                          lambda el,aq,pylayer,x,y:el.potentialInfluenceInLayer(aq,pylayer,x,y))
+        return rv
+    def potentialInfluenceCollectionArray(self,elementList,aq,pylayer,x,y):
+        '''Returns potentialInfluenceInLayerArray of the elements in elementList stacked in one array
+        of shape (sum of their Nunknowns,N). Called for the first element of a list of elements that share
+        this method; overload with a version vectorized over the elements where possible'''
+        return vstack( [zeros((0,len(x)),'d')] + [ el.potentialInfluenceInLayerArray(aq,pylayer,x,y) for el in elementList ] )
+    def potentialInfluenceArray(self,aq,x,y):
+        '''Returns potentialInfluence at the points x,y (arrays of length N) as an array of shape
+        (Nparameters,aq.Naquifers,N); doesn't multiply with eigenvectors.
+        Loops over the points; overload with a vectorized version where possible'''
+        if len(x) == 0: return zeros((len(self.parameters),aq.Naquifers,0),'d')
+        rv = zeros(self.potentialInfluence(aq,x[0],y[0]).shape+(len(x),),'d')
+        for i in range(len(x)):
+            rv[:,:,i] = self.potentialInfluence(aq,x[i],y[i])
+        return rv
+    def potentialParameters(self,aq):
+        '''Returns the parameters that multiply potentialInfluence in potentialContribution for aq,
+        as an array that broadcasts to shape (Nparameters,aq.Naquifers)'''
+        return self.parameters
     def takeParameters(self,xsol,icount):
         ''' This method is passed the solution vector and a counter. It sets its
         unknown parameters equal to the values of the solution vector, starting at
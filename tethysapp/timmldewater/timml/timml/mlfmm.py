@@ -0,0 +1,246 @@
+'''
+mlfmm.py contains the FarField class
+This file is part of the TimML library and is distributed under
+the GNU LPGL. See the TimML.py file for more details.
+'''
+
+from numpy import *
+from mlwell import Well
+from mllinesink import LineSink, DoubleLineSink
+
+class FarField:
+    '''Treecode for the potential of many wells and line-sinks at many points in AquiferData aq.
+    Sources and points are sorted in a quadtree along a Morton (Z-order) curve, so that the points
+    in a box are contiguous at every level. The Laplace part of the sources in a cell is represented
+    by a multipole expansion about the center of the cell, which is evaluated at the points in boxes
+    that are more than separation boxes away at the level of the cell but not at the level above.
+    The points within separation boxes of a leaf cell get the exact contribution (Laplace and Bessel
+    parts) from the potentialCollectionArray functions of the elements. Leaves are at least so large
+    that the Bessel parts, which are truncated beyond Rconv leakage factors, are zero outside the near field.
+    Attributes provided on input:
+    - modelParent: model it belongs to
+    - aq: AquiferData in which the points lie
+    - tol: relative accuracy of the multipole expansions
+    Attributes computed:
+    - wells, linesinks: elements handled by the treecode (see handles)
+    - laplace: Laplace coefficient of every source (zero without Laplace part in aq), and haslaplace
+    - Nterms: number of terms of the multipole expansions
+    - Nlevels: number of levels of the quadtree of the last evaluation
+    - tree: quadtree of the points of the last call of buildTree
+    '''
+    separation = 2  # Boxes within this many boxes of a cell are in its near field
+    Rconv = 7.0  # Bessel parts of wells and line-sinks are zero beyond Rconv leakage factors
+    # Estimated costs relative to one term of an expansion at one point
+    Cwell = 3.0  # Well-point pair
+    Clinesink = 60.0  # Line-sink-point pair
+    Clog = 10.0  # Logarithm of an expansion at one point
+    Ccell = 2000.0  # Python overhead of a cell
+    def __init__(self,ml,aq,tol=1e-6):
+        self.modelParent = ml
+        self.aq = aq
+        self.tol = float(tol)
+        self.wells = [el for el in ml.elementList if self.handles(el) and isinstance(el,Well)]
+        self.linesinks = [el for el in ml.elementList if self.handles(el) and isinstance(el,LineSink)]
+        self.Nlevels = 0
+        # Multipole coefficients: potential of a source is Re( a0 * log(z-zs) + sum of a[k] (z-zs)**-k ) + constant
+        xw = array([w.xw for w in self.wells],'d'); yw = array([w.yw for w in self.wells],'d')
+        zw = xw + 1j * yw
+        z1 = array([complex(ls.x1,ls.y1) for ls in self.linesinks],'D')
+        z2 = array([complex(ls.x2,ls.y2) for ls in self.linesinks],'D')
+        L = abs(z2 - z1)
+        self.zs = hstack(( zw, 0.5 * (z1 + z2) ))
+        self.rs = hstack(( zeros(len(zw),'d'), 0.5 * L ))  # Radius of the source around zs
+        self.z1 = hstack(( zw, z1 )); self.z2 = hstack(( zw, z2 ))
+        self.source = self.wells + self.linesinks
+        self.iswell = hstack(( ones(len(zw),'bool'), zeros(len(z1),'bool') ))
+        # Laplace coefficient; zero for sources without a Laplace part in aq
+        self.laplace = zeros(len(self.source),'d')
+        self.haslaplace = zeros(len(self.source),'bool')
+        self.bessel = zeros(len(self.source),'bool')
+        for i,el in enumerate(self.source):
+            if el.aquiferParent.type == el.aquiferParent.conf and aq.type == aq.conf:
+                self.haslaplace[i] = True
+                self.laplace[i] = el.paramxcoef[0]
+            if el.aquiferParent == aq and ( aq.Naquifers > 1 or aq.type == aq.semi ):
+                self.bessel[i] = True
+        self.unitA0 = hstack(( ones(len(zw),'d'), L )) / (2*pi)  # a0 of a unit Laplace coefficient
+        rw = array([w.rw for w in self.wells],'d')
+        self.unitConstant = -self.unitA0 * log( hstack(( rw, 0.5 * L )) )
+        # Smallest leaf: line-sinks at most half a box outside their box, Bessel parts within the near field
+        self.minwidth = 2.0 * max(self.rs.max(),1e-3) if len(self.rs) > 0 else 1e-3
+        if self.bessel.any():
+            besselwidth = ( self.Rconv * max(aq.lab) + self.rs[self.bessel].max() ) / self.separation
+            self.minwidth = max( self.minwidth, besselwidth )
+        # Ratio of cell radius and distance to the nearest far point, and number of terms for tol
+        rho = ( 0.5 * sqrt(2.0) + 0.5 ) / ( self.separation + 0.5 )
+        self.Nterms = max( int( ceil( log(self.tol * (1.0 - rho)) / log(rho) ) ), 2 )
+    def handles(self,el):
+        '''Returns True if element el is evaluated by the treecode'''
+        if isinstance(el,Well): return True
+        return isinstance(el,LineSink) and not isinstance(el,DoubleLineSink)
+    def mortonKeys(self,ix,iy,Nlevels):
+        '''Returns Morton keys of the boxes with integer coordinates ix,iy'''
+        key = zeros(len(ix),'int64')
+        for b in range(Nlevels):
+            key |= ( (ix >> b) & 1 ) << (2*b)
+            key |= ( (iy >> b) & 1 ) << (2*b+1)
+        return key
+    def maxLevels(self,width):
+        '''Returns the largest number of levels of a quadtree of width with leaves of at least minwidth'''
+        Lmax = int( floor( log( width / self.minwidth ) / log(2.0) ) ) if width > self.minwidth else 0
+        return min( Lmax, 15 )
+    def numberOfLevels(self,Npoints,width):
+        '''Returns the number of levels of the quadtree with the smallest estimated cost'''
+        Ns = len(self.source)
+        Lmax = self.maxLevels(width)
+        Nnear = (2*self.separation+1)**2
+        Nfar = (2*(2*self.separation+1))**2 - Nnear
+        Cnear = where( self.iswell, self.Cwell, self.Clinesink ).mean()
+        best = 0; bestcost = Npoints * Ns * Cnear
+        for L in range(2,Lmax+1):
+            cost = Npoints * min( Nnear * float(Ns) / 4**L, Ns ) * Cnear
+            for l in range(2,L+1):
+                Ncells = min( 4**l, Ns )
+                cost = cost + Npoints * min( Nfar, Ncells ) * (self.Nterms + self.Clog) + Ncells * self.Ccell
+            if cost < bestcost:
+                best = L; bestcost = cost
+        return best
+    def multipoles(self,laplace,isource,cell,zc):
+        '''Returns array of shape (Ncells,Nterms+1) with the coefficients of the expansions about the
+        centers zc of the cells for the Laplace coefficients laplace of the sources; cell is the cell
+        number of sources isource, in increasing order'''
+        b = zeros((len(zc),self.Nterms+1),'D')
+        s = laplace[isource] != 0.0
+        isource = isource[s]; cell = cell[s]
+        if len(cell) == 0: return b
+        a0 = laplace[isource] * self.unitA0[isource]; iswell = self.iswell[isource]
+        z1 = self.z1[isource] - zc[cell]; z2 = self.z2[isource] - zc[cell]
+        terms = empty((len(cell),self.Nterms+1),'D')
+        terms[:,0] = a0
+        # Wells: -a0 z0**l / l; line-sinks: -a0 ( z2**(l+1) - z1**(l+1) ) / ( l (l+1) (z2-z1) )
+        dz = where( iswell, 1.0, z2 - z1 )
+        p1 = z1.copy(); p2 = z2.copy()
+        for l in range(1,self.Nterms+1):
+            p1 *= z1; p2 *= z2
+            terms[:,l] = where( iswell, -a0 * z1**l / l, -a0 * (p2 - p1) / ( l * (l+1) * dz ) )
+        # Sum of the terms of the sources of every cell, which are contiguous
+        cells,first = unique(cell,return_index=True)
+        b[cells] = add.reduceat(terms,first,0)
+        return b
+    def potentialCollectionArray(self,potsum,x,y):
+        '''Adds the potential of the wells and line-sinks at the points x,y (arrays of length N) to potsum,
+        which is an array of shape (aq.Naquifers,N); doesn't multiply with eigenvectors'''
+        if len(self.source) == 0 or len(x) == 0: return potsum
+        L = self.buildTree(x,y)
+        if L < 2:  # No far field; direct evaluation
+            return self.nearField(potsum,arange(len(x)),arange(len(self.source)),x,y)
+        potsum[0] += self.farFieldArray(self.laplace)
+        for index,isource in self.leaves():
+            potsum = self.nearField(potsum,index,isource,x,y)
+        return potsum
+    def buildTree(self,x,y,Nlevels=None):
+        '''Sorts the points x,y (arrays of length N) and the sources in a quadtree of Nlevels levels
+        (numberOfLevels when None) and stores it in tree, with the boxes of the points and sources at the
+        deepest level and for every level the cell of every source, the centers of the cells and the
+        interaction lists as pairs of points (in Morton order) and cells, with the position of the
+        points relative to the centers of the cells; returns the number of levels'''
+        zp = x + 1j * y
+        xmin = min( x.min(), self.zs.real.min() ); xmax = max( x.max(), self.zs.real.max() )
+        ymin = min( y.min(), self.zs.imag.min() ); ymax = max( y.max(), self.zs.imag.max() )
+        width = max( xmax - xmin, ymax - ymin ) * (1.0 + 1e-9) + 1e-9
+        if Nlevels is None:
+            L = self.numberOfLevels(len(x),width)
+        else:
+            L = min( Nlevels, self.maxLevels(width) )
+        self.Nlevels = L
+        if L < 2:
+            self.tree = None
+            return L
+        N = 2**L; w = width / N
+        ixp = clip( ((x - xmin) / w).astype('int64'), 0, N-1 ); iyp = clip( ((y - ymin) / w).astype('int64'), 0, N-1 )
+        ixs = clip( ((self.zs.real - xmin) / w).astype('int64'), 0, N-1 ); iys = clip( ((self.zs.imag - ymin) / w).astype('int64'), 0, N-1 )
+        pkey = self.mortonKeys(ixp,iyp,L); skey = self.mortonKeys(ixs,iys,L)
+        porder = argsort(pkey,kind='mergesort'); pkey = pkey[porder]
+        sorder = argsort(skey,kind='mergesort'); skey = skey[sorder]
+        zpsorted = zp[porder]
+        sep = self.separation
+        levels = []
+        for l in range(2,L+1):
+            shift = 2*(L-l); Nl = 2**l; wl = width / Nl
+            pkeyl = pkey >> shift
+            cellkey,first,cell = unique( skey >> shift, return_index=True, return_inverse=True )
+            # Box coordinates of the cells
+            cx = (ixs[sorder] >> (L-l))[first]; cy = (iys[sorder] >> (L-l))[first]
+            zc = (xmin + (cx + 0.5) * wl) + 1j * (ymin + (cy + 0.5) * wl)
+            points = []; cells = []
+            for ic in range(len(cellkey)):
+                # Interaction list: children of the near field of the parent, outside the near field of the cell
+                px = cx[ic] >> 1; py = cy[ic] >> 1
+                bx = arange( max(2*(px-sep),0), min(2*(px+sep)+2,Nl) )
+                by = arange( max(2*(py-sep),0), min(2*(py+sep)+2,Nl) )
+                bx,by = [ a.ravel() for a in meshgrid(bx,by) ]
+                far = maximum( abs(bx - cx[ic]), abs(by - cy[ic]) ) > sep
+                if not far.any(): continue
+                index = self.pointsInBoxes(pkeyl,self.mortonKeys(bx[far],by[far],l))
+                if len(index) == 0: continue
+                points.append(index); cells.append( ic * ones(len(index),'int64') )
+            if len(points) == 0: continue
+            points = concatenate(points); cells = concatenate(cells)
+            levels.append( (cell,zc,points,cells,zpsorted[points] - zc[cells]) )
+        self.tree = (L,N,porder,pkey,sorder,skey,ixp,iyp,ixs,iys,levels)
+        return L
+    def farFieldArray(self,laplace):
+        '''Returns the Laplace potential at the points of the tree (in the order of the points given
+        to buildTree) of the sources with Laplace coefficients laplace, from their multipole expansions
+        only; the near field (see leaves) is left out'''
+        L,N,porder,pkey,sorder,skey,ixp,iyp,ixs,iys,levels = self.tree
+        pot = zeros(len(porder),'d')  # In Morton order of the points
+        constant = laplace * self.unitConstant
+        for cell,zc,points,cells,zr in levels:
+            b = self.multipoles(laplace,sorder,cell,zc)
+            const = bincount( cell, constant[sorder], len(zc) )
+            # Horner, all cells of the level at once
+            winv = 1.0 / zr
+            series = b[cells,self.Nterms]
+            for k in range(self.Nterms-1,0,-1):
+                series = series * winv + b[cells,k]
+            series = series * winv
+            pot += bincount( points, ( b[cells,0] * log(zr) + series ).real + const[cells], len(pot) )
+        rv = zeros(len(porder),'d')
+        rv[porder] = pot
+        return rv
+    def leaves(self):
+        '''Returns list of (points,sources) of the leaves of the tree: the indices of the points within
+        separation boxes of every leaf and of the sources in the leaf'''
+        L,N,porder,pkey,sorder,skey,ixp,iyp,ixs,iys,levels = self.tree
+        sep = self.separation
+        sx = ixs[sorder]; sy = iys[sorder]
+        cellkey,first = unique( skey, return_index=True )
+        last = hstack(( first[1:], len(skey) ))
+        rv = []
+        for ic in range(len(cellkey)):
+            bx = arange( max(sx[first[ic]]-sep,0), min(sx[first[ic]]+sep+1,N) )
+            by = arange( max(sy[first[ic]]-sep,0), min(sy[first[ic]]+sep+1,N) )
+            bx,by = [ a.ravel() for a in meshgrid(bx,by) ]
+            index = porder[ self.pointsInBoxes(pkey,self.mortonKeys(bx,by,L)) ]
+            if len(index) == 0: continue
+            rv.append( (index,sorder[first[ic]:last[ic]]) )
+        return rv
+    def pointsInBoxes(self,pkey,boxkeys):
+        '''Returns indices in the sorted keys pkey of the points in the boxes with keys boxkeys'''
+        start = searchsorted(pkey,boxkeys,'left'); end = searchsorted(pkey,boxkeys,'right')
+        length = end - start
+        if length.sum() == 0: return zeros(0,'int64')
+        offset = cumsum(length) - length
+        return arange(length.sum()) - repeat(offset,length) + repeat(start,length)
+    def nearField(self,potsum,index,isource,x,y):
+        '''Adds the exact potential of the sources isource at the points index to potsum'''
+        sub = zeros((potsum.shape[0],len(index)),'d')
+        wells = [self.source[i] for i in isource if self.iswell[i]]
+        linesinks = [self.source[i] for i in isource if not self.iswell[i]]
+        if len(wells) > 0:
+            sub = wells[0].potentialCollectionArray(sub,wells,self.aq,x[index],y[index])
+        if len(linesinks) > 0:
+            sub = linesinks[0].potentialCollectionArray(sub,linesinks,self.aq,x[index],y[index])
+        potsum[:,index] += sub
+        return potsum
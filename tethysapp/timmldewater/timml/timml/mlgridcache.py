@@ -0,0 +1,163 @@
+'''
+mlgridcache.py contains the GridCache and UnitResponse classes
+This file is part of the TimML library and is distributed under
+the GNU LPGL. See the TimML.py file for more details.
+'''
+
+from numpy import *
+
+class GridCache:
+    '''Heads of a model on a fixed grid as the superposition of the potentials of its elements at unit
+    strength, for a model that is edited and solved again while the grid stays the same (for example when
+    a well is moved). The potential of every parameter of every element at unit strength is computed on
+    the grid once with potentialInfluenceArray. After an edit, only the elements passed to update and the
+    elements that were added to the model are computed again; heads multiplies the grids with the current
+    parameters of the elements (potentialParameters) in one weighted sum, so the model must be solved
+    again before heads is called.
+    The AquiferData of the grid points are looked up once, so the inhomogeneities may not be changed
+    Attributes provided on input:
+    - modelParent: model it belongs to
+    - xg,yg: arrays of the same shape with the points of the grid
+    Attributes computed:
+    - aqlist: list of AquiferData of the grid points
+    - index: list with the points (in xg.ravel()) in every AquiferData of aqlist
+    - elements: list of elements of which the grids are stored, in the order of unit
+    - slices: dict with the rows of unit of every element in elements
+    - unit: list with an array of shape (Nrows,Naquifers,Npoints) for every AquiferData of aqlist,
+      with the potentials of the parameters of all elements at unit strength (not multiplied with eigenvectors)
+    '''
+    def __init__(self,ml,xg,yg):
+        self.modelParent = ml
+        self.xg = asarray(xg,'d'); self.yg = asarray(yg,'d')
+        self.aqlist,iaq = ml.aq.findAquiferDataGrid(self.xg,self.yg)
+        iaq = iaq.ravel()
+        self.index = [ flatnonzero( iaq == i ) for i in range(len(self.aqlist)) ]
+        self.x = self.xg.ravel(); self.y = self.yg.ravel()
+        self.elements = []; self.slices = {}
+        self.unit = [ zeros((0,aq.Naquifers,len(index)),'d') for aq,index in zip(self.aqlist,self.index) ]
+        self.update()
+    def __repr__(self):
+        return 'GridCache of ' + str(len(self.elements)) + ' elements on ' + str(self.xg.shape) + ' grid'
+    def unitGrids(self,el):
+        '''Returns list with potentialInfluenceArray of element el at the points in every AquiferData of aqlist'''
+        return [ el.potentialInfluenceArray(aq,self.x[index],self.y[index]) for aq,index in zip(self.aqlist,self.index) ]
+    def update(self,elementList=[]):
+        '''Computes the grids of the elements in elementList again (elements that were moved or otherwise
+        changed their geometry), computes the grids of elements that were added to the model and removes
+        the grids of elements that were removed. Changes of the strength of an element need no update'''
+        grids = {}
+        for el in self.modelParent.elementList:
+            if el in elementList or not self.slices.has_key(el):
+                grids[el] = self.unitGrids(el)
+        elements = list(self.modelParent.elementList)
+        if elements == self.elements:
+            resized = [ el for el in grids if self.rows(grids[el]) != self.slices[el].stop - self.slices[el].start ]
+            if len(resized) == 0:
+                for el in grids:
+                    for unit,grid in zip(self.unit,grids[el]):
+                        unit[self.slices[el]] = grid
+                return
+        # Elements were added, removed or changed their number of parameters: stack the grids again
+        stacks = [ [] for aq in self.aqlist ]; slices = {}
+        start = 0
+        for el in elements:
+            if grids.has_key(el):
+                elgrids = grids[el]
+            else:
+                elgrids = [ unit[self.slices[el]] for unit in self.unit ]
+            for stack,grid in zip(stacks,elgrids):
+                stack.append(grid)
+            slices[el] = slice(start,start+self.rows(elgrids))
+            start = start + self.rows(elgrids)
+        self.unit = [ concatenate( [zeros((0,aq.Naquifers,len(index)),'d')] + stack ) \
+                      for aq,index,stack in zip(self.aqlist,self.index,stacks) ]
+        self.elements = elements; self.slices = slices
+    def rows(self,grids):
+        '''Returns the number of rows of the grids of an element'''
+        if len(grids) == 0: return 0
+        return grids[0].shape[0]
+    def weights(self,aq,unit):
+        '''Returns array of shape (Nrows,aq.Naquifers) with the current parameters of the elements
+        for AquiferData aq (see potentialParameters), in the order of the rows of unit'''
+        weights = zeros(unit.shape[:2],'d')
+        for el in self.elements:
+            weights[self.slices[el]] = el.potentialParameters(aq)
+        return weights
+    def heads(self,layers=None):
+        '''Returns array of heads of shape (Nlayers,)+xg.shape, as evaluate_grid, superposing the grids
+        with the current parameters of the elements. Only works after a solve
+        layers: list of layers (numbered as in headVectorArray); all layers when None'''
+        if layers is None: layers = range(self.modelParent.aq.Naquifers)
+        layers = list(layers)
+        h = zeros((len(layers),self.xg.size),'d')
+        for aq,index,unit in zip(self.aqlist,self.index,self.unit):
+            pot = dot( aq.eigvec, einsum('ka,kan->an',self.weights(aq,unit),unit) )
+            hv = aq.potentialArrayToHeadArray(pot)
+            if aq.fakesemi: hv = hv[1:]
+            h[:,index] = hv[layers]
+        return h.reshape((len(layers),)+self.xg.shape)
+    def memory(self):
+        '''Returns the number of bytes of the stored grids'''
+        return sum([ unit.nbytes for unit in self.unit ])
+
+class UnitResponse:
+    '''Heads of a model on a grid and at points as a linear function of the discharges of a list of wells:
+    h = base + responses * Q, where base are the heads when all wells are off and every column of responses
+    is the change of the heads for a unit discharge of one well, with all other elements (the Constant,
+    head-specified line-sinks, inhomogeneities) solved again. This holds for models without non-linear
+    conditions, as the heads are linear in the discharges for a fixed geometry. The model is solved once
+    for the base and once for every well (with resolve_rhs, which reuses the factorization of the matrix,
+    when possible) and the heads on the grid are superposed with a GridCache. The discharges of the wells
+    and the solution of the model are restored at the end. Any discharges Q, also different for every well,
+    are then evaluated with one matrix-vector product; the model must be built again when a well moves
+    Attributes provided on input:
+    - modelParent: model it belongs to
+    - wells: list of wells of which the discharges vary
+    - layers: list of layers (numbered as in headVectorArray); all layers when None
+    Attributes computed:
+    - cache: GridCache of the grid (None without grid)
+    - x,y: arrays with the points (empty without points)
+    - base: array with the heads of the grid points followed by the points when all wells are off,
+      of shape (Nlayers*(Ngrid+Npoints),)
+    - responses: array of shape (Nlayers*(Ngrid+Npoints),Nwells) with the heads for a unit discharge of every well
+    '''
+    def __init__(self,ml,wells,xg=None,yg=None,x=None,y=None,layers=None,cache=None):
+        self.modelParent = ml
+        self.wells = list(wells)
+        if layers is None: layers = range(ml.aq.Naquifers)
+        self.layers = list(layers)
+        self.cache = cache
+        if self.cache is None and xg is not None: self.cache = GridCache(ml,xg,yg)
+        if x is None: x = zeros(0,'d'); y = zeros(0,'d')
+        self.x = atleast_1d(asarray(x,'d')); self.y = atleast_1d(asarray(y,'d'))
+        discharges = [ w.discharge for w in self.wells ]
+        self.base = self.solveHeads( zeros(len(self.wells),'d') )
+        self.responses = zeros((len(self.base),len(self.wells)),'d')
+        for i in range(len(self.wells)):
+            Q = zeros(len(self.wells),'d'); Q[i] = 1.0
+            self.responses[:,i] = self.solveHeads(Q) - self.base
+        self.solveHeads(discharges)
+    def __repr__(self):
+        return 'UnitResponse of ' + str(len(self.wells)) + ' wells at ' + str(self.responses.shape[0]) + ' heads'
+    def solveHeads(self,Q):
+        '''Solves the model with discharges Q of the wells and returns the heads of the grid and the points'''
+        ml = self.modelParent
+        for w,q in zip(self.wells,Q):
+            w.discharge = float(q)
+        if not ml.resolve_rhs(): ml.solve()
+        h = zeros((len(self.layers),0),'d')
+        if self.cache is not None: h = hstack(( h, self.cache.heads(self.layers).reshape(len(self.layers),-1) ))
+        if len(self.x) > 0: h = hstack(( h, ml.headVectorArray(self.x,self.y)[self.layers] ))
+        return h.ravel()
+    def allHeads(self,Q):
+        '''Returns array of shape (Nlayers,Ngrid+Npoints) with the heads for discharges Q of the wells'''
+        Q = asarray(Q,'d')
+        assert Q.shape == (len(self.wells),), 'TimML Input error: Q must have one discharge for every well'
+        return ( self.base + dot(self.responses,Q) ).reshape(len(self.layers),-1)
+    def heads(self,Q):
+        '''Returns array of heads of shape (Nlayers,)+xg.shape on the grid for discharges Q of the wells'''
+        xg = self.cache.xg
+        return self.allHeads(Q)[:,:xg.size].reshape((len(self.layers),)+xg.shape)
+    def pointHeads(self,Q):
+        '''Returns array of heads of shape (Nlayers,Npoints) at the points for discharges Q of the wells'''
+        return self.allHeads(Q)[:,-len(self.x):] if len(self.x) > 0 else zeros((len(self.layers),0),'d')
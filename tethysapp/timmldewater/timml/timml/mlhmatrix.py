@@ -0,0 +1,289 @@
+'''
+mlhmatrix.py contains the HMatrix class
+This file is part of the TimML library and is distributed under
+the GNU LPGL. See the TimML.py file for more details.
+'''
+
+from numpy import *
+from scipy.sparse import coo_matrix
+from mlsparse import _FillProxy
+from mlfmm import FarField
+
+class HMatrix:
+    '''Matrix of Model.assembleMatrix (without the right-hand side) stored as a hierarchical matrix,
+    for solver='hmatrix' of Model.solve. The rows of the control points and the columns of the
+    elements that have controlPoints share their positions, the control points, which are sorted in
+    a cluster tree by bisection of their bounding boxes. Pairs of clusters that are far apart compared
+    to their size (admissible) get a low-rank block U * V computed by adaptive cross approximation
+    (aca), which computes only some of the rows and columns of the block; the other pairs of leaves
+    get a dense block. Wells and line-sinks truncate their Bessel parts beyond Rconv leakage factors,
+    so clusters at distances around such a cutoff are not admissible, as the block is discontinuous
+    there. Every low-rank block is checked against the exact entries of a few random rows and columns
+    that were not pivots, and is stored dense when it is less accurate than tol.
+    The columns of the elements without controlPoints and of the Constant (at the control points)
+    and their rows (from getMatrixRows, and computed with entries for the Constant) are stored dense.
+    The unknown of the Constant is a potential, which is orders of magnitude larger than the strengths
+    of the other elements, so the error of a low-rank block in its column would dominate the product.
+    Attributes provided on input:
+    - modelParent: model it belongs to
+    - tol: relative accuracy of the low-rank blocks
+    Attributes computed:
+    - shape: (Neq,Neq)
+    - rhs: right-hand side, as the last column of assembleMatrix
+    - blocks: list of (I,J,U,V) with rows I and columns J of the low-rank blocks, and of (I,J,D,None) of the dense blocks
+    - tree: cluster tree of the control points (see cluster)
+    - cutoffs, pad: distances of the truncation of the Bessel parts and the largest half length of the line-sinks
+    - points: rows and columns of the cluster tree
+    - cols, dense: columns of the elements without controlPoints and of the Constant, and their values at points
+    - denserows, denserowvalues: rows of the elements without controlPoints and of the Constant, and their values
+    - rejected: number of low-rank blocks that failed the check and are stored dense
+    - rows: dict of rows that were replaced with __setitem__ (see Model.solveNonLinear)
+    '''
+    leafSize = 32  # Maximum number of control points in a leaf of the cluster tree
+    eta = 1.0  # Clusters are admissible when the smallest diameter is at most eta times their distance
+    blockSize = 256  # Maximum number of control points of the diagonal blocks of diagonalBlocks
+    samples = 2  # Number of random rows and of random columns with which every low-rank block is checked
+    def __init__(self,ml,tol=1e-9,progress=None):
+        self.modelParent = ml
+        self.tol = float(tol)
+        self.rows = {}
+        self.corrections = {}; self.correction = None
+        self.rejected = 0
+        self.random = random.RandomState(0)
+        elementList = ml.elementList
+        eq_list = [ e.Nunknowns() for e in elementList ]
+        eqcumlist = cumsum(eq_list)
+        ml.eqlist = eq_list
+        ml.eqcumlist = eqcumlist - 1
+        irowlist = eqcumlist - eq_list
+        Neq = sum(eq_list)
+        self.shape = (Neq,Neq)
+        self.rhs = zeros(Neq,'d')
+        # Element and number of the unknown of every column
+        self.element = [ e for e,n in zip(elementList,eq_list) for i in range(n) ]
+        self.unknown = concatenate( [zeros(0,'i')] + [ arange(n) for n in eq_list ] )
+        self.elementIndex = concatenate( [zeros(0,'i')] + [ i*ones(n,'i') for i,n in enumerate(eq_list) ] )
+        self.Nunknowns = array(eq_list,'i')
+        # AquiferData, layer and position of the control points, by row
+        self.groups = []
+        self.group = -ones(Neq,'i'); self.x = zeros(Neq,'d'); self.y = zeros(Neq,'d')
+        for aq,pylayer,rows,x,y in ml.controlPointGroups(irowlist):
+            self.group[rows] = len(self.groups); self.x[rows] = x; self.y[rows] = y
+            self.groups.append( (aq,pylayer) )
+            self.rhs[rows] = -ml.potentialCollectionArray(x,y,aq,ml.farFieldTol)[pylayer]
+        farfield = FarField(ml,ml.aq)
+        self.cutoffs = farfield.Rconv * unique( concatenate( [ aq.lab for aq in [ml.aq] + ml.aq.inhomList ] ) )
+        self.pad = farfield.rs.max() if len(farfield.rs) > 0 else 0.0
+        constant = array([ e.type == 'constant' for e in self.element ],'bool')
+        points = flatnonzero( (self.group >= 0) & ~constant )
+        self.cols = flatnonzero( (self.group < 0) | constant )
+        # Blocks of the pairs of clusters
+        self.tree = self.cluster(points)
+        tasks = []
+        self.partition(self.tree,self.tree,tasks)
+        self.blocks = []
+        bounds = linspace(0,len(tasks),min(10,len(tasks))+1).astype(int)
+        for iblock in range(len(bounds)-1):
+            for admissible,I,J in tasks[bounds[iblock]:bounds[iblock+1]]:
+                U = None
+                if admissible: U,V = self.aca(I,J)
+                if U is None:
+                    self.blocks.append( (I,J,self.entries(I,J),None) )
+                else:
+                    self.blocks.append( (I,J,U,V) )
+            ml.assemblyProgress(iblock,len(bounds)-1,progress)
+        self.dense = self.entries(points,self.cols)
+        self.points = points
+        # Rows of the elements without controlPoints
+        self.denserows = []; denserowvalues = []
+        for e,irow in zip(elementList,irowlist):
+            if e.controlPoints() is not None: continue
+            rows = array(e.getMatrixRows(elementList),'d')
+            if len(rows) == 0: continue
+            self.rhs[irow:irow+len(rows)] = rows[:,-1]
+            self.denserows.extend( range(irow,irow+len(rows)) ); denserowvalues.append( rows[:,:-1] )
+        constantrows = flatnonzero( (self.group >= 0) & constant )
+        if len(constantrows) > 0:
+            self.denserows.extend(constantrows); denserowvalues.append( self.entries(constantrows,arange(Neq)) )
+        self.denserows = array(self.denserows,'i')
+        self.denserowvalues = vstack( [zeros((0,Neq),'d')] + denserowvalues )
+        self.isdenserow = zeros(Neq,'bool'); self.isdenserow[self.denserows] = True
+        filler = _FillProxy(self)
+        for e,irow in zip(elementList,irowlist):
+            if e.controlPoints() is not None: e.fillMatrixRows(filler,irow,elementList)
+    def cluster(self,index):
+        '''Returns the cluster tree of the control points index as (index,bounding box,children), bisecting
+        the longest side of the bounding box at the median until at most leafSize points are left'''
+        x = self.x[index]; y = self.y[index]
+        box = (x.min(),x.max(),y.min(),y.max())
+        if len(index) <= self.leafSize: return (index,box,[])
+        order = argsort( x if x.max() - x.min() >= y.max() - y.min() else y, kind='mergesort' )
+        half = len(index) / 2
+        return (index,box,[ self.cluster(index[order[:half]]), self.cluster(index[order[half:]]) ])
+    def admissible(self,s,t):
+        '''Returns True when the smallest diameter of the bounding boxes of clusters s and t is at
+        most eta times their distance, and no cutoff lies between their smallest and largest distance'''
+        (x0,x1,y0,y1),(u0,u1,v0,v1) = s[1],t[1]
+        diameter = min( hypot(x1-x0,y1-y0), hypot(u1-u0,v1-v0) )
+        distance = hypot( max(u0-x1,x0-u1,0.0), max(v0-y1,y0-v1,0.0) )
+        if distance == 0.0 or diameter > self.eta * distance: return False
+        largest = hypot( max(x1,u1) - min(x0,u0), max(y1,v1) - min(y0,v0) )
+        return not any( (self.cutoffs + self.pad > distance) & (self.cutoffs < largest) )
+    def partition(self,s,t,tasks):
+        '''Appends (admissible,rows,columns) of the blocks of clusters s and t to tasks'''
+        if self.admissible(s,t):
+            tasks.append( (True,s[0],t[0]) )
+        elif len(s[2]) == 0 and len(t[2]) == 0:
+            tasks.append( (False,s[0],t[0]) )
+        else:
+            for sc in s[2] or [s]:
+                for tc in t[2] or [t]:
+                    self.partition(sc,tc,tasks)
+    def entries(self,I,J):
+        '''Returns the array of the entries of rows I (of control points) and columns J, computed with
+        potentialInfluenceCollectionArray for the elements of the columns that share that method'''
+        rv = zeros((len(I),len(J)),'d')
+        groups = self.group[I]
+        igroups = [ (g,flatnonzero(groups == g)) for g in unique(groups) ]
+        elements = self.elementIndex[J]
+        collections = {}
+        for iel in unique(elements):
+            method = self.element[J[elements == iel][0]].potentialInfluenceCollectionArray.im_func
+            collections.setdefault(method,[]).append(iel)
+        for iels in collections.values():
+            iels = array(iels,'i')
+            elementList = [ self.modelParent.elementList[i] for i in iels ]
+            first = cumsum(self.Nunknowns[iels]) - self.Nunknowns[iels]
+            jj = flatnonzero( in1d(elements,iels) )
+            k = first[searchsorted(iels,elements[jj])] + self.unknown[J[jj]]
+            for g,ii in igroups:
+                aq,pylayer = self.groups[g]
+                values = transpose( elementList[0].potentialInfluenceCollectionArray(elementList,aq,pylayer,self.x[I[ii]],self.y[I[ii]])[k] )
+                if len(ii) == len(I) and len(jj) == len(J):
+                    rv = values
+                else:
+                    rv[ix_(ii,jj)] = values
+        return rv
+    def aca(self,I,J):
+        '''Returns the factors U,V of the low-rank approximation of the block of rows I and columns J with
+        adaptive cross approximation with partial pivoting, to relative accuracy tol in the Frobenius norm,
+        or None,None when the rank gets larger than half the size of the block or the check fails'''
+        maxrank = min(len(I),len(J)) / 2
+        U = []; V = []
+        norm2 = 0.0
+        used = zeros(len(I),'bool'); pivots = zeros(len(J),'bool')
+        i = 0
+        while len(U) < maxrank:
+            used[i] = True
+            row = self.entries(I[i:i+1],J)[0]
+            for u,v in zip(U,V): row -= u[i] * v
+            j = argmax(abs(row))
+            if row[j] == 0.0:  # Row is reproduced; try another one
+                if used.all(): break
+                i = flatnonzero(~used)[0]
+                continue
+            pivots[j] = True
+            v = row / row[j]
+            u = self.entries(I,J[j:j+1])[:,0]
+            for uk,vk in zip(U,V): u -= vk[j] * uk
+            norm2 += dot(u,u) * dot(v,v) + 2.0 * sum([ dot(u,uk) * dot(v,vk) for uk,vk in zip(U,V) ])
+            U.append(u); V.append(v)
+            if sqrt( dot(u,u) * dot(v,v) ) <= self.tol * sqrt(abs(norm2)): break
+            if used.all(): break
+            i = argmax( where(used,-1.0,abs(u)) )
+        else:
+            return None,None
+        if len(U) == 0:
+            U = zeros((len(I),0),'d'); V = zeros((0,len(J)),'d')
+        else:
+            U = transpose(U); V = array(V)
+        if not self.check(I,J,U,V,used,pivots):
+            self.rejected += 1
+            return None,None
+        return U,V
+    def check(self,I,J,U,V,usedrows,usedcols):
+        '''Returns True when U * V reproduces the exact entries of samples random rows and columns of the
+        block of rows I and columns J that were not pivots (usedrows, usedcols: boolean arrays) to relative
+        accuracy tol. The stopping criterion of aca is an estimate, which misses blocks of which the
+        rows and columns that were tried are reproduced while others are not'''
+        rows = flatnonzero(~usedrows); cols = flatnonzero(~usedcols)
+        rows = self.random.permutation(rows)[:self.samples]; cols = self.random.permutation(cols)[:self.samples]
+        exact = [ self.entries(I[rows],J).ravel(), self.entries(I,J[cols]).ravel() ]
+        approx = [ dot(U[rows],V).ravel(), dot(U,V[:,cols]).ravel() ]
+        exact = concatenate(exact); error = exact - concatenate(approx)
+        return sqrt(dot(error,error)) <= self.tol * sqrt(dot(exact,exact))
+    def dot(self,x):
+        '''Returns the product of the matrix and the vector x'''
+        y = zeros(self.shape[0],'d')
+        for I,J,U,V in self.blocks:
+            if V is None:
+                y[I] += U.dot(x[J])
+            else:
+                y[I] += U.dot(V.dot(x[J]))
+        if len(self.cols) > 0: y[self.points] += self.dense.dot(x[self.cols])
+        if len(self.denserows) > 0: y[self.denserows] = self.denserowvalues.dot(x)
+        if len(self.corrections) > 0:
+            if self.correction is None:
+                ij = array(self.corrections.keys(),'i')
+                self.correction = coo_matrix( (self.corrections.values(),(ij[:,0],ij[:,1])), shape=self.shape ).tocsr()
+            y += self.correction.dot(x)
+        for i,row in self.rows.items():
+            y[i] = dot(row,x)
+        return y
+    def __getitem__(self,key):
+        i,j = key
+        if i in self.rows: return self.rows[i][j]
+        if self.isdenserow[i]: return self.denserowvalues[ flatnonzero(self.denserows == i)[0], j ]
+        return self.entries(array([i]),array([j]))[0,0] + self.corrections.get((i,j),0.0)
+    def __setitem__(self,key,value):
+        '''Sets entry i,j, or replaces row i when j is a slice'''
+        i,j = key
+        if isinstance(j,slice):
+            row = zeros(self.shape[1],'d')
+            row[j] = value
+            self.rows[i] = row
+        elif i in self.rows:
+            self.rows[i][j] = value
+        else:
+            self.corrections[(i,j)] = self.corrections.get((i,j),0.0) + value - self[i,j]
+            self.correction = None
+    def diagonalBlocks(self):
+        '''Returns list of (rows,block) with the diagonal blocks of the largest clusters of the cluster tree
+        with at most blockSize control points and of the elements without controlPoints, as arrays,
+        with the corrections and replaced rows'''
+        clusters = []; stack = [self.tree]
+        while len(stack) > 0:
+            index,box,children = stack.pop()
+            if len(index) <= self.blockSize:
+                clusters.append(index)
+            else:
+                stack.extend(children)
+        for iel in unique(self.elementIndex[self.denserows]):
+            clusters.append( self.denserows[ self.elementIndex[self.denserows] == iel ] )
+        position = zeros(self.shape[0],'i'); cluster = -ones(self.shape[0],'i')
+        for ic,I in enumerate(clusters):
+            position[I] = arange(len(I)); cluster[I] = ic
+        rv = [ (I,zeros((len(I),len(I)),'d')) for I in clusters ]
+        for I,J,U,V in self.blocks:
+            if cluster[I[0]] != cluster[J[0]] or cluster[I[0]] != cluster[I[-1]] or cluster[J[0]] != cluster[J[-1]]:
+                continue  # Blocks that meet a diagonal block (not admissible) lie inside it
+            D = U if V is None else dot(U,V)
+            rv[cluster[I[0]]][1][ix_(position[I],position[J])] = D
+        for k,i in enumerate(self.denserows):
+            rows = self.denserowvalues[k]
+            I,D = rv[cluster[i]]
+            D[position[i]] = rows[I]
+        for (i,j),d in self.corrections.items():
+            if cluster[i] == cluster[j]: rv[cluster[i]][1][position[i],position[j]] += d
+        for i,row in self.rows.items():
+            I,D = rv[cluster[i]]
+            D[position[i]] = row[I]
+        return rv
+    def toarray(self):
+        '''Returns the matrix as an array, column by column with dot'''
+        return transpose( [ self.dot(e) for e in eye(self.shape[1]) ] )
+    def memory(self):
+        '''Returns the number of bytes of the blocks and of the dense matrix'''
+        nbytes = sum([ U.nbytes + (0 if V is None else V.nbytes) + I.nbytes + J.nbytes for I,J,U,V in self.blocks ])
+        nbytes += self.dense.nbytes + self.denserowvalues.nbytes
+        return nbytes,8*self.shape[0]*self.shape[1]
@@ -3,7 +3,7 @@ from mlaquifer import *
 from mlinhom import *
 from mlpolyareasink import *
 from shapely.geometry import Polygon as Polygonsh
-from matplotlib.pyplot import *
+from mlcontour import isobands
 
 class Lake:
     
@@ -89,22 +89,11 @@ class Lake:
         ny = max( [5, int( (self.ymax-self.ymin)/lab )] )
         # Make grid in top layer of aquifer
         x,y = meshgrid(linspace(self.xmin,self.xmax,nx),linspace(self.ymin,self.ymax,ny))
-        f = vectorize(self.ml.head)
-        h = f(0,x,y)  # fixed to base zero
-        # Set interactive false, draw contours, set interactive back to what it was
-        interactive = rcParams['interactive']
-        rcParams['interactive'] = False
-        cobj = contourf(x,y,h,[hmin-1e6,hmin])
-        clf() # Clear current figure
-        rcParams['interactive'] = interactive
-        # We should only get one collection of contour objects, as we only contour one level
-        if len(cobj.collections) > 1: print 'cobj.collections has more than 1 item'
-        a = cobj.collections[0]
-        b = a.get_paths()
+        h = self.ml.headGrid(0,x,y)  # fixed to base zero
+        # Polygons (with their holes) where the head is below hmin, without matplotlib figure state
         polygonlist = []
-        for bb in b:
-            xy = bb.vertices
-            polygonlist.append( Polygonsh(xy.tolist()) )
+        for rings in isobands(x,y,h,[-inf,hmin])[0]:
+            polygonlist.append( Polygonsh(rings[0].tolist(), [ r.tolist() for r in rings[1:] ]) )
         # areasink is intersection of lake with contour level
         # newlake is difference between lake and new areasink
         areasinklist = []
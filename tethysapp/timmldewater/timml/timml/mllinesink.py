@@ -106,6 +106,62 @@ class LineSink(Element):
                 disbeslsho(x,y,self.x1,self.y1,self.x2,self.y2,self.aquiferParent.Naquifers+1,lab,0,disxInf,disyInf)  # Call FORTRAN extension
                 rvx =  self.coef * disxInf[1:]; rvy =  self.coef * disyInf[1:] 
         return [rvx,rvy]
+    def potentialInfluenceInLayerArray(self,aq,pylayer,x,y):
+        '''Returns potentialInfluenceInLayer at the points x,y (arrays of length N) as an array
+        of shape (NscreenedLayers,N); one call to the FORTRAN extension for all points'''
+        aqp = self.aquiferParent
+        rv = zeros((self.NscreenedLayers,len(x)),'d')
+        x1 = array([self.x1]); y1 = array([self.y1]); x2 = array([self.x2]); y2 = array([self.y2])
+        if aqp.type == aqp.conf:
+            if aqp == aq:  # Same confined aquifer
+                potInf = potbeslshomatrix(x,y,x1,y1,x2,y2,aqp.zeropluslab,0)[:,0,:]
+                rv[:,:] = dot( self.coef * aq.eigvec[pylayer,:], transpose(potInf) )
+            elif aq.type == aq.conf:  # Different confined aquifer, Laplace part only
+                potInf = potbeslshomatrix(x,y,x1,y1,x2,y2,array([0.0]),0)[:,0,0]
+                rv[:,:] = aq.eigvec[pylayer,0] * potInf
+        elif aqp.type == aqp.semi:
+            if aqp == aq:  # Same semi-confined aquifer
+                potInf = potbeslshomatrix(x,y,x1,y1,x2,y2,aqp.zeropluslab,0)[:,0,1:]
+                rv[:,:] = dot( self.coef * aq.eigvec[pylayer,:], transpose(potInf) )
+        return rv
+    def potentialInfluenceArray(self,aq,x,y):
+        '''Same as potentialInfluence, but vectorized over the points x,y (arrays of length N) with one call
+        to the FORTRAN extension; returns an array of shape (NscreenedLayers,aq.Naquifers,N)'''
+        aqp = self.aquiferParent
+        rv = zeros((self.NscreenedLayers,aq.Naquifers,len(x)),'d')
+        x1 = array([self.x1]); y1 = array([self.y1]); x2 = array([self.x2]); y2 = array([self.y2])
+        if aqp.type == aqp.conf:
+            if aqp == aq:  # Same confined aquifer
+                potInf = potbeslshomatrix(x,y,x1,y1,x2,y2,aqp.zeropluslab,0)[:,0,:]
+                rv[:,:,:] = self.coef[:,:,newaxis] * transpose(potInf)
+            elif aq.type == aq.conf:  # Different confined aquifer, Laplace part only
+                rv[:,0,:] = potbeslshomatrix(x,y,x1,y1,x2,y2,array([0.0]),0)[:,0,0]
+        elif aqp.type == aqp.semi:
+            if aqp == aq:  # Same semi-confined aquifer
+                potInf = potbeslshomatrix(x,y,x1,y1,x2,y2,aqp.zeropluslab,0)[:,0,1:]
+                rv[:,:,:] = self.coef[:,:,newaxis] * transpose(potInf)
+        return rv
+    def potentialInfluenceCollectionArray(self,elementList,aq,pylayer,x,y):
+        '''Returns potentialInfluenceInLayerArray of the line-sinks in elementList stacked in one array
+        of shape (sum of NscreenedLayers,N); one call to the FORTRAN extension for all line-sinks
+        in aq, and one for the Laplace parts of the line-sinks in other confined aquifers'''
+        first = cumsum( [0] + [ el.NscreenedLayers for el in elementList ] )
+        rv = zeros((first[-1],len(x)),'d')
+        same = [ i for i,el in enumerate(elementList) if el.aquiferParent == aq ]
+        if len(same) > 0:
+            x1,y1,x2,y2 = self.segmentArrays( [ elementList[i] for i in same ] )
+            potInf = potbeslshomatrix(x,y,x1,y1,x2,y2,aq.zeropluslab,0)
+            if aq.type == aq.semi: potInf = potInf[:,:,1:]
+            for j,i in enumerate(same):
+                rv[first[i]:first[i+1],:] = dot( elementList[i].coef * aq.eigvec[pylayer,:], transpose(potInf[:,j,:]) )
+        if aq.type == aq.conf:
+            other = [ i for i,el in enumerate(elementList) if el.aquiferParent != aq and el.aquiferParent.type == aq.conf ]
+            if len(other) > 0:
+                x1,y1,x2,y2 = self.segmentArrays( [ elementList[i] for i in other ] )
+                potInf = potbeslshomatrix(x,y,x1,y1,x2,y2,array([0.0]),0)[:,:,0]
+                for j,i in enumerate(other):
+                    rv[first[i]:first[i+1],:] = aq.eigvec[pylayer,0] * potInf[:,j]
+        return rv
 
     def potentialCollection(self,potsum,potadd,elementList,aq,x,y):
 
@@ -155,6 +211,61 @@ class LineSink(Element):
                     disadd =  el.paramxcoef * disInf[:,1:]
             dissum = dissum + disadd
         return dissum
+
+    def segmentArrays(self,elementList):
+        '''Returns arrays with x1, y1, x2 and y2 of the line-sinks in elementList'''
+        x1 = array([el.x1 for el in elementList],'d'); y1 = array([el.y1 for el in elementList],'d')
+        x2 = array([el.x2 for el in elementList],'d'); y2 = array([el.y2 for el in elementList],'d')
+        return x1,y1,x2,y2
+    def potentialCollectionArray(self,potsum,elementList,aq,x,y):
+        # Same as potentialCollection, but vectorized over the points x,y: all points and
+        # line-sinks are passed to the FORTRAN extension in one call
+        same = [el for el in elementList if el.aquiferParent == aq]
+        laplace = [el for el in elementList if el.aquiferParent != aq and \
+                   el.aquiferParent.type == el.aquiferParent.conf and aq.type == aq.conf]
+        if len(same) > 0:
+            x1,y1,x2,y2 = self.segmentArrays(same)
+            paramxcoef = array([el.paramxcoef for el in same],'d')
+            if aq.type == aq.conf:
+                pot = zeros((len(x),aq.Naquifers),'d',order='F')
+                potbeslshocollection(x,y,x1,y1,x2,y2,aq.zeropluslab,paramxcoef,pot)  # Call FORTRAN extension
+                potsum += pot.T
+            elif aq.type == aq.semi:
+                pot = zeros((len(x),aq.Naquifers+1),'d',order='F')  # Still add zero, because that is what FORTRAN extension expects
+                paramxcoef = hstack(( zeros((len(same),1),'d'), paramxcoef ))
+                potbeslshocollection(x,y,x1,y1,x2,y2,aq.zeropluslab,paramxcoef,pot)  # Call FORTRAN extension
+                potsum += pot[:,1:].T
+        if len(laplace) > 0:  # Different confined aquifer, Laplace part only
+            x1,y1,x2,y2 = self.segmentArrays(laplace)
+            paramxcoef = array([el.paramxcoef[0] for el in laplace],'d')
+            pot = zeros(len(x),'d')
+            potlaplshocollection(x,y,x1,y1,x2,y2,paramxcoef,pot)  # Call FORTRAN extension
+            potsum[0,:] += pot
+        return potsum
+    def dischargeCollectionArray(self,dissum,elementList,aq,x,y):
+        # Same as dischargeCollection, but vectorized over the points x,y
+        same = [el for el in elementList if el.aquiferParent == aq]
+        laplace = [el for el in elementList if el.aquiferParent != aq and \
+                   el.aquiferParent.type == el.aquiferParent.conf and aq.type == aq.conf]
+        if len(same) > 0:
+            x1,y1,x2,y2 = self.segmentArrays(same)
+            paramxcoef = array([el.paramxcoef for el in same],'d')
+            if aq.type == aq.conf:
+                disx = zeros((len(x),aq.Naquifers),'d',order='F'); disy = zeros((len(x),aq.Naquifers),'d',order='F')
+                disbeslshocollection(x,y,x1,y1,x2,y2,aq.zeropluslab,paramxcoef,disx,disy)  # Call FORTRAN extension
+                dissum[0] += disx.T; dissum[1] += disy.T
+            elif aq.type == aq.semi:
+                disx = zeros((len(x),aq.Naquifers+1),'d',order='F'); disy = zeros((len(x),aq.Naquifers+1),'d',order='F')
+                paramxcoef = hstack(( zeros((len(same),1),'d'), paramxcoef ))
+                disbeslshocollection(x,y,x1,y1,x2,y2,aq.zeropluslab,paramxcoef,disx,disy)  # Call FORTRAN extension
+                dissum[0] += disx[:,1:].T; dissum[1] += disy[:,1:].T
+        if len(laplace) > 0:  # Different confined aquifer, Laplace part only
+            x1,y1,x2,y2 = self.segmentArrays(laplace)
+            paramxcoef = array([el.paramxcoef[0] for el in laplace],'d')
+            disx = zeros(len(x),'d'); disy = zeros(len(x),'d')
+            dislaplshocollection(x,y,x1,y1,x2,y2,paramxcoef,disx,disy)  # Call FORTRAN extension
+            dissum[0,0,:] += disx; dissum[1,0,:] += disy
+        return dissum
     def totalDischargeInfluence(self,aq,pylayer,x,y):
         rv = ones(self.NscreenedLayers,'d') * self.L
         return rv   
@@ -484,6 +595,13 @@ class HeadLineSink(LineSink):
             row = row + [pot - self.modelParent.potentialInLayer(self.aquiferParent,self.pylayers[i],self.xc,self.yc)]
             rows = rows + [ row ]
         return rows
+    def controlPoints(self):
+        return [ (self.aquiferParent,self.pylayers[i],self.xc,self.yc) for i in range(self.NscreenedLayers) ]
+    def fillMatrixRows(self,matrix,irow,elementList):
+        self.fillRhs(matrix[:,-1],irow,elementList)
+    def fillRhs(self,rhs,irow,elementList):
+        for i in range(self.NscreenedLayers):
+            rhs[irow+i] = rhs[irow+i] + self.aquiferParent.headToPotential(self.pylayers[i],self.head)
     def getMatrixCoefficients(self,aq,pylayer,x,y,func):
         return func(self,aq,pylayer,x,y)
     def takeParameters(self,xsol,icount):
@@ -532,6 +650,23 @@ class ResLineSink(LineSink):
                           self.parameters[i,0] * self.aquiferParent.T[self.pylayers[i]] * self.res / self.width ]
             rows = rows + [ row ]
         return rows
+    def controlPoints(self):
+        return [ (self.aquiferParent,self.pylayers[i],self.xcp,self.ycp) for i in range(self.NscreenedLayers) ]
+    def fillMatrixRows(self,matrix,irow,elementList):
+        for i in range(self.NscreenedLayers):
+            if self.connected:
+                matrix[irow+i,irow+i] = matrix[irow+i,irow+i] - self.aquiferParent.T[self.pylayers[i]] * self.res / self.width
+            else:  # Row of getMatrixRows_nonlinear
+                matrix[irow+i,:-1] = 0.0
+                matrix[irow+i,irow+i] = 1.0
+        self.fillRhs(matrix[:,-1],irow,elementList)
+    def fillRhs(self,rhs,irow,elementList):
+        for i in range(self.NscreenedLayers):
+            if self.connected:
+                rhs[irow+i] = rhs[irow+i] + self.aquiferParent.headToPotential(self.pylayers[i],self.head) +\
+                              self.parameters[i,0] * self.aquiferParent.T[self.pylayers[i]] * self.res / self.width
+            else:
+                rhs[irow+i] = -( self.head - self.bottomelev ) * self.width / self.res - self.parameters[i,0]
     def getMatrixCoefficients(self,aq,pylayer,x,y,func):
         return func(self,aq,pylayer,x,y)
     def takeParameters(self,xsol,icount):
@@ -1006,6 +1141,15 @@ class DoubleLineSink(LineSink):
         else:
             rv = hstack(( zeros( self.Nparamin, 'd' ), rv ))
         return rv
+    def potentialInfluenceInLayerArray(self,aq,pylayer,x,y):
+        '''Loops over the points; the vectorized version of LineSink doesn't apply'''
+        return Element.potentialInfluenceInLayerArray(self,aq,pylayer,x,y)
+    def potentialInfluenceCollectionArray(self,elementList,aq,pylayer,x,y):
+        '''Stacks potentialInfluenceInLayerArray; the vectorized version of LineSink doesn't apply'''
+        return Element.potentialInfluenceCollectionArray(self,elementList,aq,pylayer,x,y)
+    def potentialInfluenceArray(self,aq,x,y):
+        '''Loops over the points; the vectorized version of LineSink doesn't apply'''
+        return Element.potentialInfluenceArray(self,aq,x,y)
     def potentialInfluenceAllLayers(self,aq,pylayer,x,y):
         '''Returns PotentialInfluence function in aquifer aq in all layers as an array'''
         potInf = self.potentialInfluence(aq,x,y)
@@ -484,6 +484,14 @@ class DoubleLineSinkGen(Element):
             return sum( self.paramout * self.potentialInfluence(aq,x,y), 0 )
         else:  # Really all zeros, as Laplace part is zero
             return zeros(aq.Naquifers,'d')
+    def potentialParameters(self,aq):
+        '''Returns paramin or paramout, as potentialContribution'''
+        if aq == self.aqin:
+            return self.paramin
+        elif aq == self.aqout:
+            return self.paramout
+        else:
+            return zeros((self.Ndegree,aq.Naquifers),'d')
     def dischargeContribution(self,aq,x,y):
         '''Returns matrix with two rowvectors of dischargeContributions Qx and Qy. Needs to be overloaded cause there is inside and outside'''
         disInf = self.dischargeInfluence(aq,x,y)
@@ -0,0 +1,141 @@
+'''
+mlquadtree.py contains the QuadTree class
+This file is part of the TimML library and is distributed under
+the GNU LPGL. See the TimML.py file for more details.
+'''
+
+from numpy import *
+
+class QuadTree:
+    '''Adaptive grid of square cells with the heads of a model. The cells of a coarse grid are divided in four,
+    recursively, while the heads at their corners differ more than tol, or while they contain a well or are crossed
+    by a line-sink, up to maxLevel times. Near the elements the heads vary logarithmically and the cells get small;
+    far away the heads vary slowly and the cells stay large. The heads at the corners of all cells of a level are
+    evaluated with one call of headVectorArray, and the heads at the centers of all cells with one more call; a
+    corner that is shared by cells is evaluated once. Only works after a solve
+    Attributes provided on input:
+    - modelParent: model it belongs to
+    - xmin,ymin: lower left corner of the coarse grid
+    - cellSide: size of the cells of the coarse grid
+    - nx,ny: number of cells of the coarse grid along x and y
+    - tol: largest difference of the heads at the corners of a cell that is not divided
+    - maxLevel: largest number of times a cell of the coarse grid is divided
+    - layer: layer of the heads (numbered as in headVectorArray)
+    Attributes computed (one value for every cell, the cells are sorted by level):
+    - level: array with the number of times the coarse cell of a cell was divided
+    - i,j: arrays with the index of a cell along x and y among the cells of its level
+    - x,y: arrays with the lower left corner of a cell; size: array with the size of a cell
+    - corners: array of shape (Ncells,4) with the heads at the corners of a cell,
+      counterclockwise from the lower left corner
+    - heads: array with the head at the center of a cell
+    - Nevaluated: number of points where the head was evaluated
+    '''
+    def __init__(self,ml,xmin,ymin,cellSide,nx,ny,tol,maxLevel=4,layer=0,progress=None):
+        '''progress: Function called as progress('grid',fraction) after every level'''
+        self.modelParent = ml
+        self.xmin = float(xmin); self.ymin = float(ymin); self.cellSide = float(cellSide)
+        self.nx = int(nx); self.ny = int(ny)
+        self.tol = float(tol); self.maxLevel = int(maxLevel); self.layer = layer
+        # Corners and centers of all cells are on a lattice with half the size of the smallest cells
+        self.scale = 2**(self.maxLevel+1)
+        self.keys = zeros(0,'int64'); self.values = zeros(0,'d')
+        self.wells = [ el for el in ml.elementList if el.type == 'well' ]
+        self.lineSinks = [ el for el in ml.elementList if el.type is not None and 'linesink' in el.type.lower() ]
+        i,j = meshgrid( arange(self.nx), arange(self.ny), indexing='ij' )
+        i = i.ravel(); j = j.ravel()
+        levels = []; ilist = []; jlist = []; corners = []
+        for level in range(self.maxLevel+1):
+            h = self.cornerHeads(level,i,j)
+            if level < self.maxLevel:
+                divide = ( h.max(1) - h.min(1) > self.tol ) | self.containsElement(level,i,j)
+            else:
+                divide = zeros(len(i),'bool')
+            keep = ~divide
+            levels.append( level * ones(keep.sum(),'int') ); ilist.append( i[keep] ); jlist.append( j[keep] )
+            corners.append( h[keep] )
+            if progress is not None: progress('grid',float(level+1)/(self.maxLevel+1))
+            if not divide.any(): break
+            # The four cells of every divided cell
+            i = ( 2 * i[divide][:,newaxis] + array([0,1,0,1]) ).ravel()
+            j = ( 2 * j[divide][:,newaxis] + array([0,0,1,1]) ).ravel()
+        self.level = concatenate(levels); self.i = concatenate(ilist); self.j = concatenate(jlist)
+        self.corners = concatenate(corners)
+        self.size = self.cellSide / 2.0**self.level
+        self.x = self.xmin + self.i * self.size; self.y = self.ymin + self.j * self.size
+        step = 2**(self.maxLevel-self.level)
+        self.heads = self.latticeHeads( (2*self.i+1) * step, (2*self.j+1) * step )
+        self.Nevaluated = len(self.keys)
+    def __repr__(self):
+        return 'QuadTree of ' + str(len(self.level)) + ' cells on ' + str((self.nx,self.ny)) + ' coarse grid'
+    def latticeHeads(self,I,J):
+        '''Returns array with the heads at the points I,J of the lattice (integer arrays); the heads of points
+        that were not evaluated before are evaluated with one call of headVectorArray'''
+        keys = I.astype('int64') * (self.ny*self.scale+1) + J
+        new = unique( keys[ ~in1d(keys,self.keys) ] )
+        if len(new) > 0:
+            side = self.cellSide / self.scale
+            x = self.xmin + ( new // (self.ny*self.scale+1) ) * side
+            y = self.ymin + ( new % (self.ny*self.scale+1) ) * side
+            h = self.modelParent.headVectorArray(x,y)[self.layer]
+            self.keys = concatenate((self.keys,new)); self.values = concatenate((self.values,h))
+            order = argsort(self.keys)
+            self.keys = self.keys[order]; self.values = self.values[order]
+        return self.values[ searchsorted(self.keys,keys) ]
+    def cornerHeads(self,level,i,j):
+        '''Returns array of shape (len(i),4) with the heads at the corners of the cells i,j of level'''
+        step = 2**(self.maxLevel+1-level)
+        I = ( i[:,newaxis] + array([0,1,1,0]) ) * step
+        J = ( j[:,newaxis] + array([0,0,1,1]) ) * step
+        return self.latticeHeads(I.ravel(),J.ravel()).reshape(-1,4)
+    def containsElement(self,level,i,j):
+        '''Returns boolean array that is True for the cells i,j of level that contain a well (within its radius)
+        or are crossed by a line-sink'''
+        size = self.cellSide / 2.0**level
+        x0 = self.xmin + i * size; y0 = self.ymin + j * size
+        contains = zeros(len(i),'bool')
+        for w in self.wells:
+            contains |= ( x0 - w.rw <= w.xw ) & ( w.xw <= x0 + size + w.rw ) & \
+                        ( y0 - w.rw <= w.yw ) & ( w.yw <= y0 + size + w.rw )
+        for ls in self.lineSinks:
+            # Clip the line-sink to every cell (Liang-Barsky)
+            t0 = zeros(len(i),'d'); t1 = ones(len(i),'d'); inside = ones(len(i),'bool')
+            for p,q in ( (ls.x1-ls.x2, ls.x1-x0), (ls.x2-ls.x1, x0+size-ls.x1),
+                         (ls.y1-ls.y2, ls.y1-y0), (ls.y2-ls.y1, y0+size-ls.y1) ):
+                if p == 0:
+                    inside &= q >= 0
+                elif p < 0:
+                    t0 = maximum(t0,q/p)
+                else:
+                    t1 = minimum(t1,q/p)
+            contains |= inside & ( t0 <= t1 )
+        return contains
+    def locate(self,x,y):
+        '''Returns array with the cell of every point x,y (arrays of length N); -1 outside the coarse grid'''
+        x = atleast_1d(asarray(x,'d')); y = atleast_1d(asarray(y,'d'))
+        cell = -ones(len(x),'int')
+        for level in unique(self.level):
+            n = 2**level
+            size = self.cellSide / n
+            ip = minimum( floor( (x - self.xmin) / size ), self.nx*n-1 )
+            jp = minimum( floor( (y - self.ymin) / size ), self.ny*n-1 )
+            valid = ( ip >= 0 ) & ( jp >= 0 ) & ( x <= self.xmin + self.nx*self.cellSide ) & \
+                    ( y <= self.ymin + self.ny*self.cellSide )
+            cells = flatnonzero( self.level == level )
+            keys = self.i[cells] * (self.ny*n) + self.j[cells]
+            order = argsort(keys); keys = keys[order]; cells = cells[order]
+            pkeys = where( valid, ip * (self.ny*n) + jp, -1 ).astype('int64')
+            k = minimum( searchsorted(keys,pkeys), len(keys)-1 )
+            found = valid & ( keys[k] == pkeys )
+            cell[found] = cells[k[found]]
+        return cell
+    def interpolate(self,x,y):
+        '''Returns array with the heads at the points x,y (arrays of length N) interpolated bilinearly from the
+        corners of their cells; nan outside the coarse grid'''
+        x = atleast_1d(asarray(x,'d')); y = atleast_1d(asarray(y,'d'))
+        cell = self.locate(x,y)
+        h = zeros(len(x),'d'); h.fill(nan)
+        c = cell[cell >= 0]
+        u = ( x[cell >= 0] - self.x[c] ) / self.size[c]; v = ( y[cell >= 0] - self.y[c] ) / self.size[c]
+        hc = self.corners[c]
+        h[cell >= 0] = (1-u)*(1-v)*hc[:,0] + u*(1-v)*hc[:,1] + u*v*hc[:,2] + (1-u)*v*hc[:,3]
+        return h
@@ -0,0 +1,224 @@
+'''
+mlsparse.py contains the NearFarMatrix class
+This file is part of the TimML library and is distributed under
+the GNU LPGL. See the TimML.py file for more details.
+'''
+
+from numpy import *
+from scipy.sparse import coo_matrix, csr_matrix, diags
+from scipy.sparse import hstack as hstack_sparse, vstack as vstack_sparse
+from mlfmm import FarField
+
+class NearFarMatrix:
+    '''Matrix of Model.assembleMatrix (without the right-hand side) stored as a sparse near field and
+    the multipole expansions of FarField for the far field, for solver='sparse' of Model.solve.
+    The control points of every AquiferData are sorted in a quadtree with the wells and line-sinks
+    (see FarField.buildTree) with the smallest leaves that contain the Bessel parts of the sources:
+    those are truncated beyond Rconv leakage factors, so the coupling with the sources outside the
+    near field of a leaf is the Laplace part only, which is computed from the expansions of the
+    cells each time the matrix is multiplied with a vector (dot). The near field is stored exactly
+    in the sparse matrix near, together with the columns of elements that FarField doesn't handle
+    and the rows of elements without controlPoints, which are dense.
+    Attributes provided on input:
+    - modelParent: model it belongs to
+    - tol: relative accuracy of the multipole expansions
+    Attributes computed:
+    - shape: (Neq,Neq)
+    - near: near field (scipy.sparse csr_matrix)
+    - rhs: right-hand side, as the last column of assembleMatrix
+    - trees: list of (farfield,rows,factor,z,source,column,weight) for every AquiferData with control
+      points: the FarField with its tree, the rows of its points, the factor of the Laplace part in
+      the rows, the points as complex numbers, and the source, column and Laplace coefficient of
+      every unknown of a source
+    - rows: dict of rows that were replaced with __setitem__ (see Model.solveNonLinear)
+    '''
+    Nlevels = 15  # The deepest tree that FarField allows
+    Ncoarse = 1000  # Maximum number of boxes of the coarse far field of every tree (see coarse)
+    def __init__(self,ml,tol=1e-12,progress=None):
+        self.modelParent = ml
+        self.tol = float(tol)
+        self.rows = {}
+        self.trees = []
+        elementList = ml.elementList
+        eq_list = [ e.Nunknowns() for e in elementList ]
+        eqcumlist = cumsum(eq_list)
+        ml.eqlist = eq_list
+        ml.eqcumlist = eqcumlist - 1
+        irowlist = eqcumlist - eq_list
+        Neq = sum(eq_list)
+        self.shape = (Neq,Neq)
+        self.rhs = zeros(Neq,'d')
+        self.entries = ([],[],[])  # Rows, columns and values of near
+        # Control points grouped by AquiferData
+        aqgroups = {}
+        for aq,pylayer,rows,x,y in ml.controlPointGroups(irowlist):
+            if id(aq) not in aqgroups: aqgroups[id(aq)] = (aq,[])
+            aqgroups[id(aq)][1].append( (pylayer*ones(len(rows),'i'),rows,x,y) )
+        tasks = []
+        for aq,groups in aqgroups.values():
+            pylayer,rows,x,y = [ concatenate(a) for a in zip(*groups) ]
+            pot = ml.potentialCollectionArray(x,y,aq,self.tol)
+            self.rhs[rows] = -pot[pylayer,arange(len(rows))]
+            farfield = FarField(ml,aq,self.tol)
+            column = dict( (id(e),(irow,n)) for e,irow,n in zip(elementList,irowlist,eq_list) if n > 0 )
+            if farfield.buildTree(x,y,self.Nlevels) < 2:  # Everything is near
+                leaves = [ (arange(len(x)),arange(len(farfield.source))) ]
+            else:
+                leaves = farfield.leaves()
+                source = []; col = []; weight = []
+                for i,el in enumerate(farfield.source):
+                    if id(el) not in column or not farfield.haslaplace[i]: continue
+                    irow,n = column[id(el)]
+                    source.extend([i]*n); col.extend(range(irow,irow+n)); weight.extend(el.coef[:n,0])
+                factor = aq.eigvec[pylayer,0]
+                self.trees.append( (farfield,rows,factor,x+1j*y,array(source,'i'),array(col,'i'),array(weight,'d')) )
+            points = (aq,pylayer,rows,x,y)
+            for index,isource in leaves:
+                sources = [ (farfield.source[i],)+column[id(farfield.source[i])] for i in isource if id(farfield.source[i]) in column ]
+                if len(sources) > 0: tasks.append( ('near',points,index,sources) )
+            others = [ (e,irow,n) for e,irow,n in zip(elementList,irowlist,eq_list) if n > 0 and not farfield.handles(e) ]
+            if len(others) > 0: tasks.append( ('near',points,arange(len(x)),others) )
+        for e,irow in zip(elementList,irowlist):
+            if e.controlPoints() is None: tasks.append( ('rows',e,irow) )
+        # Milestones after every tenth of the tasks
+        bounds = linspace(0,len(tasks),min(10,len(tasks))+1).astype(int)
+        for iblock in range(len(bounds)-1):
+            for task in tasks[bounds[iblock]:bounds[iblock+1]]:
+                if task[0] == 'near':
+                    self.addNear(*task[1:])
+                else:
+                    self.addRows(*task[1:])
+            ml.assemblyProgress(iblock,len(bounds)-1,progress)
+        I,J,V = [ concatenate( [zeros(0,t)] + a ) for a,t in zip(self.entries,('i','i','d')) ]
+        del self.entries
+        self.near = coo_matrix((V,(I,J)),shape=self.shape).tocsr()
+        filler = _FillProxy(self)
+        for e,irow in zip(elementList,irowlist):
+            if e.controlPoints() is not None: e.fillMatrixRows(filler,irow,elementList)
+    def addNear(self,points,index,sources):
+        '''Adds the exact coefficients of sources, a list of (element,first column,Nunknowns), at the
+        control points index of points (aq,pylayer,rows,x,y) to the near field'''
+        aq,pylayer,rows,x,y = points
+        for p in unique(pylayer[index]):
+            sub = index[ pylayer[index] == p ]
+            for e,icol,n in sources:
+                block = e.potentialInfluenceInLayerArray(aq,p,x[sub],y[sub])
+                self.entries[0].append( tile(rows[sub],n) )
+                self.entries[1].append( repeat(arange(icol,icol+n),len(sub)) )
+                self.entries[2].append( block.ravel() )
+    def addRows(self,e,irow):
+        '''Adds the rows of getMatrixRows of element e without controlPoints, starting at row irow'''
+        rows = array(e.getMatrixRows(self.modelParent.elementList),'d')
+        if len(rows) == 0: return
+        self.rhs[irow:irow+len(rows)] = rows[:,-1]
+        i,j = nonzero(rows[:,:-1])
+        self.entries[0].append( irow + i ); self.entries[1].append( j ); self.entries[2].append( rows[i,j] )
+    def dot(self,x):
+        '''Returns the product of the matrix and the vector x'''
+        y = self.near.dot(x)
+        for farfield,rows,factor,z,source,col,weight in self.trees:
+            if len(source) == 0: continue
+            laplace = bincount( source, weight * x[col], len(farfield.source) )
+            y[rows] += factor * farfield.farFieldArray(laplace)
+        for i,row in self.rows.items():
+            y[i] = dot(row,x)
+        return y
+    def __getitem__(self,key):
+        i,j = key
+        if i in self.rows: return self.rows[i][j]
+        return self.near[i,j]
+    def __setitem__(self,key,value):
+        '''Sets entry i,j of the near field, or replaces row i when j is a slice'''
+        i,j = key
+        if isinstance(j,slice):
+            row = zeros(self.shape[1],'d')
+            row[j] = value
+            self.rows[i] = row
+        elif i in self.rows:
+            self.rows[i][j] = value
+        else:
+            self.near[i,j] = value
+    def nearMatrix(self):
+        '''Returns the near field with the replaced rows (scipy.sparse csc_matrix), for a preconditioner'''
+        if len(self.rows) == 0: return self.near.tocsc()
+        keep = ones(self.shape[0],'d')
+        keep[self.rows.keys()] = 0.0
+        rows = array(self.rows.values())
+        i,j = nonzero(rows)
+        replaced = coo_matrix( (rows[i,j],(array(self.rows.keys())[i],j)), shape=self.shape )
+        return ( diags(keep).dot(self.near) + replaced ).tocsc()
+    def coarse(self):
+        '''Returns the approximation U * W * V of the far field on coarse boxes: the boxes of the deepest
+        level of every tree with at most Ncoarse boxes. The coupling of the sources in box b and the points
+        in box a is the mean over all pairs of a point and a source of the logarithm of the distance
+        between their leaves and of one, where pairs of leaves within separation boxes (the near field)
+        count as zero. U (scipy.sparse csr_matrix) has the factor of the Laplace part of the row of every
+        point in the column of its box; W (array) has the means of the logarithm and of one, and
+        V (scipy.sparse csr_matrix) the coefficients of the logarithm and the constant of the sources'''
+        U = []; Vlog = []; Vconst = []; W = []
+        for farfield,rows,factor,z,source,col,weight in self.trees:
+            L,N,porder,pkey,sorder,skey,ixp,iyp,ixs,iys,levels = farfield.tree
+            ix = hstack(( ixp, ixs[source] )); iy = hstack(( iyp, iys[source] ))
+            Np = len(z); zb = hstack(( z, farfield.zs[source] ))
+            for shift in range(L+1):
+                boxkey,box = unique( farfield.mortonKeys(ix>>shift,iy>>shift,L), return_inverse=True )
+                if len(boxkey) <= self.Ncoarse: break
+            Nc = len(boxkey)
+            leafkey,first,leaf = unique( farfield.mortonKeys(ix,iy,L), return_index=True, return_inverse=True )
+            count = bincount(leaf)
+            zc = ( bincount(leaf,zb.real) + 1j * bincount(leaf,zb.imag) ) / count
+            # Leaves with points (weighted with the number of points, to their box) and with sources
+            npoint = bincount(leaf[:Np],minlength=len(leafkey)); nsource = bincount(leaf[Np:],minlength=len(leafkey))
+            lp = flatnonzero(npoint); ls = flatnonzero(nsource)
+            A = zeros((Nc,len(lp)),'d'); A[box[first[lp]],arange(len(lp))] = npoint[lp]
+            B = zeros((len(ls),Nc),'d'); B[arange(len(ls)),box[first[ls]]] = nsource[ls]
+            Wlog = zeros((Nc,Nc),'d'); Wone = zeros((Nc,Nc),'d')
+            chunk = max( 1000000 / len(ls), 1 ) if len(ls) > 0 else len(lp)
+            for i0 in range(0,len(lp),chunk):
+                i = lp[i0:i0+chunk]
+                far = maximum( abs( ix[first[i]][:,newaxis] - ix[first[ls]] ), abs( iy[first[i]][:,newaxis] - iy[first[ls]] ) ) > farfield.separation
+                Wlog += dot( A[:,i0:i0+chunk], dot( where( far, log( where(far,abs(zc[i][:,newaxis] - zc[ls]),1.0) ), 0.0 ), B ) )
+                Wone += dot( A[:,i0:i0+chunk], dot( far, B ) )
+            pairs = outer( bincount(box[:Np],minlength=Nc), bincount(box[Np:],minlength=Nc) )
+            pairs[pairs == 0] = 1
+            W.append( (Wlog/pairs,Wone/pairs) )
+            keep = array([ i not in self.rows for i in rows ],'bool')
+            U.append( coo_matrix( (factor[keep],(rows[keep],box[:Np][keep])), shape=(self.shape[0],Nc) ) )
+            Vlog.append( coo_matrix( (weight * farfield.unitA0[source],(box[Np:],col)), shape=(Nc,self.shape[1]) ) )
+            Vconst.append( coo_matrix( (weight * farfield.unitConstant[source],(box[Np:],col)), shape=(Nc,self.shape[1]) ) )
+        if len(W) == 0: return csr_matrix((self.shape[0],0)),zeros((0,0),'d'),csr_matrix((0,self.shape[1]))
+        Nc = [ len(w[0]) for w in W ]
+        first = cumsum(Nc) - Nc
+        Ntotal = int(sum(Nc))
+        Wfull = zeros((Ntotal,2*Ntotal),'d')
+        for i,(wlog,wone) in enumerate(W):
+            rows = slice(first[i],first[i]+Nc[i])
+            Wfull[rows,rows] = wlog
+            Wfull[rows,Ntotal+first[i]:Ntotal+first[i]+Nc[i]] = wone
+        return hstack_sparse(U).tocsr(),Wfull,vstack_sparse(Vlog+Vconst).tocsr()
+    def toarray(self):
+        '''Returns the matrix as an array, column by column with dot'''
+        return transpose( [ self.dot(e) for e in eye(self.shape[1]) ] )
+    def memory(self):
+        '''Returns the number of bytes of the near field and of the trees, and of the dense matrix'''
+        nearbytes = self.near.data.nbytes + self.near.indices.nbytes + self.near.indptr.nbytes
+        farbytes = 0
+        for farfield,rows,factor,z,source,col,weight in self.trees:
+            L,N,porder,pkey,sorder,skey,ixp,iyp,ixs,iys,levels = farfield.tree
+            farbytes += sum( [ a.nbytes for a in (porder,pkey,sorder,skey,ixp,iyp,ixs,iys,rows,factor,z,source,col,weight) ] )
+            farbytes += sum( [ sum([ a.nbytes for a in level ]) for level in levels ] )
+        return nearbytes,farbytes,8*self.shape[0]*self.shape[1]
+
+class _FillProxy:
+    '''Stands in for the array of Model.assembleMatrix in Element.fillMatrixRows: the last column is
+    the right-hand side of NearFarMatrix matrix, the other entries are those of matrix'''
+    def __init__(self,matrix):
+        self.matrix = matrix
+    def __getitem__(self,key):
+        i,j = key
+        if j == -1 and i == slice(None): return self.matrix.rhs
+        return self.matrix[i,j]
+    def __setitem__(self,key,value):
+        i,j = key
+        if j == slice(None,-1): j = slice(None)
+        self.matrix[i,j] = value
@@ -3,11 +3,17 @@ from matplotlib.colors import colorConverter
 from matplotlib.collections import LineCollection
 from numpy import *
 from mltrace import *
+import mlcontour
 
 def timcontour( ml, xmin, xmax, nx, ymin, ymax, ny, layers = 1, levels = 10, color = None, \
                width = 0.5, style = '-', separate = 0, layout = 1, newfig = 1, labels = 0, labelfmt = '%1.2f', xsec = 0,
-               returnheads = 0, returncontours = 0, fillcontour = 0, size=(8,8), mayavi=False, verbose = True):
-    '''Contours head with pylab'''
+               returnheads = 0, returncontours = 0, fillcontour = 0, size=(8,8), mayavi=False, verbose = True, workers = 1,
+               plot = True):
+    '''Contours head with pylab; the grid is evaluated by workers processes (see Model.evaluate_grid).
+    With plot=False no figure is made and the contours are returned as coordinates (see mlcontour.timcontour)'''
+    if not plot:
+        return mlcontour.timcontour( ml, xmin, xmax, nx, ymin, ymax, ny, layers, levels, fillcontour, returnheads,
+                                     verbose, workers )
     rcParams['contour.negative_linestyle']='solid'
 
     rows = []   # Store every matrix in one long row
@@ -30,24 +36,9 @@ def timcontour( ml, xmin, xmax, nx, ymin, ymax, ny, layers = 1, levels = 10, col
         xg,yg = meshgrid( linspace( xmin, xmax, nx ), linspace( ymin, ymax, ny ) )
         
     if verbose: print 'grid of '+str((nx,ny))+'. gridding in progress. hit ctrl-c to abort'
-    
-    Nrow,Ncol = shape(xg)
 
-    head = zeros( ( Naquifers, ny, nx ), 'd' )
-    for irow in range(Nrow):
-        for jcol in range(Ncol):
-            # Figure out aquifer first, so we can process fake aquifers; no repeated effort as aq is passed to headVector
-            
-            aq = ml.aq.findAquiferData(xg[irow,jcol], yg[irow,jcol])
-            h = ml.headVector( xg[irow,jcol], yg[irow,jcol], aq )
-            for k in range(Naquifers):
-                if not aq.fakesemi:
-                    if len(h) < aquiferRange[k]:
-                        head[k,irow,jcol] = h[0]
-                    else:
-                        head[k,irow,jcol] = h[aquiferRange[k]]
-                else:
-                    head[k,irow,jcol] = h[aquiferRange[i]+1]
+    # All grid points at once; headVectorArray skips the fake aquifer of semi-confined inhomogeneities
+    head = ml.evaluate_grid( xg, yg, aquiferRange, workers )
     # Contour
     # Manage colors
     if type( color ) is str:
@@ -316,11 +307,7 @@ def timvertcontour( ml, x1, y1, x2, y2, nx, zmin, zmax, nz, levels = 10, color =
     horlength = sqrt( (x2-x1)**2 + (y2-y1)**2 )
     hor, vert = meshgrid( linspace( 0, horlength, nx ), zg )
     print 'grid of '+str((nx,nz))+'. gridding in progress. hit ctrl-c to abort'
-    head = zeros( ( nz, nx ), 'd' )
-    for irow in range(nz):
-        for jcol in range(nx):
-            # Figure out aquifer first, so we can process fake aquifers; no repeated effort as aq is passed to headVector
-            head[irow,jcol] = ml.head3D( xg[jcol], yg[jcol], zg[irow] )
+    head = ml.head3DArray( tile(xg,nz), tile(yg,nz), repeat(zg,nx) ).reshape(nz,nx)
     # Contour
     # Manage levels to draw
     if type(levels) is list:
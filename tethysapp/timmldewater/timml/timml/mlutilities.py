@@ -9,8 +9,8 @@ from ml import *
 from numpy import *
 import pickle
 
-def surfgrid(ml,xmin,xmax,nx,ymin,ymax,ny,filename='/temp/dump',Naquifers=1):
-    '''Give filename without extension'''
+def surfgrid(ml,xmin,xmax,nx,ymin,ymax,ny,filename='/temp/dump',Naquifers=1,workers=1):
+    '''Give filename without extension; the grid is evaluated by workers processes (see Model.evaluate_grid)'''
     xstep = float(xmax-xmin)/nx
     ystep = float(ymax-ymin)/ny
     rows = []   # Store every matrix in one long row
@@ -22,16 +22,14 @@ def surfgrid(ml,xmin,xmax,nx,ymin,ymax,ny,filename='/temp/dump',Naquifers=1):
         aquiferRange = range(Naquifers)
     for i in range(max(aquiferRange)+1):
         rows = rows + [[]]        
-    for j in range(ny+1):
-        y=ymin + j*ystep
-        for i in range(nx+1):
-            x=xmin + i*xstep;
-            hvec = ml.headVector(x,y)
-            for k in aquiferRange:
-                if k < len(hvec):
-                    rows[k] = rows[k] + [hvec[k]]
-                else:
-                    rows[k] = rows[k] + [hvec[0]]
+    # Rows of the grid one after another, from ymin up
+    xg,yg = meshgrid( xmin + xstep*arange(nx+1), ymin + ystep*arange(ny+1) )
+    hvec = ml.evaluate_grid(xg,yg,workers=workers).reshape(-1,xg.size)
+    for k in aquiferRange:
+        if k < len(hvec):
+            rows[k] = list(hvec[k])
+        else:
+            rows[k] = list(hvec[0])
     for k in aquiferRange:
         zmin = min(rows[k]); zmax = max(rows[k])
         out = open(filename+'.'+str(k+1)+'.grd','w')
@@ -53,8 +51,9 @@ def surfergrid(ml,xmin,xstep,xmax,ymin,ystep,ymax,filename='/temp/dump',Naquifer
     ny=int(round((ymax-ymin)/ystep))  # ny is number of intervals
     surfgrid(ml,xmin,xmax,nx,ymin,ymax,ny,filename,Naquifers)
         
-def matgrid(ml,xmin,xmax,nx,ymin,ymax,ny,filename='/temp/dump.m',Naquifers=1):
-    '''Spits out matlab m file; x and y are stored in xg,yg; heads in h1, h2, ...'''
+def matgrid(ml,xmin,xmax,nx,ymin,ymax,ny,filename='/temp/dump.m',Naquifers=1,workers=1):
+    '''Spits out matlab m file; x and y are stored in xg,yg; heads in h1, h2, ...
+    The grid is evaluated by workers processes (see Model.evaluate_grid)'''
     xstep = float(xmax-xmin)/nx
     ystep = float(ymax-ymin)/ny
     rows = []   # Store every matrix in one long row
@@ -70,17 +69,15 @@ def matgrid(ml,xmin,xmax,nx,ymin,ymax,ny,filename='/temp/dump.m',Naquifers=1):
     out.write('[xg,yg]=meshgrid(linspace('+str(xmin)+','+str(xmax)+','+str(nx+1)+\
               '),linspace('+str(ymin)+','+str(ymax)+','+str(ny+1)+'));\n')
     print 'grid of '+str((nx,ny))+'. gridding in progress. hit ctrl-c to abort'
+    xg,yg = meshgrid( xmin + xstep*arange(nx+1), ymin + ystep*arange(ny+1) )
+    h = ml.evaluate_grid(xg,yg,workers=workers)
     rows = zeros((nx+1,len(aquiferRange)),'d')
     for j in range(ny+1):
-        y=ymin + j*ystep
-        for i in range(nx+1):
-            x=xmin + i*xstep;
-            h = ml.headVector(x,y)
-            for k in range(len(aquiferRange)):
-                if aquiferRange[k] >= len(h):
-                    rows[i,k] = h[0]
-                else:
-                    rows[i,k] = h[aquiferRange[k]]
+        for k in range(len(aquiferRange)):
+            if aquiferRange[k] >= len(h):
+                rows[:,k] = h[0,j]
+            else:
+                rows[:,k] = h[aquiferRange[k],j]
         for k in range(len(aquiferRange)):
             # Need to convert rows to list, else the str function inserts \n-s
             out.write( 'h' + str(aquiferRange[k]+1) + '(' + str(j+1) + ',:)=' + str(list(rows[:,k])) + ';\n' )
@@ -99,16 +96,13 @@ def matlabqxgrid(ml,xmin,xstep,xmax,ymin,ystep,ymax,filename='/temp/dump.m',Naqu
     rows = []   # Store every matrix in one long row
     for i in range(Naquifers):
         rows = rows + [[]]        
-    for j in range(ny+1):
-        y=ymin + j*ystep
-        for i in range(nx+1):
-            x=xmin + i*xstep; 
-            [qxvec,qyvec] = ml.dischargeVector(x,y)
-            for k in range(Naquifers):
-                if k < len(qxvec):
-                    rows[k] = rows[k] + [qxvec[k]]
-                else:
-                    rows[k] = rows[k] + [qxvec[0]]
+    xg,yg = meshgrid( xmin + xstep*arange(nx+1), ymin + ystep*arange(ny+1) )
+    [qxvec,qyvec] = ml.dischargeVectorArray(xg.ravel(),yg.ravel())
+    for k in range(Naquifers):
+        if k < len(qxvec):
+            rows[k] = list(qxvec[k])
+        else:
+            rows[k] = list(qxvec[0])
     out = open(filename,'w')
     out.write('[xg,yg]=meshgrid('+str(xmin)+':'+str(xstep)+':'+str(xmax)+\
               ','+str(ymin)+':'+str(ystep)+':'+str(ymax)+');\n')
@@ -129,16 +123,13 @@ def matlabqygrid(ml,xmin,xstep,xmax,ymin,ystep,ymax,filename='/temp/dump.m',Naqu
     rows = []   # Store every matrix in one long row
     for i in range(Naquifers):
         rows = rows + [[]]        
-    for j in range(ny+1):
-        y=ymin + j*ystep
-        for i in range(nx+1):
-            x=xmin + i*xstep; 
-            [qxvec,qyvec] = ml.dischargeVector(x,y)
-            for k in range(Naquifers):
-                if k < len(qyvec):
-                    rows[k] = rows[k] + [qyvec[k]]
-                else:
-                    rows[k] = rows[k] + [qyvec[0]]
+    xg,yg = meshgrid( xmin + xstep*arange(nx+1), ymin + ystep*arange(ny+1) )
+    [qxvec,qyvec] = ml.dischargeVectorArray(xg.ravel(),yg.ravel())
+    for k in range(Naquifers):
+        if k < len(qyvec):
+            rows[k] = list(qyvec[k])
+        else:
+            rows[k] = list(qyvec[0])
     out = open(filename,'w')
     out.write('[xg,yg]=meshgrid('+str(xmin)+':'+str(xstep)+':'+str(xmax)+\
               ','+str(ymin)+':'+str(ystep)+':'+str(ymax)+');\n')
@@ -181,15 +172,17 @@ def surfvertgrid(ml,xmin,ymin,xmax,ymax,nh,zmin,zmax,nz,filename='/temp/dump',in
     xstep = float(xmax-xmin) / nh
     ystep = float(ymax-ymin) / nh
     zstep = float(zmax-zmin) / nz
-    grid = zeros((nz+1,nh+1),'d')
-    for i in range(nz+1):
-        z = zmin + i*zstep
-        for j in range(nh+1):
-            x = xmin + j*xstep; y = ymin + j*ystep
-            if interp:
+    if interp:
+        grid = zeros((nz+1,nh+1),'d')
+        for i in range(nz+1):
+            z = zmin + i*zstep
+            for j in range(nh+1):
+                x = xmin + j*xstep; y = ymin + j*ystep
                 grid[i,j] = ml.head3Dinterp(x,y,z)
-            else:
-                grid[i,j] = ml.head3D(x,y,z)
+    else:
+        x = tile( xmin + xstep*arange(nh+1), nz+1 ); y = tile( ymin + ystep*arange(nh+1), nz+1 )
+        z = repeat( zmin + zstep*arange(nz+1), nh+1 )
+        grid = ml.head3DArray(x,y,z).reshape(nz+1,nh+1)
     hmin = min(min(grid)); hmax = max(max(grid))
     out = open(filename+'.grd','w')
     out.write('DSAA\n')
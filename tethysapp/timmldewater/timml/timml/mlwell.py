@@ -91,6 +91,29 @@ class Well(Element):
                 rv = self.coef * rv
                 # Else we return zeros
         return rv
+    def potentialInfluenceArray(self,aq,x,y):
+        '''Same as potentialInfluence, but vectorized over the points x,y (arrays of length N);
+        returns an array of shape (NscreenedLayers,aq.Naquifers,N)'''
+        rv = zeros( (self.NscreenedLayers,aq.Naquifers,len(x)), 'd' )
+        rsq = (x-self.xw)*(x-self.xw) + (y-self.yw)*(y-self.yw)
+        rsq = maximum( rsq, self.rwsq )
+        if self.aquiferParent.type == self.aquiferParent.conf:
+            if aq.type == aq.conf:
+                rv[:,0,:] = log(rsq/self.rwsq)/(4*pi)
+                if self.aquiferParent == aq:            # Compute Bessel functions
+                    for i in range(aq.Naquifers - 1):
+                        rsqolam = rsq / aq.lab[i]**2
+                        near = rsqolam <= self.Rconvsq
+                        rv[:,i+1,near] = scipy.special.k0(sqrt(rsqolam[near]))
+                    rv = self.coef[:,:,newaxis] * rv
+        elif self.aquiferParent.type == self.aquiferParent.semi:
+            if self.aquiferParent == aq:                # In same semi-confined aquifer
+                for i in range(aq.Naquifers):
+                    rsqolam = rsq / aq.lab[i]**2
+                    near = rsqolam <= self.Rconvsq
+                    rv[:,i,near] = scipy.special.k0(sqrt(rsqolam[near]))
+                rv = self.coef[:,:,newaxis] * rv
+        return rv
     def dischargeInfluence(self,aq,x,y):
         rvx = zeros((self.NscreenedLayers,aq.Naquifers),'d'); rvy = zeros((self.NscreenedLayers,aq.Naquifers),'d')
         if self.aquiferParent.type == self.aquiferParent.conf:
@@ -169,6 +192,29 @@ class Well(Element):
             potsum = potsum + potadd
         return potsum
 
+    def potentialCollectionArray(self,potsum,elementList,aq,x,y):
+        # Same as potentialCollection, but vectorized over the points x,y
+        for el in elementList:
+            if el.aquiferParent.type == el.aquiferParent.conf:
+                if aq.type == aq.conf:
+                    rsq = (x-el.xw)*(x-el.xw) + (y-el.yw)*(y-el.yw)
+                    rsq = maximum( rsq, el.rwsq )
+                    potsum[0,:] = potsum[0,:] + el.paramxcoef[0] * log(rsq/el.rwsq)/(4*pi)
+                    if el.aquiferParent == aq:            # Compute Bessel functions
+                        for i in range(aq.Naquifers - 1):
+                            rsqolam = rsq / aq.lab[i]**2
+                            near = rsqolam <= el.Rconvsq
+                            potsum[i+1,near] = potsum[i+1,near] + el.paramxcoef[i+1] * scipy.special.k0(sqrt(rsqolam[near]))
+            elif el.aquiferParent.type == el.aquiferParent.semi:
+                if el.aquiferParent == aq:                # In same semi-confined aquifer
+                    rsq = (x-el.xw)*(x-el.xw) + (y-el.yw)*(y-el.yw)
+                    rsq = maximum( rsq, el.rwsq )
+                    for i in range(aq.Naquifers):
+                        rsqolam = rsq / aq.lab[i]**2
+                        near = rsqolam <= el.Rconvsq
+                        potsum[i,near] = potsum[i,near] + el.paramxcoef[i] * scipy.special.k0(sqrt(rsqolam[near]))
+        return potsum
+
     def dischargeCollection(self,dissum,disadd,elementList,aq,x,y):
         # Not tested in other aquifers than the one it is screened in
         for el in elementList:
@@ -209,6 +255,42 @@ class Well(Element):
                     disadd = el.paramxcoef * disadd
             dissum = dissum + disadd
         return dissum
+
+    def dischargeCollectionArray(self,dissum,elementList,aq,x,y):
+        # Same as dischargeCollection, but vectorized over the points x,y
+        for el in elementList:
+            if el.aquiferParent.type == el.aquiferParent.conf:
+                if aq.type == aq.conf:
+                    xminxw = x-el.xw ; yminyw = y-el.yw
+                    rsq = xminxw*xminxw + yminyw*yminyw
+                    inside = rsq < el.rwsq
+                    rsq[inside] = el.rwsq
+                    xminxw[inside] = el.rw; yminyw[inside] = 0.0
+                    dissum[0,0,:] = dissum[0,0,:] - el.paramxcoef[0] / (2.0*pi) * xminxw / rsq
+                    dissum[1,0,:] = dissum[1,0,:] - el.paramxcoef[0] / (2.0*pi) * yminyw / rsq
+                    if aq == el.aquiferParent:            # Compute Bessel functions
+                        r = sqrt(rsq)
+                        for i in range(aq.Naquifers - 1):
+                            rsqolam = rsq / aq.lab[i]**2
+                            near = rsqolam <= el.Rconvsq
+                            kone = el.paramxcoef[i+1] * scipy.special.k1(sqrt(rsqolam[near])) / (r[near] * aq.lab[i])
+                            dissum[0,i+1,near] = dissum[0,i+1,near] + kone * xminxw[near]
+                            dissum[1,i+1,near] = dissum[1,i+1,near] + kone * yminyw[near]
+            elif el.aquiferParent.type == el.aquiferParent.semi:
+                if el.aquiferParent == aq:                # In same semi-confined aquifer
+                    xminxw = x-el.xw ; yminyw = y-el.yw
+                    rsq = xminxw*xminxw + yminyw*yminyw
+                    inside = rsq < el.rwsq
+                    rsq[inside] = el.rwsq
+                    xminxw[inside] = el.rw; yminyw[inside] = 0.0
+                    r = sqrt(rsq)
+                    for i in range(aq.Naquifers):
+                        rsqolam = rsq / aq.lab[i]**2
+                        near = rsqolam <= el.Rconvsq
+                        kone = el.paramxcoef[i] * scipy.special.k1(sqrt(rsqolam[near])) / (r[near] * aq.lab[i])
+                        dissum[0,i,near] = dissum[0,i,near] + kone * xminxw[near]
+                        dissum[1,i,near] = dissum[1,i,near] + kone * yminyw[near]
+        return dissum
     def totalDischargeInfluence(self,aq,pylayer,x,y):
         rv = ones(self.NscreenedLayers,'d')
         return rv    